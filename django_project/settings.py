@@ -18,6 +18,15 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.getenv("SECRET_KEY")
 PUBLIC_KEY = os.getenv("PUBLIC_KEY")
 PRIVATE_KEY = os.getenv("PRIVATE_KEY")
+# Trousseau de clés RSA (qrgenerator.security.KeyRing), indexé par key id.
+# PUBLIC_KEY/PRIVATE_KEY forment la clé "default" ; RSA_KEYS_FILE (JSON
+# {"primary": ..., "keys": {kid: {...}}}) est relu à chaud pour la rotation.
+RSA_KEYS = {
+    "default": {"public_key": PUBLIC_KEY, "private_key": PRIVATE_KEY, "status": "active"}
+}
+RSA_PRIMARY_KEY_ID = os.getenv("RSA_PRIMARY_KEY_ID", "default")
+RSA_KEYS_FILE = os.getenv("RSA_KEYS_FILE")
+RSA_KEYS_RELOAD_INTERVAL = int(os.getenv("RSA_KEYS_RELOAD_INTERVAL", 30))
 # https://docs.djangoproject.com/en/dev/ref/settings/#debug
 # SECURITY WARNING: don't run with debug turned on in production!
 # DEBUG = os.getenv("DEBUG", default=False)
@@ -60,7 +69,11 @@ INSTALLED_APPS = [
 
 # https://docs.djangoproject.com/en/dev/ref/settings/#middleware
 MIDDLEWARE = [
+    "qrgenerator.middleware.ServerTimingMiddleware",  # si QR_SERVER_TIMING
     "django.middleware.security.SecurityMiddleware",
+    "qrgenerator.middleware.MetricsMiddleware",  # si QR_METRICS
+    "qrgenerator.middleware.ProfilerMiddleware",  # si QR_PROFILE
+    "qrgenerator.middleware.ScannerAPIMiddleware",  # API des terminaux (jeton)
     "whitenoise.middleware.WhiteNoiseMiddleware",  # WhiteNoise
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -114,6 +127,9 @@ else:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            # Verrou d'écriture pris dès BEGIN : sans cela, deux validations
+            # simultanées échouent en « database is locked » au lieu d'attendre
+            "OPTIONS": {"transaction_mode": "IMMEDIATE"},
         }
     }
 # For Docker/PostgreSQL usage uncomment this and comment the DATABASES config above
@@ -180,6 +196,10 @@ STORAGES = {
     "default": {
         "BACKEND": "django.core.files.storage.FileSystemStorage",
     },
+    # Images QR : réparties par empreinte (voir migrate_qr_storage)
+    "qr_images": {
+        "BACKEND": "qrgenerator.storage.ShardedStorage",
+    },
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
@@ -194,6 +214,75 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
+# Génération des lots de codes
+# Nombre de processus pour la crypto et le rendu QR (1 = pas de pool)
+QR_GENERATION_WORKERS = int(os.getenv("QR_GENERATION_WORKERS", os.cpu_count() or 1))
+# Codes par chunk envoyé au pool (et par bulk_create)
+QR_GENERATION_CHUNK_SIZE = int(os.getenv("QR_GENERATION_CHUNK_SIZE", 250))
+# File de génération (manage.py generation_worker) : un job sans heartbeat
+# depuis QR_JOB_STALE_AFTER secondes est repris par un autre worker
+QR_JOB_STALE_AFTER = int(os.getenv("QR_JOB_STALE_AFTER", 120))
+QR_JOB_MAX_ATTEMPTS = int(os.getenv("QR_JOB_MAX_ATTEMPTS", 3))
+
+# Images QR : "stored" (PNG écrit à la génération), "pack" (PNG du lot
+# ajoutés à un seul fichier, voir PackService) ou "lazy" (rendu à la
+# demande, mis en cache LRU borné en octets dans chaque processus)
+QR_IMAGE_MODE = os.getenv("QR_IMAGE_MODE", "stored")
+QR_PACK_DIR = "qr_packs"
+QR_PACK_MAX_OPEN = 64  # packs projetés en mémoire (mmap) par processus
+QR_PACK_READ_BUFFER = 1024 * 1024  # lecture séquentielle de l'export
+QR_RENDER_CACHE_BYTES = int(os.getenv("QR_RENDER_CACHE_BYTES", 16 * 1024 * 1024))
+# Les images ne changent jamais : Cache-Control long (1 an)
+QR_IMAGE_MAX_AGE = 365 * 24 * 3600
+# Nombre maximal de scans hors ligne par synchronisation
+QR_SYNC_MAX_SCANS = int(os.getenv("QR_SYNC_MAX_SCANS", 1000))
+# Retard (secondes) des versions de bundle hors ligne sur l'horloge, pour ne
+# pas manquer une validation commitée juste après la lecture
+QR_BUNDLE_SYNC_LAG = int(os.getenv("QR_BUNDLE_SYNC_LAG", 5))
+# Décodage des photos envoyées à verify_code (voir QRDecodeService)
+QR_UPLOAD_MAX_BYTES = int(os.getenv("QR_UPLOAD_MAX_BYTES", 10 * 1024 * 1024))
+QR_UPLOAD_MAX_PIXELS = int(os.getenv("QR_UPLOAD_MAX_PIXELS", 50_000_000))
+QR_DECODE_MAX_SIDE = int(os.getenv("QR_DECODE_MAX_SIDE", 1024))
+QR_DECODE_WORKERS = int(os.getenv("QR_DECODE_WORKERS", 2))
+QR_DECODE_TIMEOUT = float(os.getenv("QR_DECODE_TIMEOUT", 3))
+# Vérification de groupe (planche de billets ou archive ZIP de captures)
+QR_DECODE_GROUP_TIMEOUT = float(os.getenv("QR_DECODE_GROUP_TIMEOUT", 20))
+QR_ARCHIVE_MAX_FILES = int(os.getenv("QR_ARCHIVE_MAX_FILES", 100))
+QR_ARCHIVE_MAX_BYTES = int(os.getenv("QR_ARCHIVE_MAX_BYTES", 50 * 1024 * 1024))
+# API des terminaux de scan : jetons mis en cache dans chaque processus
+QR_SCANNER_API_PREFIX = "/api/"
+QR_DEVICE_TOKEN_CACHE_TTL = int(os.getenv("QR_DEVICE_TOKEN_CACHE_TTL", 60))
+QR_DEVICE_TOKEN_CACHE_SIZE = 10_000
+# Flux en direct des owners (voir LiveFeed) : un sondage par processus.
+# Servi par le seul service ASGI (gate) : QR_LIVE_URL est l'adresse de
+# qrgenerator:live_feed sur ce service, même origine (ex. /qrgenerator/live/
+# routé vers gate par le proxy). Vide : pas de flux, pages statiques.
+QR_LIVE_URL = os.getenv("QR_LIVE_URL", "")
+QR_LIVE_POLL_INTERVAL = float(os.getenv("QR_LIVE_POLL_INTERVAL", 1))
+QR_LIVE_HEARTBEAT = 15
+QR_LIVE_RETRY_MS = 3000
+QR_LIVE_QUEUE_SIZE = 100
+QR_LIVE_MAX_EVENTS = 200
+# En-tête Server-Timing (base, attente de verrou) pour les tests de charge
+QR_SERVER_TIMING = os.getenv("QR_SERVER_TIMING", "False").lower() in ("true", "1", "yes")
+# Métriques Prometheus par processus (voir qrgenerator.metrics), servies sur
+# /metrics aux superutilisateurs ou au porteur de QR_METRICS_TOKEN
+QR_METRICS = os.getenv("QR_METRICS", "True").lower() in ("true", "1", "yes")
+QR_METRICS_TOKEN = os.getenv("QR_METRICS_TOKEN", "")
+# Profils cProfile d'un échantillon de requêtes (voir ProfilerMiddleware),
+# listés dans /qrgenerator/profiles/ pour les admins
+QR_PROFILE = os.getenv("QR_PROFILE", "False").lower() in ("true", "1", "yes")
+QR_PROFILE_SAMPLE_RATE = float(os.getenv("QR_PROFILE_SAMPLE_RATE", 0.01))
+# Noms de vues séparés par des virgules ("verify_code,batch_create") ; vide : toutes
+QR_PROFILE_VIEWS = [
+    view.strip()
+    for view in os.getenv("QR_PROFILE_VIEWS", "").split(",")
+    if view.strip()
+]
+QR_PROFILE_MIN_MS = float(os.getenv("QR_PROFILE_MIN_MS", 0))
+QR_PROFILE_DIR = os.getenv("QR_PROFILE_DIR", BASE_DIR / "profiles")
+QR_PROFILE_MAX_FILES = int(os.getenv("QR_PROFILE_MAX_FILES", 200))
+
 # https://docs.djangoproject.com/en/dev/ref/settings/#email-backend
 # EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
@@ -1,6 +1,8 @@
 from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
+from qrgenerator import api
+from qrgenerator.views import metrics_export
 
 urlpatterns = [
     path("J7GuncjzSMsqWhSveaYRwg/", admin.site.urls),
@@ -8,6 +10,11 @@ urlpatterns = [
     path("management/verifiers/", include("accounts.urls_verifiers")),
     path("", include("pages.urls")),
     path("qrgenerator/", include("qrgenerator.urls", namespace="qrgenerator")),
+    # Servis directement par ScannerAPIMiddleware ; routes gardées pour reverse()
+    path("api/verify", api.verify, name="api_verify"),
+    path("api/status", api.status, name="api_status"),
+    path("api/verify_image", api.verify_image, name="api_verify_image"),
+    path("metrics", metrics_export, name="metrics"),  # Prometheus
 ]
 
 if settings.DEBUG:
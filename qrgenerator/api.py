@@ -0,0 +1,161 @@
+"""API JSON des terminaux de scan, authentifiée par jeton (voir ScannerAPIMiddleware).
+
+Chaque point d'entrée existe en deux variantes : synchrone (WSGI, gunicorn)
+et async (ASGI, service "gate" sous uvicorn) ; le middleware choisit selon
+le mode dans lequel tourne la pile.
+"""
+
+import json
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from .decode_service import DecodeError, QRDecodeService
+from .redemption_service import RedemptionService
+from .token_service import DeviceTokenService
+
+
+def _error(status, message):
+    return JsonResponse({"ok": False, "error": message}, status=status)
+
+
+def _bearer(request):
+    scheme, _, raw_token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not raw_token.strip():
+        return None
+    return raw_token.strip()
+
+
+def device_owner_id(request):
+    """Owner du terminal d'après l'en-tête "Authorization: Bearer <jeton>" """
+    raw_token = _bearer(request)
+    return DeviceTokenService.owner_id(raw_token) if raw_token else None
+
+
+async def adevice_owner_id(request):
+    raw_token = _bearer(request)
+    return await DeviceTokenService.aowner_id(raw_token) if raw_token else None
+
+
+def _secure_index(request):
+    """secure_index du corps JSON, ou None s'il est mal formé"""
+    try:
+        return json.loads(request.body)["secure_index"].strip()
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def _redemption_payload(result):
+    return {"ok": result.success, "status": result.status, "code_id": result.code_id}
+
+
+def _status_payload(row):
+    if row is None:
+        return {"ok": False, "status": RedemptionService.NOT_FOUND, "code_id": None}
+    return {
+        "ok": row["status"] == "non_utilise",
+        "status": row["status"],
+        "code_id": row["id"],
+        "expires_at": row["expiration_date"].isoformat(),
+        "used_at": row["used_at"].isoformat() if row["used_at"] else None,
+    }
+
+
+@csrf_exempt
+def verify(request):
+    """POST {"secure_index": ...} -> {"ok", "status", "code_id"}"""
+    if request.method != "POST":
+        return _error(405, "POST attendu")
+    owner_id = device_owner_id(request)
+    if owner_id is None:
+        return _error(401, "Jeton invalide")
+    secure_index = _secure_index(request)
+    if not secure_index:
+        return _error(400, "Corps JSON invalide")
+    return JsonResponse(
+        _redemption_payload(RedemptionService.redeem(secure_index, owner_id))
+    )
+
+
+@csrf_exempt
+async def averify(request):
+    if request.method != "POST":
+        return _error(405, "POST attendu")
+    owner_id = await adevice_owner_id(request)
+    if owner_id is None:
+        return _error(401, "Jeton invalide")
+    secure_index = _secure_index(request)
+    if not secure_index:
+        return _error(400, "Corps JSON invalide")
+    result = await RedemptionService.aredeem(secure_index, owner_id)
+    return JsonResponse(_redemption_payload(result))
+
+
+def status(request):
+    """GET ?secure_index=... -> statut du code, sans le valider"""
+    owner_id = device_owner_id(request)
+    if owner_id is None:
+        return _error(401, "Jeton invalide")
+    secure_index = request.GET.get("secure_index", "").strip()
+    row = RedemptionService.status_query(secure_index, owner_id).first()
+    return JsonResponse(_status_payload(row))
+
+
+async def astatus(request):
+    owner_id = await adevice_owner_id(request)
+    if owner_id is None:
+        return _error(401, "Jeton invalide")
+    secure_index = request.GET.get("secure_index", "").strip()
+    row = await RedemptionService.status_query(secure_index, owner_id).afirst()
+    return JsonResponse(_status_payload(row))
+
+
+@csrf_exempt
+def verify_image(request):
+    """POST multipart qr_image -> décodage borné puis validation"""
+    if request.method != "POST":
+        return _error(405, "POST attendu")
+    owner_id = device_owner_id(request)
+    if owner_id is None:
+        return _error(401, "Jeton invalide")
+    upload = request.FILES.get("qr_image")
+    if upload is None:
+        return _error(400, "Image manquante")
+    try:
+        secure_index = QRDecodeService.decode_upload(upload)
+    except DecodeError as e:
+        return _error(400, str(e))
+    if not secure_index:
+        return _error(422, "Aucun QR code détecté")
+    return JsonResponse(
+        _redemption_payload(RedemptionService.redeem(secure_index, owner_id))
+    )
+
+
+@csrf_exempt
+async def averify_image(request):
+    if request.method != "POST":
+        return _error(405, "POST attendu")
+    owner_id = await adevice_owner_id(request)
+    if owner_id is None:
+        return _error(401, "Jeton invalide")
+    upload = request.FILES.get("qr_image")
+    if upload is None:
+        return _error(400, "Image manquante")
+    try:
+        # Le décodage tourne dans le pool borné ; la boucle reste libre
+        secure_index = await QRDecodeService.adecode_upload(upload)
+    except DecodeError as e:
+        return _error(400, str(e))
+    if not secure_index:
+        return _error(422, "Aucun QR code détecté")
+    result = await RedemptionService.aredeem(secure_index, owner_id)
+    return JsonResponse(_redemption_payload(result))
+
+
+# chemin sous QR_SCANNER_API_PREFIX -> (vue synchrone, vue async)
+ROUTES = {
+    "verify": (verify, averify),
+    "status": (status, astatus),
+    "verify_image": (verify_image, averify_image),
+}
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class QrgeneratorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'qrgenerator'
+
+    def ready(self):
+        if settings.QR_METRICS:
+            from .metrics import install_db_wrapper
+
+            connection_created.connect(install_db_wrapper)
@@ -0,0 +1,864 @@
+"""Scénarios de benchmark exécutés par `python manage.py bench`"""
+
+import base64
+import contextlib
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import qrcode
+from io import BytesIO
+from cryptography.hazmat.primitives import serialization
+from PIL import Image, ImageFilter
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .bundle_service import BundleService, OfflineBundle
+from .decode_service import QRDecodeService
+from .expiry_service import ExpiryService
+from .generation_service import BatchGenerationService
+from .live_service import LiveFeed
+from .models import Code, CodeBatch
+from .pack_service import PackService
+from .qrcode_service import QRCodeService
+from .redemption_service import RedemptionService
+from .security import KeyRing, RSAService
+from .stats_service import StatsService
+from .storage import ShardedStorage
+from .token_service import DeviceTokenService
+
+SCENARIOS = {}
+
+
+class BenchmarkError(Exception):
+    """Réponse inattendue pendant un scénario : ses mesures ne vaudraient rien"""
+
+
+def scenario(name):
+    """Enregistre un scénario sous `name`"""
+
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+
+    return register
+
+
+@contextlib.contextmanager
+def scratch_database():
+    """Base de test jetable pour toute l'exécution, détruite à la fin.
+
+    Certains scénarios doivent valider leurs données (threads de `verify`,
+    chacun sa connexion) : rien ne touche la base configurée. Sous SQLite,
+    un fichier temporaire plutôt que la base en mémoire des tests, pour des
+    mesures comparables à une base sur disque.
+    """
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    previous_name = test_settings.get("NAME")
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == "sqlite":
+            test_settings["NAME"] = os.path.join(directory, "bench.sqlite3")
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            test_settings["NAME"] = previous_name
+
+
+@contextlib.contextmanager
+def sandbox():
+    """Médias temporaires et transaction annulée : le benchmark ne laisse rien"""
+    with tempfile.TemporaryDirectory() as media_root:
+        with override_settings(MEDIA_ROOT=media_root):
+            with transaction.atomic():
+                yield
+                transaction.set_rollback(True)
+
+
+def make_batch(quantity, **kwargs):
+    """Crée un owner et un lot vides pour le benchmark"""
+    owner = get_user_model().objects.create(
+        username=f"bench-{uuid.uuid4().hex[:12]}", role="owner"
+    )
+    return CodeBatch.objects.create(
+        name="bench", quantity=quantity, created_by=owner, **kwargs
+    )
+
+
+def timed(func, *args, **kwargs):
+    """Exécute func et renvoie (résultat, durée en secondes)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _legacy_generate(batch, quantity, expiration_date):
+    """Boucle historique de batch_create : un code à la fois, INSERT + UPDATE"""
+    for _ in range(quantity):
+        message = f"{batch.id}:{uuid.uuid4()}:{timezone.now().isoformat()}"
+        code = Code(batch=batch, expiration_date=expiration_date)
+        code.generate_crypto_fields(message)
+        code.save()
+        qr_buffer = QRCodeService.generate_qr_for_code(code)
+        code.qr_image.save(
+            f"qr_{code.secure_index[:16]}.png",
+            ContentFile(qr_buffer.read()),
+            save=True,
+        )
+
+
+@scenario("generation")
+def bench_generation(quantity=200, workers=None, **options):
+    """Codes par seconde : boucle historique contre moteur parallèle"""
+    expiration_date = timezone.now() + timedelta(days=30)
+
+    with sandbox():
+        _, legacy = timed(
+            _legacy_generate, make_batch(quantity), quantity, expiration_date
+        )
+    with sandbox():
+        _, engine = timed(
+            BatchGenerationService.generate,
+            make_batch(quantity),
+            quantity,
+            expiration_date,
+            workers=workers,
+        )
+
+    return {
+        "quantity": quantity,
+        "legacy_codes_per_sec": round(quantity / legacy, 1),
+        "engine_codes_per_sec": round(quantity / engine, 1),
+        "speedup": round(legacy / engine, 2),
+    }
+
+
+def _legacy_load_private_key():
+    """Chargement historique : base64 + parsing PEM à chaque appel"""
+    key_data = base64.b64decode(settings.PRIVATE_KEY)
+    return serialization.load_pem_private_key(key_data, password=None)
+
+
+def _legacy_load_public_key():
+    key_data = base64.b64decode(settings.PUBLIC_KEY)
+    return serialization.load_pem_public_key(key_data)
+
+
+def percentiles_ms(samples, points=(50, 95, 99)):
+    """Percentiles (en ms) d'une liste de durées en secondes"""
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {
+        f"p{point}": round(ordered[min(last, len(ordered) * point // 100)] * 1000, 2)
+        for point in points
+    }
+
+
+def per_call_us(func, iterations):
+    """Coût moyen d'un appel, en microsecondes"""
+    _, elapsed = timed(lambda: [func() for _ in range(iterations)])
+    return round(elapsed / iterations * 1e6, 1)
+
+
+@scenario("keyring")
+def bench_keyring(quantity=200, **options):
+    """Coût par appel : parsing PEM à chaque appel contre trousseau en cache"""
+    ciphertext = RSAService.encrypt("bench")
+    signature = RSAService.sign(ciphertext)
+
+    results = {"iterations": quantity}
+    for name, legacy_load, cached_load in (
+        ("private_key_load", _legacy_load_private_key, KeyRing.private_key),
+        ("public_key_load", _legacy_load_public_key, KeyRing.public_key),
+    ):
+        results[f"{name}_legacy_us"] = per_call_us(legacy_load, quantity)
+        results[f"{name}_cached_us"] = per_call_us(cached_load, quantity)
+
+    # Appels complets : l'ancien coût = chargement + opération
+    for name, call, legacy_extra in (
+        ("encrypt", lambda: RSAService.encrypt("bench"), _legacy_load_public_key),
+        ("sign", lambda: RSAService.sign(ciphertext), _legacy_load_private_key),
+        (
+            "verify",
+            lambda: RSAService.verify(ciphertext, signature),
+            _legacy_load_public_key,
+        ),
+        ("decrypt", lambda: RSAService.decrypt(ciphertext), _legacy_load_private_key),
+    ):
+        results[f"{name}_legacy_us"] = per_call_us(
+            lambda: (legacy_extra(), call()), quantity
+        )
+        results[f"{name}_cached_us"] = per_call_us(call, quantity)
+
+    return results
+
+
+def _legacy_render_png(payload):
+    """Rendu historique : fabrique d'images PIL de qrcode, module par module"""
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@scenario("render")
+def bench_render(quantity=200, **options):
+    """Rendu QR : fabrique PIL de qrcode contre matrice agrandie en une passe"""
+    payloads = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(quantity)]
+    matrices = [QRCodeService.build_matrix(payload) for payload in payloads]
+
+    _, legacy = timed(lambda: [_legacy_render_png(p) for p in payloads])
+    _, matrix = timed(lambda: [QRCodeService.build_matrix(p) for p in payloads])
+    _, raster = timed(
+        lambda: [QRCodeService.matrix_to_image(m).tobytes() for m in matrices]
+    )
+    _, engine = timed(lambda: [QRCodeService.render_png(p) for p in payloads])
+
+    return {
+        "quantity": quantity,
+        "legacy_ms_per_code": round(legacy / quantity * 1000, 3),
+        "engine_ms_per_code": round(engine / quantity * 1000, 3),
+        "matrix_ms_per_code": round(matrix / quantity * 1000, 3),
+        "raster_ms_per_code": round(raster / quantity * 1000, 3),
+        "speedup": round(legacy / engine, 2),
+        "identical_png": (
+            _legacy_render_png(payloads[0]) == QRCodeService.render_png(payloads[0])
+        ),
+    }
+
+
+@scenario("bundle")
+def bench_bundle(quantity=200, **options):
+    """Bundle hors ligne : taille et temps de recherche (ex. --quantity 100000)"""
+    expiration_date = timezone.now() + timedelta(days=30)
+    indexes = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(quantity)]
+    missing = [hashlib.sha256(f"x{i}".encode()).hexdigest() for i in range(quantity)]
+
+    with sandbox():
+        batch = make_batch(quantity)
+        Code.objects.bulk_create(
+            (
+                Code(batch=batch, secure_index=index, expiration_date=expiration_date)
+                for index in indexes
+            ),
+            batch_size=2000,
+        )
+        data, build = timed(BundleService.build, batch)
+
+    bundle = OfflineBundle(data)
+    iterations = min(quantity, 10000)
+    hits = iter(indexes * 2)
+    misses = iter(missing * 2)
+    # Référence : la liste JSON qu'un terminal téléchargerait sans bundle
+    as_json = json.dumps(
+        [{"secure_index": i, "expiration": expiration_date.isoformat()} for i in indexes]
+    )
+
+    return {
+        "quantity": quantity,
+        "build_ms": round(build * 1000, 1),
+        "bundle_bytes": len(data),
+        "bytes_per_code": round(len(data) / quantity, 1),
+        "json_bytes": len(as_json),
+        "lookup_hit_us": per_call_us(lambda: bundle.expiration(next(hits)), iterations),
+        "lookup_miss_us": per_call_us(
+            lambda: bundle.expiration(next(misses)), iterations
+        ),
+        "all_found": all(bundle.expiration(i) is not None for i in indexes[:1000]),
+    }
+
+
+@scenario("expiry")
+def bench_expiry(quantity=200, **options):
+    """Balayage des codes échus : lignes par seconde (un code sur deux échu)"""
+    now = timezone.now()
+    with sandbox():
+        batch = make_batch(quantity)
+        Code.objects.bulk_create(
+            (
+                Code(
+                    batch=batch,
+                    secure_index=hashlib.sha256(str(i).encode()).hexdigest(),
+                    expiration_date=now + timedelta(days=-1 if i % 2 else 1),
+                )
+                for i in range(quantity)
+            ),
+            batch_size=2000,
+        )
+        first_pk = batch.codes.order_by("id").values_list("id", flat=True).first()
+        (expired, next_pk), elapsed = timed(ExpiryService.sweep, start_pk=first_pk)
+
+    return {
+        "quantity": quantity,
+        "expired": expired,
+        "rows_per_sec": round((next_pk - first_pk) / elapsed),
+    }
+
+
+def photo_corpus(quantity, size=(4000, 3000)):
+    """Photos JPEG synthétiques (12 Mpx) à partir des PNG de qr_codes/"""
+    sources = sorted((settings.BASE_DIR / "qr_codes").glob("*.png")) or sorted(
+        (settings.BASE_DIR / "qr_codes.bak").glob("*.png")
+    )
+    corpus = []
+    for index, path in enumerate(sources[:quantity]):
+        qr = Image.open(path).convert("L")
+        side = size[1] // 2 + (index % 5) * 150
+        qr = qr.resize((side, side), Image.Resampling.BICUBIC).rotate(
+            (index % 7) - 3, expand=True, fillcolor=255
+        )
+        photo = Image.effect_noise(size, 24).point(lambda level: 110 + level // 3)
+        photo.paste(qr, ((size[0] - qr.width) // 2, (size[1] - qr.height) // 2))
+        photo = photo.filter(ImageFilter.GaussianBlur(1.5)).convert("RGB")
+        buffer = BytesIO()
+        photo.save(buffer, format="JPEG", quality=85)
+        corpus.append(buffer.getvalue())
+    return corpus
+
+
+def _legacy_decode(data):
+    """Décodage historique : image pleine résolution, un seul essai"""
+    from pyzbar.pyzbar import decode
+
+    results = decode(Image.open(BytesIO(data)))
+    return results[0].data.decode("utf-8") if results else None
+
+
+@scenario("decode")
+def bench_decode(quantity=200, **options):
+    """Photos de 12 Mpx : préparation et décodage, historique contre pipeline"""
+    corpus = photo_corpus(min(quantity, 50))
+    count = len(corpus)
+    if not count:
+        return {"error": "aucune image dans qr_codes/ ni qr_codes.bak/"}
+
+    _, header = timed(lambda: [QRDecodeService.check_header(d) for d in corpus])
+    _, legacy_prep = timed(
+        lambda: [Image.open(BytesIO(d)).convert("L") for d in corpus]
+    )
+    _, pipeline_prep = timed(
+        lambda: [
+            QRDecodeService.prepare(d, settings.QR_DECODE_MAX_SIDE) for d in corpus
+        ]
+    )
+    results = {
+        "photos": count,
+        "photo_kb": round(sum(map(len, corpus)) / count / 1024),
+        "header_check_ms": round(header / count * 1000, 3),
+        "legacy_prepare_ms": round(legacy_prep / count * 1000, 1),
+        "pipeline_prepare_ms": round(pipeline_prep / count * 1000, 1),
+    }
+
+    try:
+        import pyzbar.pyzbar  # noqa: F401
+    except ImportError as error:
+        results["decode"] = f"non mesuré ({error})"
+        return results
+
+    legacy, legacy_time = timed(lambda: [_legacy_decode(d) for d in corpus])
+    pipeline, pipeline_time = timed(
+        lambda: [QRDecodeService.decode_image(d) for d in corpus]
+    )
+    results.update(
+        {
+            "legacy_decode_ms": round(legacy_time / count * 1000, 1),
+            "legacy_decoded": sum(map(bool, legacy)),
+            "pipeline_decode_ms": round(pipeline_time / count * 1000, 1),
+            "pipeline_decoded": sum(map(bool, pipeline)),
+            "speedup": round(legacy_time / pipeline_time, 2),
+        }
+    )
+    return results
+
+
+@scenario("api")
+@override_settings(ALLOWED_HOSTS=["*"])
+def bench_api(quantity=200, **options):
+    """Latence d'une validation : verify_code (session) contre /api/verify (jeton)"""
+    expiration_date = timezone.now() + timedelta(days=1)
+    results = {"requests": quantity}
+    with sandbox():
+        batch = make_batch(quantity * 2)
+        owner = batch.created_by
+        Code.objects.bulk_create(
+            Code(
+                batch=batch,
+                secure_index=hashlib.sha256(f"api{i}".encode()).hexdigest(),
+                expiration_date=expiration_date,
+            )
+            for i in range(quantity * 2)
+        )
+        indexes = iter(batch.codes.values_list("secure_index", flat=True))
+        verifier = get_user_model().objects.create(
+            username=f"bench-{uuid.uuid4().hex[:12]}", role="verifier", owner=owner
+        )
+        session = Client()
+        session.force_login(verifier)
+        _, raw_token = DeviceTokenService.issue(owner, "bench")
+        device = Client(headers={"authorization": f"Bearer {raw_token}"})
+
+        for name, call in (
+            (
+                "verify_code",
+                lambda: session.post(
+                    "/qrgenerator/verify_code/", {"secure_index": next(indexes)}
+                ),
+            ),
+            (
+                "api_verify",
+                lambda: device.post(
+                    "/api/verify",
+                    json.dumps({"secure_index": next(indexes)}),
+                    content_type="application/json",
+                ),
+            ),
+        ):
+            samples = []
+            for _ in range(quantity):
+                response, elapsed = timed(call)
+                if response.status_code != 200:
+                    raise BenchmarkError(f"{name} : {response.status_code}")
+                samples.append(elapsed)
+            for key, value in percentiles_ms(samples).items():
+                results[f"{name}_{key}"] = value
+    return results
+
+
+@scenario("live")
+@override_settings(QR_LIVE_POLL_INTERVAL=3600)
+def bench_live(quantity=200, **options):
+    """Coût d'un sondage du flux en direct : `quantity` owners de 5 lots surveillés"""
+    expiration_date = timezone.now() + timedelta(days=1)
+    with sandbox():
+        batches = [make_batch(10) for _ in range(quantity)]
+        batches += [
+            CodeBatch.objects.create(name="bench", quantity=10, created_by=owner)
+            for owner in (batch.created_by for batch in batches)
+            for _ in range(4)
+        ]
+        Code.objects.bulk_create(
+            Code(
+                batch=batch,
+                secure_index=hashlib.sha256(f"live{batch.pk}".encode()).hexdigest(),
+                expiration_date=expiration_date,
+            )
+            for batch in batches
+        )
+        subscriptions = [
+            LiveFeed.subscribe(batch.created_by_id) for batch in batches[:quantity]
+        ]
+        try:
+            LiveFeed.poll()
+            _, idle = timed(LiveFeed.poll)
+            # Une validation chez un owner sur dix entre deux sondages
+            for batch in batches[: quantity : 10]:
+                RedemptionService.redeem(
+                    hashlib.sha256(f"live{batch.pk}".encode()).hexdigest(),
+                    batch.created_by_id,
+                )
+            with CaptureQueriesContext(connection) as queries:
+                _, busy = timed(LiveFeed.poll)
+        finally:
+            for subscription in subscriptions:
+                LiveFeed.unsubscribe(subscription)
+            LiveFeed._counters, LiveFeed._seen, LiveFeed._since = {}, {}, None
+
+    return {
+        "owners": quantity,
+        "batches": len(batches),
+        "idle_poll_ms": round(idle * 1000, 2),
+        "busy_poll_ms": round(busy * 1000, 2),
+        "busy_poll_queries": len(queries),
+    }
+
+
+@scenario("stages")
+def bench_stages(quantity=200, **options):
+    """Coût par code de batch_create, étape par étape (un seul processus)"""
+    key_id = KeyRing.primary_key_id()
+    expiration_date = timezone.now() + timedelta(days=30)
+    qr_field = Code._meta.get_field("qr_image")
+
+    with sandbox():
+        batch = make_batch(quantity)
+        messages = BatchGenerationService._messages(batch, quantity)
+        stages = {}
+        ciphertexts, stages["encrypt"] = timed(
+            lambda: [RSAService.encrypt(message, key_id) for message in messages]
+        )
+        signatures, stages["sign"] = timed(
+            lambda: [RSAService.sign(ciphertext, key_id) for ciphertext in ciphertexts]
+        )
+        indexes, stages["hash"] = timed(
+            lambda: [hashlib.sha256(s.encode()).hexdigest() for s in signatures]
+        )
+        profile = batch.render_profile
+        matrices, stages["qr_matrix"] = timed(
+            lambda: [QRCodeService.build_matrix(i, profile) for i in indexes]
+        )
+
+        def encode_png(matrix):
+            buffer = BytesIO()
+            QRCodeService.matrix_to_image(matrix, profile.module_size).save(
+                buffer, format="PNG"
+            )
+            return buffer.getvalue()
+
+        pngs, stages["png_encode"] = timed(lambda: [encode_png(m) for m in matrices])
+        codes = [
+            Code(
+                batch=batch,
+                ciphertext=ciphertext,
+                signature=signature,
+                secure_index=secure_index,
+                key_id=key_id,
+                expiration_date=expiration_date,
+            )
+            for ciphertext, signature, secure_index in zip(
+                ciphertexts, signatures, indexes
+            )
+        ]
+
+        def write_files():
+            for code, png in zip(codes, pngs):
+                name = qr_field.generate_filename(
+                    code, f"qr_{code.secure_index[:16]}.png"
+                )
+                code.qr_image.name = qr_field.storage.save(
+                    name, ContentFile(png), max_length=qr_field.max_length
+                )
+
+        _, stages["file_write"] = timed(write_files)
+        _, stages["insert"] = timed(
+            Code.objects.bulk_create,
+            codes,
+            batch_size=settings.QR_GENERATION_CHUNK_SIZE,
+        )
+        # Référence : le moteur complet, sur un seul processus
+        _, end_to_end = timed(
+            BatchGenerationService.generate,
+            make_batch(quantity),
+            quantity,
+            expiration_date,
+            workers=1,
+        )
+
+    stages_total = sum(stages.values())
+    results = {"quantity": quantity}
+    for name, elapsed in stages.items():
+        results[f"{name}_us_per_code"] = round(elapsed / quantity * 1e6, 1)
+        results[f"{name}_share_pct"] = round(elapsed / stages_total * 100, 1)
+    results["stages_us_per_code"] = round(stages_total / quantity * 1e6, 1)
+    results["end_to_end_us_per_code"] = round(end_to_end / quantity * 1e6, 1)
+    return results
+
+
+_PLAIN_STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+@scenario("export")
+@override_settings(ALLOWED_HOSTS=["*"])
+def bench_export(quantity=200, workers=None, **options):
+    """Débit de batch_export (ZIP en flux, PNG stockés) à travers la vue"""
+    with sandbox():
+        batch = make_batch(quantity)
+        BatchGenerationService.generate(
+            batch, quantity, timezone.now() + timedelta(days=30), workers=workers
+        )
+        client = Client()
+        client.force_login(batch.created_by)
+
+        def export():
+            response = client.get(f"/qrgenerator/batches/{batch.pk}/export/")
+            return sum(len(chunk) for chunk in response.streaming_content)
+
+        size, elapsed = timed(export)
+
+    return {
+        "quantity": quantity,
+        "zip_bytes": size,
+        "export_codes_per_sec": round(quantity / elapsed, 1),
+        "export_mb_per_sec": round(size / elapsed / 1e6, 1),
+    }
+
+
+def _verify_clients(verifier, indexes, clients):
+    """Latences de verify_code avec `clients` threads, chacun sa session"""
+    work = iter(indexes)
+    lock = threading.Lock()
+
+    def client_loop():
+        session = Client()
+        session.force_login(verifier)
+        samples = []
+        try:
+            while True:
+                with lock:
+                    secure_index = next(work, None)
+                if secure_index is None:
+                    return samples
+                response, elapsed = timed(
+                    session.post,
+                    "/qrgenerator/verify_code/",
+                    {"secure_index": secure_index},
+                )
+                if not response.json()["success"]:
+                    raise BenchmarkError(f"verify_code : {response.content!r}")
+                samples.append(elapsed)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(clients) as executor:
+        start = time.perf_counter()
+        per_client = list(executor.map(lambda _: client_loop(), range(clients)))
+        elapsed = time.perf_counter() - start
+    samples = [sample for samples in per_client for sample in samples]
+    return len(samples) / elapsed, percentiles_ms(samples)
+
+
+@scenario("verify")
+@override_settings(ALLOWED_HOSTS=["*"])
+def bench_verify(quantity=200, clients=(1, 4, 16), **options):
+    """Latence de verify_code sous N clients simultanés (threads, même processus).
+
+    Les threads ouvrent leurs propres connexions : les données sont
+    validées (pas de sandbox), dans la base jetable de la commande bench,
+    puis supprimées. Pour un serveur réel, voir la commande gate_load.
+    """
+    expiration_date = timezone.now() + timedelta(days=1)
+    batch = make_batch(quantity * len(clients))
+    owner = batch.created_by
+    try:
+        verifier = get_user_model().objects.create(
+            username=f"bench-{uuid.uuid4().hex[:12]}", role="verifier", owner=owner
+        )
+        indexes = [
+            hashlib.sha256(f"verify{batch.pk}:{i}".encode()).hexdigest()
+            for i in range(quantity * len(clients))
+        ]
+        Code.objects.bulk_create(
+            (
+                Code(batch=batch, secure_index=index, expiration_date=expiration_date)
+                for index in indexes
+            ),
+            batch_size=2000,
+        )
+        results = {"requests_per_level": quantity}
+        for level, count in enumerate(clients):
+            chunk = indexes[level * quantity : (level + 1) * quantity]
+            throughput, latencies = _verify_clients(verifier, chunk, count)
+            results[f"c{count}_req_per_sec"] = round(throughput, 1)
+            for key, value in latencies.items():
+                results[f"c{count}_{key}_ms"] = value
+    finally:
+        get_user_model().objects.filter(owner=owner).delete()
+        CodeBatch.objects.filter(created_by=owner).delete()
+        owner.delete()
+    return results
+
+
+@scenario("dashboard")
+@override_settings(ALLOWED_HOSTS=["*"], STORAGES=_PLAIN_STORAGES)
+def bench_dashboard(sizes=(10_000, 100_000), **options):
+    """Coût du tableau de bord selon le nombre de codes de l'owner.
+
+    Compare la vue (compteurs dénormalisés) au comptage par statut qu'elle
+    faisait auparavant.
+    """
+    expiration_date = timezone.now() + timedelta(days=30)
+    results = {}
+    for size in sizes:
+        with sandbox():
+            batch = make_batch(size)
+            owner = batch.created_by
+            Code.objects.bulk_create(
+                (
+                    Code(
+                        batch=batch,
+                        secure_index=hashlib.sha256(f"d{i}".encode()).hexdigest(),
+                        expiration_date=expiration_date,
+                        status="utilise" if i % 3 == 0 else "non_utilise",
+                    )
+                    for i in range(size)
+                ),
+                batch_size=5000,
+            )
+            StatsService.reconcile()
+            client = Client()
+            client.force_login(owner)
+            client.get("/qrgenerator/")  # caches de gabarits
+
+            with CaptureQueriesContext(connection) as queries:
+                response, _ = timed(client.get, "/qrgenerator/")
+            if response.status_code != 200:
+                raise BenchmarkError(f"dashboard : {response.status_code}")
+            # captured_queries relit le journal : à compter avant qu'il soit vidé
+            query_count = len(queries)
+            samples = [timed(client.get, "/qrgenerator/")[1] for _ in range(20)]
+            codes = Code.objects.filter(batch__created_by=owner)
+            legacy = [
+                timed(
+                    lambda: (
+                        codes.count(),
+                        codes.filter(status="non_utilise").count(),
+                        codes.filter(status="utilise").count(),
+                    )
+                )[1]
+                for _ in range(5)
+            ]
+
+        results[f"{size}_queries"] = query_count
+        results[f"{size}_p50_ms"] = percentiles_ms(samples, (50,))["p50"]
+        results[f"{size}_legacy_count_ms"] = percentiles_ms(legacy, (50,))["p50"]
+    return results
+
+
+
+def _file_backend(storage_class, root):
+    """(écriture d'un chunk, lecture d'une image, export) pour un stockage fichier"""
+    storage = storage_class(location=root)
+
+    def write(chunk, first):
+        return [
+            storage.save(f"qr_codes_test/qr_{first + i:016x}.png", ContentFile(data))
+            for i, data in enumerate(chunk)
+        ]
+
+    def read(name):
+        with storage.open(name) as image:
+            return image.read()
+
+    def export(names):
+        for name in names:
+            read(name)
+
+    return write, read, export, lambda name: os.path.dirname(storage.path(name))
+
+
+def _pack_backend(batch_id):
+    def write(chunk, first):
+        return PackService.append(batch_id, chunk)
+
+    def read(span):
+        return PackService.read(batch_id, *span)
+
+    def export(spans):
+        with PackService.reader(batch_id) as pack:
+            for span in spans:
+                pack.read(*span)
+
+    return write, read, export, lambda span: os.path.dirname(PackService.path(batch_id))
+
+
+@scenario("storage")
+def bench_storage(quantity=200, **options):
+    """Images à plat (FileSystemStorage), réparties (ShardedStorage) ou en pack.
+
+    Écriture par chunks de génération, lecture aléatoire d'une image
+    (code_download_qr) et lecture de tout le lot dans l'ordre (batch_export).
+    Cache de pages chaud : les écarts de lecture mesurent les appels
+    système, pas le disque.
+    """
+    images = [os.urandom(1200) for _ in range(quantity)]  # taille d'un PNG de QR
+    picks = random.Random(0).sample(range(quantity), min(quantity, 1000))
+    chunk_size = settings.QR_GENERATION_CHUNK_SIZE
+    results = {"quantity": quantity}
+    for label in ("flat", "sharded", "pack"):
+        with tempfile.TemporaryDirectory() as root, override_settings(
+            MEDIA_ROOT=root
+        ):
+            if label == "pack":
+                write, read, export, directory = _pack_backend(batch_id=1)
+            else:
+                storage_class = FileSystemStorage if label == "flat" else ShardedStorage
+                write, read, export, directory = _file_backend(storage_class, root)
+
+            handles, elapsed = timed(
+                lambda: [
+                    handle
+                    for first in range(0, quantity, chunk_size)
+                    for handle in write(images[first : first + chunk_size], first)
+                ]
+            )
+            results[f"{label}_write_per_sec"] = round(quantity / elapsed)
+
+            samples = []
+            for i in picks:
+                start = time.perf_counter()
+                read(handles[i])
+                samples.append(time.perf_counter() - start)
+            # En µs : une lecture en cache prend quelques dizaines de µs
+            for point, value in percentiles_ms([t * 1000 for t in samples]).items():
+                results[f"{label}_read_{point}_us"] = value
+
+            _, elapsed = timed(export, handles)
+            results[f"{label}_export_per_sec"] = round(quantity / elapsed)
+            # Lister le répertoire d'une image (sauvegarde, rsync, ls)
+            _, elapsed = timed(os.listdir, directory(handles[picks[0]]))
+            results[f"{label}_listdir_ms"] = round(elapsed * 1000, 2)
+            PackService.close_all()
+    return results
+
+
+# Sens d'une métrique d'après son nom : +1 plus haut est mieux, -1 plus bas
+_HIGHER_IS_BETTER = ("per_sec", "speedup")
+_LOWER_IS_BETTER = ("_ms", "_us", "_us_per_code", "_bytes", "_queries")
+
+
+def metric_direction(name):
+    if any(marker in name for marker in _HIGHER_IS_BETTER):
+        return 1
+    if name.endswith(_LOWER_IS_BETTER) or name.split("_")[-1] in ("p50", "p95", "p99"):
+        return -1
+    return 0
+
+
+def compare_results(baseline, current, threshold):
+    """[(scénario, métrique, avant, après, écart relatif, régression ?)].
+
+    Seules les métriques numériques présentes des deux côtés et orientées
+    (voir metric_direction) sont comparées.
+    """
+    rows = []
+    for name, metrics in current.items():
+        for key, value in metrics.items():
+            before = baseline.get(name, {}).get(key)
+            direction = metric_direction(key)
+            if (
+                direction == 0
+                or isinstance(value, bool)
+                or not isinstance(value, (int, float))
+                or not isinstance(before, (int, float))
+                or not before
+            ):
+                continue
+            change = (value - before) / before
+            rows.append((name, key, before, value, change, change * direction < -threshold))
+    return rows
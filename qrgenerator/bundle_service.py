@@ -0,0 +1,132 @@
+import struct
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Code
+
+# En-tête : magic, version du format, lot, version du snapshot (µs), nombre de codes
+_HEADER = struct.Struct("<4sHIQI")
+# Enregistrement : 16 premiers octets de secure_index, expiration (secondes epoch)
+_RECORD = struct.Struct("<16sI")
+MAGIC = b"QROB"
+FORMAT_VERSION = 1
+PREFIX_BYTES = 16
+
+
+def version_of(moment) -> int:
+    """Version d'un snapshot : horodatage en microsecondes"""
+    return int(moment.timestamp() * 1_000_000)
+
+
+def moment_of(version: int):
+    return datetime.fromtimestamp(version / 1_000_000, tz=dt_timezone.utc)
+
+
+def index_prefix(secure_index: str):
+    """Préfixe binaire d'un secure_index (None s'il n'est pas hexadécimal)"""
+    try:
+        return bytes.fromhex(secure_index)[:PREFIX_BYTES]
+    except (TypeError, ValueError):
+        return None
+
+
+class OfflineBundle:
+    """Lecture d'un bundle hors ligne : recherche dichotomique sur le binaire brut"""
+
+    def __init__(self, data: bytes):
+        magic, fmt, self.batch_id, self.version, self.count = _HEADER.unpack_from(data)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise ValueError("Bundle hors ligne invalide")
+        if len(data) != _HEADER.size + self.count * _RECORD.size:
+            raise ValueError("Bundle hors ligne tronqué")
+        self._data = bytes(data)
+        self.used = set()  # préfixes validés depuis le snapshot (deltas)
+
+    def _prefix_at(self, position):
+        start = _HEADER.size + position * _RECORD.size
+        return self._data[start : start + PREFIX_BYTES]
+
+    def expiration(self, secure_index: str):
+        """Expiration (secondes epoch) d'un code du bundle, ou None"""
+        prefix = index_prefix(secure_index)
+        if prefix is None or len(prefix) != PREFIX_BYTES:
+            return None
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._prefix_at(middle) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._prefix_at(low) == prefix:
+            return _RECORD.unpack_from(
+                self._data, _HEADER.size + low * _RECORD.size
+            )[1]
+        return None
+
+    def is_redeemable(self, secure_index: str, now=None) -> bool:
+        """Code présent, non expiré et non validé depuis le snapshot"""
+        expiration = self.expiration(secure_index)
+        if expiration is None:
+            return False
+        now = now or timezone.now()
+        return (
+            now.timestamp() <= expiration
+            and index_prefix(secure_index) not in self.used
+        )
+
+    def apply_delta(self, delta):
+        """Applique un delta (réponse JSON de batch_bundle_delta)"""
+        for change in delta["changes"]:
+            self.used.add(index_prefix(change["secure_index"]))
+        self.version = delta["version"]
+
+
+class BundleService:
+    @staticmethod
+    def build(batch, now=None) -> bytes:
+        """Snapshot binaire des codes validables du lot, triés par préfixe"""
+        now = now or timezone.now()
+        rows = (
+            Code.objects.filter(
+                batch=batch, status="non_utilise", expiration_date__gte=now
+            )
+            .values_list("secure_index", "expiration_date")
+            .iterator(chunk_size=2000)
+        )
+        records = sorted(
+            (index_prefix(secure_index), int(expiration_date.timestamp()))
+            for secure_index, expiration_date in rows
+        )
+        # La version couvre les changements déjà visibles : on retranche le délai
+        version = version_of(now - timedelta(seconds=settings.QR_BUNDLE_SYNC_LAG))
+
+        buffer = bytearray(_HEADER.size + len(records) * _RECORD.size)
+        _HEADER.pack_into(
+            buffer, 0, MAGIC, FORMAT_VERSION, batch.id, version, len(records)
+        )
+        offset = _HEADER.size
+        for prefix, expiration in records:
+            _RECORD.pack_into(buffer, offset, prefix, expiration)
+            offset += _RECORD.size
+        return bytes(buffer)
+
+    @staticmethod
+    def delta(batch, since: int, now=None):
+        """Codes du lot devenus non validables depuis la version `since`.
+
+        La nouvelle version est en retard de QR_BUNDLE_SYNC_LAG sur l'horloge :
+        une validation dont la transaction commite tardivement est renvoyée au
+        delta suivant plutôt que perdue (l'application d'un delta est idempotente).
+        """
+        now = now or timezone.now()
+        changes = (
+            Code.objects.filter(batch=batch, status_changed_at__gt=moment_of(since))
+            .exclude(status="non_utilise")
+            .order_by("status_changed_at")
+            .values("secure_index", "status")
+        )
+        version = version_of(now - timedelta(seconds=settings.QR_BUNDLE_SYNC_LAG))
+        return {"version": max(version, since), "changes": list(changes)}
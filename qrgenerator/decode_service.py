@@ -0,0 +1,200 @@
+import asyncio
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP", "BMP", "GIF", "MPO"}
+
+
+class DecodeError(Exception):
+    """Image refusée ou illisible ; le message est destiné à l'utilisateur"""
+
+
+class QRDecodeService:
+    """Décodage borné des photos de QR envoyées à verify_code.
+
+    Les contrôles bon marché (taille, en-tête, dimensions) passent avant tout
+    décodage. Le décodage tourne dans un pool de threads borné, avec délai :
+    une photo pathologique n'immobilise pas un worker web.
+    """
+
+    _executor = None
+    _slots = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _pool(cls):
+        with cls._lock:
+            if cls._executor is None:
+                workers = settings.QR_DECODE_WORKERS
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="qr-decode"
+                )
+                # Au plus un décodage en attente par thread : au-delà, on refuse
+                cls._slots = threading.BoundedSemaphore(workers * 2)
+            return cls._executor, cls._slots
+
+    @staticmethod
+    def _zbar_decode(image):
+        """Contenus de tous les QR de l'image, sans doublon, dans l'ordre trouvé"""
+        from pyzbar.pyzbar import ZBarSymbol, decode
+
+        results = decode(image, symbols=[ZBarSymbol.QRCODE])
+        return list(dict.fromkeys(result.data.decode("utf-8") for result in results))
+
+    @staticmethod
+    def read_upload(uploaded_file) -> bytes:
+        """Contenu d'un fichier envoyé, refusé avant lecture s'il est trop gros"""
+        if uploaded_file.size > settings.QR_UPLOAD_MAX_BYTES:
+            raise DecodeError("Image trop volumineuse")
+        return uploaded_file.read()
+
+    @staticmethod
+    def check_header(data: bytes):
+        """Ouvre l'image sans la décoder (PIL ne lit que l'en-tête)"""
+        try:
+            image = Image.open(BytesIO(data))
+        except (UnidentifiedImageError, OSError):
+            raise DecodeError("Fichier image non reconnu")
+        if image.format not in ALLOWED_FORMATS:
+            raise DecodeError("Format d'image non pris en charge")
+        width, height = image.size
+        if width * height > settings.QR_UPLOAD_MAX_PIXELS:
+            raise DecodeError("Image trop grande")
+        return image
+
+    @staticmethod
+    def prepare(data: bytes, max_side: int):
+        """Niveaux de gris, plus grand côté ramené à max_side.
+
+        Pour un JPEG, draft() réduit dès la décompression (DCT à 1/2, 1/4,
+        1/8) : une photo de 12 Mpx n'est jamais décodée en pleine résolution.
+        """
+        image = Image.open(BytesIO(data))
+        image.draft("L", (max_side, max_side))
+        image = image.convert("L")
+        image.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+        return image
+
+    @staticmethod
+    def ladder(max_side):
+        """Tentatives successives : (côté maximal, binarisation)"""
+        return (
+            (max_side, False),
+            (max_side, True),
+            (max_side * 2, False),
+            (max_side // 2, True),
+        )
+
+    @classmethod
+    def decode_all(cls, data: bytes, max_side=None):
+        """Tous les QR de l'image au premier essai fructueux de l'échelle"""
+        prepared = {}
+        for side, binarize in cls.ladder(max_side or settings.QR_DECODE_MAX_SIDE):
+            image = prepared.get(side)
+            if image is None:
+                try:
+                    image = prepared[side] = cls.prepare(data, side)
+                except OSError:
+                    raise DecodeError("Image corrompue")
+            if binarize:
+                image = ImageOps.autocontrast(image, cutoff=2).point(
+                    lambda level: 255 if level > 127 else 0
+                )
+            payloads = cls._zbar_decode(image)
+            if payloads:
+                return payloads
+        return []
+
+    @classmethod
+    def decode_image(cls, data: bytes):
+        """Contenu du premier QR trouvé, ou None ; escalade seulement en cas d'échec"""
+        payloads = cls.decode_all(data)
+        return payloads[0] if payloads else None
+
+    @classmethod
+    def _submit(cls, func, *args):
+        """Soumet func au pool borné ; refuse si toutes les places sont prises"""
+        executor, slots = cls._pool()
+        if not slots.acquire(blocking=False):
+            raise DecodeError("Trop de décodages en cours, réessayez")
+        future = executor.submit(func, *args)
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    @classmethod
+    def _bounded(cls, timeout, func, *args):
+        """Exécute func dans le pool borné, avec délai"""
+        future = cls._submit(func, *args)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            raise DecodeError("Délai de décodage dépassé")
+
+    @classmethod
+    def decode_upload(cls, uploaded_file):
+        """Décode un fichier envoyé ; DecodeError si refusé, None si aucun QR"""
+        data = cls.read_upload(uploaded_file)
+        cls.check_header(data)
+        return cls._bounded(settings.QR_DECODE_TIMEOUT, cls.decode_image, data)
+
+    @classmethod
+    async def adecode_upload(cls, uploaded_file):
+        """Variante async : la boucle d'événements attend sans bloquer de thread"""
+        data = cls.read_upload(uploaded_file)
+        cls.check_header(data)
+        future = asyncio.wrap_future(cls._submit(cls.decode_image, data))
+        try:
+            return await asyncio.wait_for(future, settings.QR_DECODE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise DecodeError("Délai de décodage dépassé")
+
+    @staticmethod
+    def archive_images(data: bytes):
+        """[(nom, contenu)] des fichiers d'une archive ZIP.
+
+        Nombre de fichiers et taille décompressée annoncée sont vérifiés avant
+        toute décompression (archives piégées).
+        """
+        try:
+            archive = zipfile.ZipFile(BytesIO(data))
+        except zipfile.BadZipFile:
+            raise DecodeError("Archive ZIP invalide")
+        entries = [info for info in archive.infolist() if not info.is_dir()]
+        if len(entries) > settings.QR_ARCHIVE_MAX_FILES:
+            raise DecodeError("Trop de fichiers dans l'archive")
+        if sum(info.file_size for info in entries) > settings.QR_ARCHIVE_MAX_BYTES:
+            raise DecodeError("Archive trop volumineuse une fois décompressée")
+        return [(info.filename, archive.read(info)) for info in entries]
+
+    @classmethod
+    def _decode_group(cls, images):
+        """[(nom, [contenus] ou message d'erreur)] pour chaque image"""
+        decoded = []
+        for name, data in images:
+            try:
+                cls.check_header(data)
+                # Planche de billets : QR plus petits, on part d'une échelle double
+                decoded.append(
+                    (name, cls.decode_all(data, settings.QR_DECODE_MAX_SIDE * 2))
+                )
+            except DecodeError as error:
+                decoded.append((name, str(error)))
+        return decoded
+
+    @classmethod
+    def decode_group_upload(cls, uploaded_file):
+        """Décode tous les QR d'une image ou de chaque image d'une archive ZIP"""
+        data = cls.read_upload(uploaded_file)
+        if zipfile.is_zipfile(BytesIO(data)):
+            images = cls.archive_images(data)
+        else:
+            cls.check_header(data)
+            images = [(uploaded_file.name, data)]
+        return cls._bounded(
+            settings.QR_DECODE_GROUP_TIMEOUT, cls._decode_group, images
+        )
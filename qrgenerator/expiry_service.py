@@ -0,0 +1,60 @@
+import time
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Code
+from .stats_service import StatsService
+
+
+class ExpiryService:
+    @staticmethod
+    def sweep_chunk(low, high, now):
+        """Passe à "expire" les codes échus d'id dans [low, high).
+
+        Une transaction courte par chunk. Les UPDATE sont faits lot par lot et
+        restent conditionnels au statut : un code validé entre la lecture et
+        l'écriture n'est pas touché, et les compteurs restent exacts.
+        """
+        with transaction.atomic():
+            stale = defaultdict(list)
+            for pk, batch_id in Code.objects.filter(
+                pk__gte=low,
+                pk__lt=high,
+                status="non_utilise",
+                expiration_date__lt=now,
+            ).values_list("id", "batch_id"):
+                stale[batch_id].append(pk)
+
+            expired = 0
+            for batch_id, pks in stale.items():
+                count = Code.objects.filter(
+                    pk__in=pks, batch_id=batch_id, status="non_utilise"
+                ).update(status="expire", status_changed_at=now)
+                StatsService.transition(batch_id, "non_utilise", "expire", count)
+                expired += count
+        return expired
+
+    @staticmethod
+    def sweep(now=None, chunk_size=5000, start_pk=0, pause=0.0, on_chunk=None):
+        """Balaye la table par tranches d'id, de start_pk jusqu'au dernier code.
+
+        Reprise : relancer avec start_pk = dernier `high` signalé. Renvoie
+        (codes expirés, id suivant).
+        """
+        now = now or timezone.now()
+        last_pk = Code.objects.aggregate(last=Max("id"))["last"] or 0
+        expired = 0
+        low = start_pk
+        while low <= last_pk:
+            high = low + chunk_size
+            expired += ExpiryService.sweep_chunk(low, high, now)
+            if on_chunk:
+                on_chunk(high, expired)
+            low = high
+            if pause:
+                # Laisse respirer la base entre deux tranches
+                time.sleep(pause)
+        return expired, low
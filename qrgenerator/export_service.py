@@ -0,0 +1,103 @@
+import time
+import zipfile
+
+from .pack_service import PackService
+from .qrcode_service import QRCodeService
+
+
+class _ZipStream:
+    """Sortie non positionnable pour zipfile.
+
+    Sans tell()/seek(), zipfile écrit chaque entrée suivie d'un data
+    descriptor : l'archive peut être envoyée au fil de l'eau.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ExportService:
+    @staticmethod
+    def stream_zip(entries):
+        """Génère une archive ZIP à partir de (nom, contenu) sans la construire en mémoire.
+
+        Les entrées sont stockées sans recompression (les PNG le sont déjà) ;
+        la mémoire utilisée ne dépend que de la plus grosse entrée.
+        """
+        stream = _ZipStream()
+        date_time = time.localtime()[:6]
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as zip_file:
+            for name, data in entries:
+                info = zipfile.ZipInfo(name, date_time=date_time)
+                info.compress_type = zipfile.ZIP_STORED
+                zip_file.writestr(info, data)
+                yield stream.drain()
+        # Répertoire central, écrit à la fermeture
+        yield stream.drain()
+
+    @staticmethod
+    def batch_entries(batch, chunk_size=500):
+        """(nom, image) pour chaque code du lot et chaque format du profil"""
+        profile = batch.render_profile
+        # batch_id inclus : le related manager le lit sur chaque code pour y
+        # rattacher le lot, sinon une requête par code (refresh_from_db)
+        codes = (
+            batch.codes.order_by("id")
+            .only(
+                "id", "batch_id", "secure_index", "qr_image",
+                "pack_offset", "pack_length",
+            )
+            .iterator(chunk_size=chunk_size)
+        )
+        stored_png = QRCodeService.stores_images() and "png" in profile.formats
+
+        # Les codes d'un pack y sont rangés dans l'ordre des id : le pack est
+        # lu d'un bout à l'autre, sans ouverture par image
+        with PackService.reader(batch.id) as pack:
+            # Rendu direct par chunk : un export complet viderait le cache LRU
+            for chunk in ExportService._chunks(codes, chunk_size):
+                for fmt in profile.formats:
+                    if fmt == "png" and stored_png:
+                        images = ExportService._read_stored(chunk, pack)
+                    else:
+                        images = [
+                            QRCodeService.render(code.secure_index, fmt, profile)
+                            for code in chunk
+                        ]
+                    for code, data in zip(chunk, images):
+                        if data is not None:
+                            yield f"qr_{code.id}_{code.secure_index[:16]}.{fmt}", data
+
+    @staticmethod
+    def _read_stored(codes, pack):
+        for code in codes:
+            if code.pack_length is not None:
+                yield pack.read(code.pack_offset, code.pack_length)
+            elif not code.qr_image:
+                yield None
+            else:
+                with code.qr_image.open("rb") as qr_file:
+                    yield qr_file.read()
+
+    @staticmethod
+    def _chunks(iterable, size):
+        chunk = []
+        for item in iterable:
+            chunk.append(item)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
@@ -0,0 +1,162 @@
+import hashlib
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .pack_service import PackService
+from .qrcode_service import QRCodeService
+from .security import KeyRing, RSAService
+
+# Ce module est importé par les processus du pool avant django.setup() :
+# il ne doit pas importer les modèles au niveau module.
+
+
+def _init_worker():
+    """Initialise Django dans un processus fils (méthode de démarrage spawn)"""
+    from django.apps import apps
+
+    if not apps.ready:
+        import django
+
+        django.setup()
+
+
+def compute_crypto_fields(message: str, key_id: str):
+    """Chiffre, signe et calcule secure_index -> (ciphertext, signature, secure_index)"""
+    ciphertext = RSAService.encrypt(message, key_id)
+    signature = RSAService.sign(ciphertext, key_id)
+    secure_index = hashlib.sha256(signature.encode()).hexdigest()
+    return ciphertext, signature, secure_index
+
+
+def build_chunk(key_id, profile, messages):
+    """Travail CPU d'un chunk : crypto + rendu PNG (si profil), sans accès à la base"""
+    with metrics.timer("generation_crypto"):
+        fields = [compute_crypto_fields(message, key_id) for message in messages]
+    if profile is not None:
+        with metrics.timer("generation_render"):
+            pngs = [
+                QRCodeService.render_png(secure_index, profile)
+                for _, _, secure_index in fields
+            ]
+    else:
+        pngs = [None] * len(fields)
+    return [(*crypto, png) for crypto, png in zip(fields, pngs)]
+
+
+def _pool_chunk(key_id, profile, messages):
+    """build_chunk dans un processus du pool : renvoie aussi ses métriques"""
+    return build_chunk(key_id, profile, messages), metrics.drain()
+
+
+class BatchGenerationService:
+    @staticmethod
+    def _messages(batch, count):
+        """Messages uniques à chiffrer pour chaque code"""
+        return [
+            f"{batch.id}:{uuid.uuid4()}:{timezone.now().isoformat()}"
+            for _ in range(count)
+        ]
+
+    @staticmethod
+    def _iter_results(key_id, profile, chunks, workers):
+        """Résultats des chunks, dans l'ordre, en parallèle si possible"""
+        if workers <= 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                yield build_chunk(key_id, profile, chunk)
+            return
+
+        # spawn et non fork : le processus a des threads (serveur de métriques,
+        # sondage LiveFeed) et un fils forké pendant qu'un autre tient un
+        # verrou (_stores_lock, KeyRing._lock...) s'y bloquerait
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(chunks)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        ) as executor:
+            # map() rend les chunks dans l'ordre pendant que les suivants
+            # sont calculés : les écritures se recouvrent avec la crypto.
+            for results, samples in executor.map(
+                partial(_pool_chunk, key_id, profile), chunks
+            ):
+                metrics.merge(samples)
+                yield results
+
+    @staticmethod
+    def generate(
+        batch, quantity, expiration_date, workers=None, chunk_size=None, on_chunk=None
+    ):
+        """Génère `quantity` codes pour le lot (un INSERT par code, via bulk_create)
+
+        `on_chunk(created)` est appelé après l'insertion de chaque chunk.
+        """
+        from .models import Code
+        from .stats_service import StatsService
+
+        workers = workers or settings.QR_GENERATION_WORKERS
+        chunk_size = chunk_size or settings.QR_GENERATION_CHUNK_SIZE
+
+        messages = BatchGenerationService._messages(batch, quantity)
+        chunks = [
+            messages[i : i + chunk_size] for i in range(0, quantity, chunk_size)
+        ]
+
+        # Une seule clé pour tout le lot, même si une rotation survient pendant
+        key_id = KeyRing.primary_key_id()
+        # Seul le PNG est stocké ; en mode "lazy" ou pour un lot SVG seul,
+        # rien n'est rendu ici : l'image est rendue à la demande.
+        profile = batch.render_profile
+        if not QRCodeService.stores_images() or "png" not in profile.formats:
+            profile = None
+        qr_field = Code._meta.get_field("qr_image")
+        packed = profile is not None and settings.QR_IMAGE_MODE == "pack"
+        created = 0
+        for results in BatchGenerationService._iter_results(
+            key_id, profile, chunks, workers
+        ):
+            codes = []
+            # Construction des codes et écriture des PNG
+            with metrics.timer("generation_write"):
+                if packed:
+                    # Une seule écriture par chunk, à la fin du pack du lot
+                    pngs = [png for *_, png in results]
+                    spans = iter(PackService.append(batch.id, pngs))
+                for ciphertext, signature, secure_index, png in results:
+                    code = Code(
+                        batch=batch,
+                        ciphertext=ciphertext,
+                        signature=signature,
+                        secure_index=secure_index,
+                        key_id=key_id,
+                        expiration_date=expiration_date,
+                    )
+                    if packed:
+                        code.pack_offset, code.pack_length = next(spans)
+                    elif png is not None:
+                        # Écrit le fichier directement : le nom est posé avant
+                        # l'INSERT, ce qui évite le second UPDATE de
+                        # qr_image.save().
+                        name = qr_field.generate_filename(
+                            code, f"qr_{secure_index[:16]}.png"
+                        )
+                        code.qr_image.name = qr_field.storage.save(
+                            name, ContentFile(png), max_length=qr_field.max_length
+                        )
+                    codes.append(code)
+
+            with metrics.timer("generation_insert"), transaction.atomic():
+                Code.objects.bulk_create(codes, batch_size=chunk_size)
+                StatsService.transition(batch.id, None, "non_utilise", len(codes))
+            metrics.inc("qr_generated_codes_total", value=len(codes))
+            created += len(codes)
+            if on_chunk:
+                on_chunk(created)
+
+        return created
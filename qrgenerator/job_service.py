@@ -0,0 +1,119 @@
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .generation_service import BatchGenerationService
+from .models import CodeBatch, GenerationJob
+
+
+class JobLost(Exception):
+    """Le job a été repris par un autre worker (heartbeat trop ancien)"""
+
+
+class GenerationJobService:
+    @staticmethod
+    def worker_name():
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    def enqueue(batch):
+        """Met la génération du lot en file d'attente"""
+        return GenerationJob.objects.create(batch=batch)
+
+    @staticmethod
+    def _claimable():
+        """Jobs en attente, ou en cours mais abandonnés (worker mort)"""
+        stale = timezone.now() - timedelta(seconds=settings.QR_JOB_STALE_AFTER)
+        return Q(status="en_attente") | Q(status="en_cours", heartbeat_at__lt=stale)
+
+    @staticmethod
+    def claim(worker):
+        """Réserve le plus ancien job disponible.
+
+        La réservation est un UPDATE conditionnel : si deux workers visent le
+        même job, un seul voit une ligne modifiée. Pas besoin de SKIP LOCKED,
+        cela fonctionne aussi avec SQLite.
+        """
+        candidates = (
+            GenerationJob.objects.filter(GenerationJobService._claimable())
+            .order_by("id")
+            .values_list("id", flat=True)[:10]
+        )
+        for job_id in list(candidates):
+            now = timezone.now()
+            claimed = (
+                GenerationJob.objects.filter(GenerationJobService._claimable())
+                .filter(pk=job_id)
+                .update(
+                    status="en_cours",
+                    worker=worker,
+                    attempts=F("attempts") + 1,
+                    started_at=now,
+                    heartbeat_at=now,
+                )
+            )
+            if claimed:
+                return GenerationJob.objects.select_related("batch").get(pk=job_id)
+        return None
+
+    @staticmethod
+    def _heartbeat(job, worker, generated):
+        """Publie l'avancement ; échoue si le job a été repris ailleurs"""
+        updated = GenerationJob.objects.filter(
+            pk=job.pk, worker=worker, status="en_cours"
+        ).update(codes_generated=generated, heartbeat_at=timezone.now())
+        if not updated:
+            raise JobLost(f"Job {job.pk} repris par un autre worker")
+
+    @staticmethod
+    def run(job, worker):
+        """Génère les codes manquants du lot, chunk par chunk.
+
+        Chaque chunk est commité séparément : après un crash, le job est repris
+        et ne génère que les codes manquants.
+        """
+        batch = job.batch
+        existing = batch.codes.count()
+        remaining = batch.quantity - existing
+        expiration_date = batch.created_at + timedelta(days=batch.validity_days)
+
+        try:
+            if remaining > 0:
+                BatchGenerationService.generate(
+                    batch,
+                    remaining,
+                    expiration_date,
+                    on_chunk=lambda created: GenerationJobService._heartbeat(
+                        job, worker, existing + created
+                    ),
+                )
+        except JobLost:
+            return False
+        except Exception:
+            last_attempt = job.attempts >= settings.QR_JOB_MAX_ATTEMPTS
+            with transaction.atomic():
+                GenerationJob.objects.filter(pk=job.pk, worker=worker).update(
+                    status="erreur" if last_attempt else "en_attente",
+                    error=traceback.format_exc(),
+                    codes_generated=batch.codes.count(),
+                    finished_at=timezone.now() if last_attempt else None,
+                )
+                if last_attempt:
+                    CodeBatch.objects.filter(pk=batch.pk).update(status="erreur")
+            return False
+
+        with transaction.atomic():
+            GenerationJob.objects.filter(pk=job.pk, worker=worker).update(
+                status="termine",
+                codes_generated=batch.quantity,
+                error="",
+                finished_at=timezone.now(),
+            )
+            CodeBatch.objects.filter(pk=batch.pk).update(status="termine")
+        return True
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+
+from .models import Code, CodeBatch
+from .stats_service import COUNTER_FIELDS, StatsService
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(event):
+    """Événement {"event", "data"} au format text/event-stream"""
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+class Subscription:
+    """File d'événements d'un navigateur abonné.
+
+    La file est bornée : un abonné trop lent perd des événements, mais les
+    compteurs envoyés sont absolus et le suivant le remet à jour.
+    """
+
+    def __init__(self, owner_id, loop=None):
+        self.owner_id = owner_id
+        self.loop = loop
+        size = settings.QR_LIVE_QUEUE_SIZE
+        self.queue = asyncio.Queue(size) if loop else queue.Queue(size)
+
+    def push(self, event):
+        if self.loop is None:
+            self._offer(event)
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._offer, event)
+        except RuntimeError:
+            pass  # boucle fermée : l'abonné est en train de partir
+
+    def _offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except (queue.Full, asyncio.QueueFull):
+            pass
+
+
+class LiveFeed:
+    """Diffusion en direct des validations et compteurs aux owners (SSE).
+
+    Un seul thread par processus interroge la base pour tous les abonnés :
+    une requête sur les compteurs des lots surveillés par intervalle (plus
+    une pour le détail des validations quand un compteur a bougé), quel que
+    soit le nombre d'onglets ouverts. Ce sondage tient lieu de notification
+    entre processus : les validations faites par un autre worker y sont vues
+    comme les autres.
+    """
+
+    _subscribers = {}  # owner_id -> {Subscription}
+    _lock = threading.Lock()
+    _thread = None
+    # État du sondage, manipulé par le seul thread de sondage
+    _counters = {}  # batch_id -> compteurs déjà diffusés
+    _seen = {}  # code_id -> status_changed_at des validations déjà diffusées
+    _since = None
+
+    @classmethod
+    def subscribe(cls, owner_id, loop=None):
+        subscription = Subscription(owner_id, loop)
+        with cls._lock:
+            cls._subscribers.setdefault(owner_id, set()).add(subscription)
+            if cls._thread is None:
+                cls._thread = threading.Thread(
+                    target=cls._run, name="qr-live", daemon=True
+                )
+                cls._thread.start()
+        return subscription
+
+    @classmethod
+    def unsubscribe(cls, subscription):
+        with cls._lock:
+            subscriptions = cls._subscribers.get(subscription.owner_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                cls._subscribers.pop(subscription.owner_id, None)
+
+    @classmethod
+    def _run(cls):
+        while True:
+            time.sleep(settings.QR_LIVE_POLL_INTERVAL)
+            with cls._lock:
+                if not cls._subscribers:
+                    # Plus personne : le prochain abonné relancera le thread
+                    cls._thread = None
+                    cls._counters, cls._seen, cls._since = {}, {}, None
+                    return
+            try:
+                cls.poll()
+            except DatabaseError:
+                logger.exception("Sondage du flux en direct impossible")
+            finally:
+                close_old_connections()
+
+    @staticmethod
+    def _counter_rows(owner_ids):
+        return CodeBatch.objects.filter(created_by_id__in=owner_ids).values_list(
+            "id", "created_by_id", *COUNTER_FIELDS
+        )
+
+    @staticmethod
+    def _counter_events(rows):
+        """(événements "counters" par lot, événements "totals" par owner)"""
+        batches, totals = [], {}
+        for batch_id, owner_id, *counters in rows:
+            data = {"batch_id": batch_id, **dict(zip(COUNTER_FIELDS, counters))}
+            batches.append((owner_id, {"event": "counters", "data": data}))
+            owner_totals = totals.setdefault(
+                owner_id, {"batches": 0, **dict.fromkeys(COUNTER_FIELDS, 0)}
+            )
+            owner_totals["batches"] += 1
+            for field, value in zip(COUNTER_FIELDS, counters):
+                owner_totals[field] += value
+        return batches, {
+            owner_id: {"event": "totals", "data": data}
+            for owner_id, data in totals.items()
+        }
+
+    @staticmethod
+    def _set_actifs(totals, pending):
+        """Codes actifs du dashboard : non utilisés et pas encore échus"""
+        for owner_id, event in totals.items():
+            data = event["data"]
+            data["codes_actifs"] = data["codes_non_utilise"] - pending.get(owner_id, 0)
+
+    @classmethod
+    def snapshot(cls, owner_id):
+        """État courant d'un owner, envoyé à chaque (re)connexion"""
+        batches, totals = cls._counter_events(cls._counter_rows([owner_id]))
+        cls._set_actifs(totals, dict(StatsService.pending_expirations([owner_id])))
+        return [event for _, event in batches] + list(totals.values())
+
+    @classmethod
+    async def asnapshot(cls, owner_id):
+        rows = [row async for row in cls._counter_rows([owner_id])]
+        batches, totals = cls._counter_events(rows)
+        pending = StatsService.pending_expirations([owner_id])
+        cls._set_actifs(totals, {owner: count async for owner, count in pending})
+        return [event for _, event in batches] + list(totals.values())
+
+    @classmethod
+    def poll(cls, now=None):
+        """Diffuse les changements depuis le sondage précédent"""
+        now = now or timezone.now()
+        with cls._lock:
+            owner_ids = list(cls._subscribers)
+        if not owner_ids:
+            return
+
+        rows = list(cls._counter_rows(owner_ids))
+        batches, totals = cls._counter_events(rows)
+        counters = {row[0]: tuple(row[2:]) for row in rows}
+        utilise = COUNTER_FIELDS.index("codes_utilise")
+        events, changed_owners, redeemed = [], set(), []
+        for owner_id, event in batches:
+            batch_id = event["data"]["batch_id"]
+            previous = cls._counters.get(batch_id)
+            if previous == counters[batch_id]:
+                continue
+            events.append((owner_id, event))
+            changed_owners.add(owner_id)
+            if previous is not None and counters[batch_id][utilise] > previous[utilise]:
+                redeemed.append(batch_id)
+        if changed_owners:
+            totals = {owner_id: totals[owner_id] for owner_id in changed_owners}
+            pending = StatsService.pending_expirations(changed_owners, now)
+            cls._set_actifs(totals, dict(pending))
+            events += list(totals.items())
+        cls._counters = counters
+
+        # Les validations commitées en retard (horodatées avant le sondage
+        # précédent) sont rattrapées : la fenêtre déborde de QR_BUNDLE_SYNC_LAG
+        since = (cls._since or now) - timedelta(seconds=settings.QR_BUNDLE_SYNC_LAG)
+        cls._seen = {pk: at for pk, at in cls._seen.items() if at > since}
+        cls._since = now
+        if redeemed:
+            owners = {row[0]: row[1] for row in rows}
+            for pk, batch_id, used_at, changed_at in (
+                Code.objects.filter(
+                    batch_id__in=redeemed,
+                    status="utilise",
+                    status_changed_at__gt=since,
+                )
+                .order_by("status_changed_at")
+                .values_list("id", "batch_id", "used_at", "status_changed_at")[
+                    : settings.QR_LIVE_MAX_EVENTS
+                ]
+            ):
+                if cls._seen.get(pk) == changed_at:
+                    continue
+                cls._seen[pk] = changed_at
+                data = {
+                    "code_id": pk,
+                    "batch_id": batch_id,
+                    "used_at": used_at.isoformat() if used_at else None,
+                }
+                events.append((owners[batch_id], {"event": "redemption", "data": data}))
+
+        with cls._lock:
+            for owner_id, event in events:
+                for subscription in cls._subscribers.get(owner_id, ()):
+                    subscription.push(event)
+
+    @classmethod
+    async def astream(cls, owner_id):
+        """Flux SSE async (ASGI) : n'occupe aucun thread, sans limite de durée"""
+        subscription = cls.subscribe(owner_id, asyncio.get_running_loop())
+        try:
+            yield f"retry: {settings.QR_LIVE_RETRY_MS}\n\n"
+            for event in await cls.asnapshot(owner_id):
+                yield format_event(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(), settings.QR_LIVE_HEARTBEAT
+                    )
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield format_event(event)
+        finally:
+            cls.unsubscribe(subscription)
@@ -0,0 +1,417 @@
+"""Générateur de charge des portes de contrôle (commande gate_load).
+
+Rejoue contre un serveur déjà lancé un mélange réaliste de scans : codes
+valides, doublons (souvent simultanés, sur deux portes), codes expirés,
+codes inconnus et photos de QR. Les comptes et les codes sont créés dans la
+base du serveur puis supprimés.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import secrets
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import timedelta
+from importlib import import_module
+from typing import NamedTuple
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+from accounts.forms import VerifierCreationForm
+
+from .benchmarks import percentiles_ms
+from .models import Code, CodeBatch
+from .qrcode_service import QRCodeService
+from .redemption_service import RedemptionService
+from .token_service import DeviceTokenService
+
+SCAN_KINDS = ("valid", "duplicate", "expired", "unknown", "image")
+DEFAULT_MIX = {"valid": 70, "duplicate": 15, "expired": 5, "unknown": 5, "image": 5}
+# Verdicts attendus. Un doublon simultané peut passer avant le scan qu'il
+# répète : les deux verdicts sont admis, LevelResult vérifie qu'un code neuf
+# est accepté exactement une fois.
+EXPECTED = {
+    "valid": {RedemptionService.VALID, RedemptionService.ALREADY_USED},
+    "duplicate": {RedemptionService.ALREADY_USED, RedemptionService.VALID},
+    "expired": {RedemptionService.EXPIRED},
+    "unknown": {RedemptionService.NOT_FOUND},
+    "image": {RedemptionService.VALID},
+}
+TARGETS = ("verify_code", "api")
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+ERROR = "erreur"
+
+
+def parse_mix(text):
+    """"valid=70,duplicate=15,..." -> {type de scan: poids}"""
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in SCAN_KINDS or not weight.strip().isdigit():
+            raise ValueError(f"Élément de mélange invalide : {part!r}")
+        mix[kind] = int(weight)
+    if not any(mix.values()):
+        raise ValueError("Mélange vide")
+    return mix
+
+
+class Scan(NamedTuple):
+    kind: str
+    secure_index: str
+    image: bytes = None
+
+
+class Seed(NamedTuple):
+    owner: object
+    verifier_sessions: list  # clés de session des vérificateurs
+    raw_token: str
+    fresh: list  # secure_index non utilisés
+    expired: list
+
+
+def _session_for(user):
+    """Session authentifiée (comme après une connexion) ; renvoie sa clé"""
+    store = import_module(settings.SESSION_ENGINE).SessionStore()
+    store[SESSION_KEY] = str(user.pk)
+    store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    store.save()
+    return store.session_key
+
+
+def seed(fresh_count, expired_count, verifiers):
+    """Owner, vérificateurs (créés par VerifierCreationForm), jeton et codes"""
+    User = get_user_model()
+    tag = uuid.uuid4().hex[:10]
+    owner = User.objects.create(
+        username=f"gate-{tag}", email=f"gate-{tag}@example.com", role="owner"
+    )
+    sessions = []
+    for i in range(verifiers):
+        password = secrets.token_urlsafe(12)
+        form = VerifierCreationForm(
+            data={
+                "username": f"gate-{tag}-v{i}",
+                "email": f"gate-{tag}-v{i}@example.com",
+                "password1": password,
+                "password2": password,
+            },
+            owner=owner,
+        )
+        if not form.is_valid():
+            raise ValueError(f"Vérificateur refusé : {form.errors.as_text()}")
+        sessions.append(_session_for(form.save()))
+    _, raw_token = DeviceTokenService.issue(owner, f"gate_load {tag}")
+
+    batch = CodeBatch.objects.create(
+        name="gate_load", quantity=fresh_count + expired_count, created_by=owner
+    )
+    now = timezone.now()
+    indexes = [
+        hashlib.sha256(f"{batch.pk}:{i}".encode()).hexdigest()
+        for i in range(fresh_count + expired_count)
+    ]
+    Code.objects.bulk_create(
+        (
+            Code(
+                batch=batch,
+                secure_index=secure_index,
+                expiration_date=now
+                + (timedelta(days=1) if i < fresh_count else timedelta(days=-1)),
+            )
+            for i, secure_index in enumerate(indexes)
+        ),
+        batch_size=1000,
+    )
+    return Seed(
+        owner, sessions, raw_token, indexes[:fresh_count], indexes[fresh_count:]
+    )
+
+
+def cleanup(seed):
+    """Supprime lots, codes, jetons, vérificateurs et owner créés par seed()"""
+    Session.objects.filter(session_key__in=seed.verifier_sessions).delete()
+    CodeBatch.objects.filter(created_by=seed.owner).delete()
+    get_user_model().objects.filter(owner=seed.owner).delete()
+    seed.owner.delete()
+
+
+def fresh_needed(total, mix):
+    """Codes neufs nécessaires pour `total` scans (valides et photos)"""
+    weight = sum(mix.values())
+    return int(total * (mix.get("valid", 0) + mix.get("image", 0)) / weight) + 50
+
+
+def plan_scans(seed, total, mix, rng):
+    """Suite de scans tirés selon le mélange.
+
+    Un doublon reprend un code validé peu avant : placé juste derrière dans
+    la file, il part souvent en même temps sur une autre porte.
+    """
+    fresh = iter(seed.fresh)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=total)
+    recent, scans = [], []
+    for kind in kinds:
+        if kind == "duplicate" and not recent:
+            kind = "valid"
+        if kind in ("valid", "image"):
+            secure_index = next(fresh)
+            recent = (recent + [secure_index])[-16:]
+            image = QRCodeService.render_png(secure_index) if kind == "image" else None
+            scans.append(Scan(kind, secure_index, image))
+        elif kind == "duplicate":
+            scans.append(Scan(kind, rng.choice(recent)))
+        elif kind == "expired":
+            scans.append(Scan(kind, rng.choice(seed.expired)))
+        else:
+            scans.append(Scan(kind, hashlib.sha256(rng.randbytes(16)).hexdigest()))
+    return scans
+
+
+def _multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; '
+        f'filename="{filename}"\r\nContent-Type: image/png\r\n\r\n'
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return f"multipart/form-data; boundary={boundary}", body
+
+
+class GateClient:
+    """Client HTTP/1.1 minimal à connexion persistante (une porte simulée)"""
+
+    def __init__(self, host, port, host_header, headers):
+        self.host, self.port = host, port
+        self.host_header = host_header
+        self.headers = headers
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b"", content_type=None):
+        """(statut, en-têtes, corps) ; rouvre la connexion si le serveur l'a fermée"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        headers = {**self.headers, "Host": self.host_header}
+        headers["Content-Length"] = str(len(body))
+        if content_type:
+            headers["Content-Type"] = content_type
+        head = f"{method} {path} HTTP/1.1\r\n" + "".join(
+            f"{name}: {value}\r\n" for name, value in headers.items()
+        )
+        self.writer.write(head.encode() + b"\r\n" + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connexion fermée par le serveur")
+        response_headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        payload = await self.reader.readexactly(
+            int(response_headers.get("content-length", 0))
+        )
+        if "close" in response_headers.get("connection", "").lower():
+            await self.close()
+        return int(status_line.split()[1]), response_headers, payload
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+def _verdict(target, status, payload):
+    """Verdict (statut RedemptionService) d'une réponse, ou ERROR"""
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return ERROR
+    if target == "api":
+        return data.get("status", ERROR) if status == 200 else ERROR
+    if data.get("success"):
+        return RedemptionService.VALID
+    if "status" in data:
+        return data["status"]
+    if "code_id" not in data and "introuvable" in data.get("message", ""):
+        return RedemptionService.NOT_FOUND
+    return ERROR
+
+
+def _server_timing(header, metric):
+    for part in header.split(","):
+        name, _, duration = part.strip().partition(";dur=")
+        if name == metric:
+            return float(duration) / 1000
+    return None
+
+
+def _request_for(target, scan):
+    """(méthode, chemin, corps, type de contenu) d'un scan"""
+    if target == "api":
+        if scan.image:
+            content_type, body = _multipart("qr_image", "scan.png", scan.image)
+            return ("POST", "/api/verify_image", body, content_type)
+        body = json.dumps({"secure_index": scan.secure_index}).encode()
+        return ("POST", "/api/verify", body, "application/json")
+    if scan.image:
+        content_type, body = _multipart("qr_image", "scan.png", scan.image)
+        return ("POST", "/qrgenerator/verify_code/", body, content_type)
+    body = urlencode({"secure_index": scan.secure_index}).encode()
+    return (
+        "POST",
+        "/qrgenerator/verify_code/",
+        body,
+        "application/x-www-form-urlencoded",
+    )
+
+
+class LevelResult:
+    """Mesures d'un palier de concurrence"""
+
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.elapsed = 0.0
+        self.latencies = defaultdict(list)  # cible -> durées (s)
+        self.lock_waits = []
+        self.verdicts = defaultdict(Counter)  # type de scan -> verdicts
+        self.valid_by_code = Counter()
+        self.fresh_scanned = set()  # codes neufs ayant reçu un verdict
+
+    @property
+    def samples(self):
+        return [sample for samples in self.latencies.values() for sample in samples]
+
+    @property
+    def double_redemptions(self):
+        """Codes acceptés plus d'une fois : doit toujours valoir 0"""
+        return sum(1 for count in self.valid_by_code.values() if count > 1)
+
+    @property
+    def never_accepted(self):
+        """Codes neufs scannés mais jamais acceptés : doit valoir 0"""
+        return sum(1 for code in self.fresh_scanned if not self.valid_by_code[code])
+
+    @property
+    def unexpected(self):
+        return sum(
+            count
+            for kind, verdicts in self.verdicts.items()
+            for verdict, count in verdicts.items()
+            if verdict not in EXPECTED[kind]
+        )
+
+    def histogram(self):
+        """[(borne haute en ms ou None, nombre de requêtes)]"""
+        counts = Counter()
+        for sample in self.samples:
+            ms = sample * 1000
+            counts[next((b for b in HISTOGRAM_BOUNDS_MS if ms <= b), None)] += 1
+        return [(bound, counts[bound]) for bound in (*HISTOGRAM_BOUNDS_MS, None)]
+
+    def summary(self):
+        samples = self.samples
+        summary = {
+            "concurrency": self.concurrency,
+            "requests": len(samples),
+            "throughput": round(len(samples) / self.elapsed, 1),
+            **{f"{k}_ms": v for k, v in percentiles_ms(samples).items()},
+            "double_redemptions": self.double_redemptions,
+            "never_accepted": self.never_accepted,
+            "unexpected_verdicts": self.unexpected,
+            "verdicts": {kind: dict(v) for kind, v in self.verdicts.items()},
+            "histogram_ms": {
+                str(bound or "inf"): count for bound, count in self.histogram()
+            },
+        }
+        for target, target_samples in self.latencies.items():
+            for key, value in percentiles_ms(target_samples).items():
+                summary[f"{target}_{key}_ms"] = value
+        if self.lock_waits:
+            summary["lock_wait_total_s"] = round(sum(self.lock_waits), 3)
+            summary["lock_wait_mean_ms"] = round(
+                sum(self.lock_waits) / len(self.lock_waits) * 1000, 2
+            )
+            summary["lock_wait_p99_ms"] = percentiles_ms(self.lock_waits, (99,))["p99"]
+        return summary
+
+
+async def run_level(url, host_header, seed, scans, concurrency, targets):
+    """Rejoue `scans` avec `concurrency` portes ; les portes alternent les cibles"""
+    result = LevelResult(concurrency)
+    pending = iter(scans)
+    csrf_token = secrets.token_hex(16)
+
+    async def gate(number):
+        target = targets[number % len(targets)]
+        if target == "api":
+            headers = {"Authorization": f"Bearer {seed.raw_token}"}
+        else:
+            session = seed.verifier_sessions[number % len(seed.verifier_sessions)]
+            headers = {
+                "Cookie": f"{settings.SESSION_COOKIE_NAME}={session}; "
+                f"{settings.CSRF_COOKIE_NAME}={csrf_token}",
+                "X-CSRFToken": csrf_token,
+            }
+        client = GateClient(url.hostname, url.port or 80, host_header, headers)
+        try:
+            for scan in pending:
+                start = time.perf_counter()
+                try:
+                    status, headers, payload = await client.request(
+                        *_request_for(target, scan)
+                    )
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    await client.close()
+                    result.verdicts[scan.kind][ERROR] += 1
+                    continue
+                result.latencies[target].append(time.perf_counter() - start)
+                verdict = _verdict(target, status, payload)
+                result.verdicts[scan.kind][verdict] += 1
+                if verdict == RedemptionService.VALID:
+                    result.valid_by_code[scan.secure_index] += 1
+                if scan.kind in ("valid", "image") and verdict != ERROR:
+                    result.fresh_scanned.add(scan.secure_index)
+                lock_wait = _server_timing(headers.get("server-timing", ""), "lock")
+                if lock_wait is not None:
+                    result.lock_waits.append(lock_wait)
+        finally:
+            await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(gate(number) for number in range(concurrency)))
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def run(url, host_header, levels, per_level, mix, targets, verifiers, rng_seed=0):
+    """Exécute chaque palier ; renvoie la liste des LevelResult"""
+    rng = random.Random(rng_seed)
+    total = per_level * len(levels)
+    data = seed(fresh_needed(total, mix), max(50, total // 20), verifiers)
+    try:
+        scans = plan_scans(data, total, mix, rng)
+        return [
+            asyncio.run(
+                run_level(
+                    url,
+                    host_header,
+                    data,
+                    scans[i * per_level : (i + 1) * per_level],
+                    concurrency,
+                    targets,
+                )
+            )
+            for i, concurrency in enumerate(levels)
+        ]
+    finally:
+        cleanup(data)
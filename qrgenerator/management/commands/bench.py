@@ -0,0 +1,155 @@
+import json
+import platform
+import statistics
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from qrgenerator.benchmarks import (
+    SCENARIOS,
+    BenchmarkError,
+    compare_results,
+    scratch_database,
+)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Exécute les scénarios de benchmark (base et médias jetables)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenarios",
+            nargs="*",
+            help=f"Scénarios à exécuter (défaut : tous) : {', '.join(SCENARIOS)}",
+        )
+        parser.add_argument("--quantity", type=int, default=200)
+        parser.add_argument(
+            "--workers", type=int, default=None, help="Processus du pool"
+        )
+        parser.add_argument(
+            "--clients",
+            type=int,
+            nargs="+",
+            default=[1, 4, 16],
+            help="Clients simultanés (scénario verify)",
+        )
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[10_000, 100_000],
+            help="Nombres de codes de l'owner (scénario dashboard ; "
+            "--sizes 10000 100000 1000000 pour le million)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=1,
+            help="Exécutions par scénario ; chaque métrique garde la médiane",
+        )
+        parser.add_argument("--json", help="Écrit les résultats dans ce fichier")
+        parser.add_argument(
+            "--compare", help="Compare aux résultats JSON d'une exécution précédente"
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.10,
+            help="Écart relatif au-delà duquel une dégradation est signalée",
+        )
+
+    def handle(self, *args, **options):
+        names = options.pop("scenarios") or list(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Scénario inconnu : {', '.join(unknown)}")
+        json_path = options.pop("json")
+        compare_path = options.pop("compare")
+        threshold = options.pop("threshold")
+        repeat = options.pop("repeat")
+        baseline = None
+        if compare_path:
+            with open(compare_path) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        if settings.DEBUG:
+            self.stderr.write(
+                "DEBUG actif : debug_toolbar et le journal des requêtes faussent "
+                "les mesures des vues"
+            )
+
+        results = {}
+        try:
+            with scratch_database():
+                for name in names:
+                    self.stdout.write(f"▶ {name}")
+                    runs = [SCENARIOS[name](**options) for _ in range(repeat)]
+                    results[name] = self._median(runs)
+                    for key, value in results[name].items():
+                        self.stdout.write(f"  {key}: {value}")
+        except BenchmarkError as error:
+            raise CommandError(f"Scénario {name} interrompu : {error}")
+
+        if json_path:
+            with open(json_path, "w") as output:
+                json.dump(
+                    {
+                        "commit": _git_commit(),
+                        "date": timezone.now().isoformat(),
+                        "python": platform.python_version(),
+                        "django": django.get_version(),
+                        "database": connection.vendor,
+                        "debug": settings.DEBUG,
+                        "repeat": repeat,
+                        "options": {
+                            key: options[key]
+                            for key in ("quantity", "workers", "clients", "sizes")
+                        },
+                        "results": results,
+                    },
+                    output,
+                    indent=2,
+                )
+            self.stdout.write(f"Résultats écrits dans {json_path}")
+
+        if baseline is not None:
+            self._compare(baseline, results, threshold)
+
+    @staticmethod
+    def _median(runs):
+        """Médiane de chaque métrique numérique ; les autres valeurs du dernier run"""
+        merged = dict(runs[-1])
+        for key, value in merged.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[key] = statistics.median(run[key] for run in runs)
+        return merged
+
+    def _compare(self, baseline, results, threshold):
+        self.stdout.write(
+            f"Comparaison avec {baseline.get('commit') or 'la référence'} "
+            f"(seuil {threshold:.0%})"
+        )
+        rows = compare_results(baseline.get("results", {}), results, threshold)
+        for name, key, before, after, change, regression in rows:
+            line = f"  {name}.{key}: {before} -> {after} ({change:+.1%})"
+            self.stdout.write(self.style.ERROR(line) if regression else line)
+        regressions = sum(row[-1] for row in rows)
+        if regressions:
+            raise CommandError(f"{regressions} régression(s) au-delà du seuil")
+        self.stdout.write(self.style.SUCCESS("Aucune régression"))
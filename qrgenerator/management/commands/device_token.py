@@ -0,0 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from qrgenerator.models import DeviceToken
+from qrgenerator.token_service import DeviceTokenService
+
+
+class Command(BaseCommand):
+    help = "Gère les jetons des terminaux de scan (API /api/verify)"
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest="action", required=True)
+        create = subcommands.add_parser("create", help="Crée un jeton")
+        create.add_argument("--owner", required=True, help="Nom d'utilisateur de l'owner")
+        create.add_argument("--name", required=True, help="Nom du terminal")
+        revoke = subcommands.add_parser("revoke", help="Révoque un jeton")
+        revoke.add_argument("prefix", help="Début du jeton")
+        subcommands.add_parser("list", help="Liste les jetons actifs")
+
+    def handle(self, *args, **options):
+        if options["action"] == "create":
+            try:
+                owner = get_user_model().objects.get(username=options["owner"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Utilisateur inconnu : {options['owner']}")
+            token, raw_token = DeviceTokenService.issue(owner, options["name"])
+            self.stdout.write(f"Jeton de « {token.name} » (affiché une seule fois) :")
+            self.stdout.write(raw_token)
+        elif options["action"] == "revoke":
+            tokens = DeviceToken.objects.filter(
+                prefix=options["prefix"], revoked_at=None
+            )
+            if not tokens:
+                raise CommandError("Aucun jeton actif avec ce préfixe")
+            for token in tokens:
+                DeviceTokenService.revoke(token)
+                self.stdout.write(f"Révoqué : {token}")
+        else:
+            for token in DeviceToken.objects.filter(revoked_at=None).select_related(
+                "owner"
+            ):
+                self.stdout.write(f"{token.prefix}  {token.name}  ({token.owner})")
@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from qrgenerator.expiry_service import ExpiryService
+
+
+class Command(BaseCommand):
+    help = "Passe à « expire » les codes échus, par tranches d'id (reprise possible)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument(
+            "--start-pk",
+            type=int,
+            default=0,
+            help="Reprend le balayage à partir de cet id",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Secondes de pause entre deux tranches",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=None,
+            help="Relance le balayage toutes les N secondes (défaut : une fois)",
+        )
+
+    def handle(self, *args, **options):
+        start_pk = options["start_pk"]
+        while True:
+            close_old_connections()
+            started = time.perf_counter()
+            last_report = [started]
+
+            def report(next_pk, expired):
+                now = time.perf_counter()
+                if now - last_report[0] >= 5:
+                    last_report[0] = now
+                    self.stdout.write(
+                        f"  id < {next_pk} : {expired} expiré(s), "
+                        f"{(next_pk - start_pk) / (now - started):.0f} lignes/s"
+                    )
+
+            expired, next_pk = ExpiryService.sweep(
+                chunk_size=options["chunk_size"],
+                start_pk=start_pk,
+                pause=options["pause"],
+                on_chunk=report,
+            )
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{expired} code(s) expiré(s), {next_pk - start_pk} id balayés "
+                    f"en {elapsed:.1f} s "
+                    f"({(next_pk - start_pk) / elapsed if elapsed else 0:.0f} lignes/s)"
+                )
+            )
+
+            if options["interval"] is None:
+                return
+            start_pk = 0
+            time.sleep(options["interval"])
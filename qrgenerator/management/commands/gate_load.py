@@ -0,0 +1,112 @@
+import json
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from qrgenerator import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        "Charge un serveur déjà lancé (runserver, gunicorn, uvicorn) de scans "
+        "simultanés ; même base que le serveur. Lancer le serveur avec "
+        "QR_SERVER_TIMING=1 pour mesurer l'attente de verrou."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument(
+            "--host",
+            help="En-tête Host envoyé (un hôte de ALLOWED_HOSTS si DEBUG est faux)",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            nargs="+",
+            default=[1, 8, 32, 128],
+            help="Portes simultanées (un palier par valeur)",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=1000, help="Scans par palier"
+        )
+        parser.add_argument(
+            "--target",
+            nargs="+",
+            choices=loadtest.TARGETS,
+            default=["verify_code", "api"],
+            help="Points d'entrée ; les portes se les répartissent",
+        )
+        parser.add_argument(
+            "--mix",
+            default=",".join(f"{k}={v}" for k, v in loadtest.DEFAULT_MIX.items()),
+            help="Poids des types de scan : " + ", ".join(loadtest.SCAN_KINDS),
+        )
+        parser.add_argument(
+            "--verifiers", type=int, default=4, help="Comptes vérificateurs créés"
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Graine du tirage")
+        parser.add_argument("--json", help="Écrit les résultats dans ce fichier")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+        if url.scheme != "http" or not url.hostname:
+            raise CommandError("--url doit être de la forme http://hôte:port")
+        try:
+            mix = loadtest.parse_mix(options["mix"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        results = loadtest.run(
+            url,
+            options["host"] or url.netloc,
+            options["concurrency"],
+            options["requests"],
+            mix,
+            options["target"],
+            options["verifiers"],
+            options["seed"],
+        )
+        summaries = [result.summary() for result in results]
+        for result, summary in zip(results, summaries):
+            self._report(result, summary)
+        if options["json"]:
+            with open(options["json"], "w") as output:
+                json.dump({"mix": mix, "levels": summaries}, output, indent=2)
+        if any(
+            summary["double_redemptions"] or summary["never_accepted"]
+            for summary in summaries
+        ):
+            raise CommandError("Validation incohérente détectée")
+
+    def _report(self, result, summary):
+        self.stdout.write(
+            f"▶ {summary['concurrency']} portes : {summary['requests']} scans, "
+            f"{summary['throughput']} scans/s, p50 {summary['p50_ms']} ms, "
+            f"p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms"
+        )
+        for target in result.latencies:
+            self.stdout.write(
+                f"  {target} : p50 {summary[f'{target}_p50_ms']} ms, "
+                f"p99 {summary[f'{target}_p99_ms']} ms"
+            )
+        if "lock_wait_total_s" in summary:
+            self.stdout.write(
+                f"  attente de verrou : {summary['lock_wait_total_s']} s au total, "
+                f"{summary['lock_wait_mean_ms']} ms en moyenne, "
+                f"p99 {summary['lock_wait_p99_ms']} ms"
+            )
+        else:
+            self.stdout.write("  attente de verrou : non mesurée (QR_SERVER_TIMING)")
+        for kind, verdicts in summary["verdicts"].items():
+            detail = ", ".join(f"{v} {n}" for v, n in sorted(verdicts.items()))
+            self.stdout.write(f"  {kind:<9} {detail}")
+        self.stdout.write(
+            f"  doubles validations : {summary['double_redemptions']}, "
+            f"codes neufs jamais acceptés : {summary['never_accepted']}, "
+            f"verdicts inattendus : {summary['unexpected_verdicts']}"
+        )
+        peak = max(count for _, count in result.histogram()) or 1
+        for bound, count in result.histogram():
+            label = f"≤ {bound} ms" if bound else "> 5000 ms"
+            bar = "█" * round(count / peak * 40)
+            self.stdout.write(f"  {label:>10} {count:>6} {bar}")
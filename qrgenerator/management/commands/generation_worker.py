@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from qrgenerator import metrics
+from qrgenerator.job_service import GenerationJobService
+
+
+class Command(BaseCommand):
+    help = "Worker de génération des lots (file d'attente en base, sans broker)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Traite les jobs en attente puis s'arrête",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Secondes entre deux interrogations de la file",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            help="Sert les métriques Prometheus du worker sur ce port",
+        )
+
+    def handle(self, *args, **options):
+        worker = GenerationJobService.worker_name()
+        self.stdout.write(f"Worker {worker} démarré")
+        if options["metrics_port"]:
+            metrics.serve(options["metrics_port"])
+
+        while True:
+            close_old_connections()
+            job = GenerationJobService.claim(worker)
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["poll_interval"])
+                continue
+
+            self.stdout.write(f"Lot {job.batch_id} : génération (tentative {job.attempts})")
+            if GenerationJobService.run(job, worker):
+                self.stdout.write(self.style.SUCCESS(f"Lot {job.batch_id} : terminé"))
+            else:
+                self.stdout.write(self.style.ERROR(f"Lot {job.batch_id} : échec"))
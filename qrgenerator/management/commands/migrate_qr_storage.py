@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from qrgenerator.storage import ShardedStorage
+from qrgenerator.storage_service import StorageMigrationService
+
+
+class Command(BaseCommand):
+    help = (
+        "Range les images QR existantes par empreinte (ShardedStorage), par "
+        "tranches d'id (reprise possible)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--start-pk",
+            type=int,
+            default=0,
+            help="Reprend la migration à partir de cet id",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Secondes de pause entre deux tranches",
+        )
+
+    def handle(self, *args, **options):
+        if not isinstance(StorageMigrationService.storage(), ShardedStorage):
+            raise CommandError(
+                'Le stockage "qr_images" de STORAGES doit être ShardedStorage'
+            )
+        start_pk = options["start_pk"]
+        started = time.perf_counter()
+        last_report = [started]
+
+        def report(next_pk, totals):
+            now = time.perf_counter()
+            if now - last_report[0] >= 5:
+                last_report[0] = now
+                self.stdout.write(
+                    f"  id < {next_pk} : {totals['moved']} déplacé(s), "
+                    f"{totals['deduplicated']} dédupliqué(s), "
+                    f"{totals['missing']} introuvable(s)"
+                )
+
+        totals, next_pk = StorageMigrationService.migrate(
+            chunk_size=options["chunk_size"],
+            start_pk=start_pk,
+            pause=options["pause"],
+            on_chunk=report,
+        )
+        elapsed = time.perf_counter() - started
+        files = totals["moved"] + totals["deduplicated"]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{totals['moved']} image(s) déplacée(s), "
+                f"{totals['deduplicated']} dédupliquée(s), "
+                f"{totals['missing']} introuvable(s), jusqu'à l'id {next_pk} "
+                f"en {elapsed:.1f} s ({files / elapsed if elapsed else 0:.0f} fichiers/s)"
+            )
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from qrgenerator.stats_service import StatsService
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs de codes (lots et owners) et corrige les dérives"
+
+    def handle(self, *args, **options):
+        batches, owners = StatsService.reconcile()
+        self.stdout.write(
+            self.style.SUCCESS(f"{batches} lot(s) et {owners} owner(s) corrigé(s)")
+        )
@@ -0,0 +1,297 @@
+"""Métriques du processus (compteurs et histogrammes), au format Prometheus.
+
+Chaque thread agrège dans son propre dictionnaire : les incréments du chemin
+chaud ne prennent aucun verrou. Le verrou ne sert qu'à enregistrer le
+dictionnaire d'un nouveau thread, et à le verser dans un total commun quand
+le thread se termine (serveurs à un thread par requête : le nombre de
+dictionnaires reste celui des threads vivants). L'export additionne des
+copies de ces dictionnaires et du total. Les chiffres sont ceux du processus :
+chaque worker gunicorn/uvicorn expose les siens (étiquette "pid") et le
+worker de génération les sert sur son propre port (--metrics-port).
+"""
+
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+
+# Secondes
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+STAGE_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1, 2.5, 5, 10, 30,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric(NamedTuple):
+    kind: str  # "counter" ou "histogram"
+    help: str
+    labels: tuple
+    buckets: tuple = ()
+
+
+METRICS = {
+    "qr_http_requests_total": Metric(
+        "counter", "Requêtes HTTP servies", ("view", "method", "status")
+    ),
+    "qr_http_request_duration_seconds": Metric(
+        "histogram",
+        "Durée des requêtes jusqu'à la réponse (hors corps en streaming)",
+        ("view",),
+        LATENCY_BUCKETS,
+    ),
+    "qr_db_queries_total": Metric("counter", "Requêtes SQL par vue", ("view",)),
+    "qr_db_query_seconds_total": Metric(
+        "counter", "Temps passé en base par vue", ("view",)
+    ),
+    "qr_db_queries_per_request": Metric(
+        "histogram", "Requêtes SQL par requête HTTP", ("view",), QUERY_BUCKETS
+    ),
+    "qr_redemptions_total": Metric(
+        "counter", "Validations unitaires par résultat", ("view", "outcome")
+    ),
+    "qr_cache_requests_total": Metric(
+        "counter", "Consultations des caches en mémoire", ("cache", "result")
+    ),
+    "qr_stage_duration_seconds": Metric(
+        "histogram",
+        "Durée des étapes de génération et de rendu",
+        ("stage",),
+        STAGE_BUCKETS,
+    ),
+    "qr_generated_codes_total": Metric("counter", "Codes générés", ()),
+}
+
+_local = threading.local()
+_stores = {}  # id -> dictionnaire (nom, étiquettes) -> valeur, un par thread vivant
+_retired = {}  # valeurs des threads terminés
+# Réentrant : _retire() peut être appelé par le ramasse-miettes à tout moment
+_stores_lock = threading.RLock()
+
+
+class _Owner:
+    """Attribut de thread local : sa disparition signale la fin du thread"""
+
+    __slots__ = ("__weakref__",)
+
+
+def _add(target, key, value):
+    current = target.get(key)
+    if isinstance(value, list):
+        if current is None:
+            target[key] = list(value)
+        else:
+            for i, cell in enumerate(value):
+                current[i] += cell
+    else:
+        target[key] = (current or 0) + value
+
+
+def _retire(store):
+    with _stores_lock:
+        _stores.pop(id(store), None)
+        for key, value in store.items():
+            _add(_retired, key, value)
+
+
+def _store():
+    try:
+        return _local.store
+    except AttributeError:
+        store = _local.store = {}
+        _local.owner = _Owner()
+        weakref.finalize(_local.owner, _retire, store)
+        with _stores_lock:
+            _stores[id(store)] = store
+        return store
+
+
+def inc(name, labels=(), value=1):
+    """Incrémente un compteur ; `labels` suit l'ordre de METRICS[name].labels"""
+    store = _store()
+    key = (name, labels)
+    store[key] = store.get(key, 0) + value
+
+
+def observe(name, value, labels=()):
+    """Ajoute une observation à un histogramme"""
+    store = _store()
+    key = (name, labels)
+    cells = store.get(key)
+    buckets = METRICS[name].buckets
+    if cells is None:
+        # Une case par borne, une pour +Inf, puis la somme
+        cells = store[key] = [0] * (len(buckets) + 2)
+    cells[bisect_left(buckets, value)] += 1
+    cells[-1] += value
+
+
+class timer:
+    """Chronomètre une étape : `with metrics.timer("qr_matrix"): ...`"""
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(
+            "qr_stage_duration_seconds",
+            time.perf_counter() - self.start,
+            (self.stage,),
+        )
+
+
+def collect():
+    """Somme des valeurs de tous les threads : {(nom, étiquettes): valeur}"""
+    with _stores_lock:
+        stores = list(_stores.values())
+        totals = {}
+        for key, value in _retired.items():
+            _add(totals, key, value)
+    for store in stores:
+        # copy() est atomique sous le GIL : pas besoin de bloquer le thread
+        for key, value in store.copy().items():
+            _add(totals, key, value)
+    return totals
+
+
+def merge(samples):
+    """Ajoute des valeurs collect()-ées ailleurs (processus du pool de génération)"""
+    store = _store()
+    for key, value in samples.items():
+        _add(store, key, value)
+
+
+def drain():
+    """collect() puis remise à zéro, pour renvoyer ses métriques au parent"""
+    samples = collect()
+    reset()
+    return samples
+
+
+def reset():
+    with _stores_lock:
+        for store in _stores.values():
+            store.clear()
+        _retired.clear()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Texte d'exposition Prometheus (version 0.0.4)"""
+    totals = collect()
+    series = {}
+    for (name, labels), value in totals.items():
+        series.setdefault(name, []).append((labels, value))
+    pid = (("pid", os.getpid()),)
+    lines = []
+    for name, metric in METRICS.items():
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for labels, value in sorted(series.get(name, ())):
+            tags = _labels(metric.labels, labels, pid)
+            if metric.kind == "counter":
+                lines.append(f"{name}{tags} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip((*metric.buckets, "+Inf"), value[:-1]):
+                cumulative += count
+                le = pid + (("le", bound if bound == "+Inf" else _number(bound)),)
+                lines.append(
+                    f"{name}_bucket{_labels(metric.labels, labels, le)} {cumulative}"
+                )
+            lines.append(f"{name}_sum{tags} {_number(value[-1])}")
+            lines.append(f"{name}_count{tags} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    """Mesures d'une requête HTTP en cours (voir MetricsMiddleware)"""
+
+    __slots__ = ("queries", "db_seconds", "outcomes")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.outcomes = Counter()
+
+
+# Copiée par sync_to_async : suit la requête jusque dans le thread de l'ORM
+current_request = ContextVar("qr_metrics_request", default=None)
+
+
+def record_outcome(outcome):
+    """Résultat d'une validation, rattaché à la vue en cours s'il y en a une"""
+    stats = current_request.get()
+    if stats is None:
+        inc("qr_redemptions_total", ("", outcome))
+    else:
+        stats.outcomes[outcome] += 1
+
+
+def db_wrapper(execute, sql, params, many, context):
+    """execute_wrapper permanent : requêtes et temps en base de la requête HTTP"""
+    stats = current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - start
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """Récepteur de connection_created"""
+    if db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_wrapper)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, host="0.0.0.0"):
+    """Sert render() dans un thread (processus sans serveur HTTP : worker)"""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(
+        target=server.serve_forever, name="qr-metrics", daemon=True
+    ).start()
+    return server
@@ -0,0 +1,225 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.urls import Resolver404, resolve
+
+from . import api, metrics
+from .profile_service import ProfileService
+
+
+def _api_views():
+    """Chemin de l'API des terminaux -> nom de vue (pas de résolution d'URL)"""
+    prefix = settings.QR_SCANNER_API_PREFIX
+    return {prefix + path: f"api_{path}" for path in api.ROUTES}
+
+
+class MetricsMiddleware:
+    """Latence, statut et requêtes SQL de chaque requête, par vue (voir metrics).
+
+    Placé avant ScannerAPIMiddleware pour mesurer aussi l'API des terminaux,
+    qui court-circuite la résolution d'URL. Pour une réponse en streaming,
+    la durée s'arrête à la remise de la réponse, pas à la fin du corps.
+    """
+
+    sync_capable = True
+    async_capable = True
+    METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+
+    def __init__(self, get_response):
+        if not settings.QR_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.api_views = _api_views()
+
+    def _view(self, request):
+        """Nom de la vue (nombre de valeurs borné : jamais le chemin brut)"""
+        if request.resolver_match is not None:
+            return request.resolver_match.view_name
+        return self.api_views.get(request.path_info, "non_resolue")
+
+    def _record(self, request, response, stats, elapsed):
+        view = self._view(request)
+        method = request.method if request.method in self.METHODS else "autre"
+        metrics.inc(
+            "qr_http_requests_total", (view, method, str(response.status_code))
+        )
+        metrics.observe("qr_http_request_duration_seconds", elapsed, (view,))
+        metrics.observe("qr_db_queries_per_request", stats.queries, (view,))
+        if stats.queries:
+            metrics.inc("qr_db_queries_total", (view,), stats.queries)
+            metrics.inc("qr_db_query_seconds_total", (view,), stats.db_seconds)
+        for outcome, count in stats.outcomes.items():
+            metrics.inc("qr_redemptions_total", (view, outcome), count)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = metrics.RequestStats()
+        token = metrics.current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = metrics.RequestStats()
+        token = metrics.current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+
+class ScannerAPIMiddleware:
+    """Court-circuite la pile de middlewares pour l'API des terminaux.
+
+    L'API s'authentifie par jeton : session, CSRF, authentification, messages
+    et barre de debug ne lui servent à rien. Placé juste après
+    SecurityMiddleware, il répond directement aux requêtes de l'API, avec
+    les vues async sous ASGI et les vues synchrones sous WSGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        prefix = settings.QR_SCANNER_API_PREFIX
+        self.routes = {
+            prefix + path: views[1] if self.is_async else views[0]
+            for path, views in api.ROUTES.items()
+        }
+
+    @staticmethod
+    def _finish(response):
+        # CommonMiddleware, court-circuité, poserait Content-Length ; sans lui,
+        # uvicorn répondrait en chunked
+        if "Content-Length" not in response:
+            response.headers["Content-Length"] = str(len(response.content))
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        view = self.routes.get(request.path_info)
+        if view is not None:
+            return self._finish(view(request))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        view = self.routes.get(request.path_info)
+        if view is not None:
+            return self._finish(await view(request))
+        return await self.get_response(request)
+
+
+class _QueryTimer:
+    """execute_wrapper : temps passé en base, dont l'attente de verrou.
+
+    Sont comptés comme attente de verrou BEGIN (BEGIN IMMEDIATE attend le
+    verrou d'écriture SQLite) et UPDATE (verrou de ligne PostgreSQL ; un
+    UPDATE par clé s'exécute sinon en quelques microsecondes).
+    """
+
+    def __init__(self):
+        self.db = self.lock = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.db += elapsed
+            if sql.lstrip()[:6].upper().startswith(("BEGIN", "UPDATE")):
+                self.lock += elapsed
+
+
+class ServerTimingMiddleware:
+    """En-tête Server-Timing (db, lock, total) lu par la commande gate_load.
+
+    Inactif tant que QR_SERVER_TIMING est faux : Django le retire alors de la
+    pile. Synchrone : sous ASGI, il fait passer la pile en synchrone.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QR_SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = _QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        response["Server-Timing"] = (
+            f"db;dur={timer.db * 1000:.2f}, lock;dur={timer.lock * 1000:.2f}, "
+            f"total;dur={total * 1000:.2f}"
+        )
+        return response
+
+
+class ProfilerMiddleware:
+    """Profile (cProfile) un échantillon des requêtes ; voir ProfileService.
+
+    Une requête sur 1/QR_PROFILE_SAMPLE_RATE est tirée, puis gardée si sa vue
+    figure dans QR_PROFILE_VIEWS (toutes si vide) ; le profil n'est écrit que
+    si elle a duré au moins QR_PROFILE_MIN_MS. Inactif tant que QR_PROFILE
+    est faux : Django le retire alors de la pile. Synchrone : sous ASGI, il
+    fait passer la pile en synchrone.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QR_PROFILE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.rate = settings.QR_PROFILE_SAMPLE_RATE
+        self.views = frozenset(settings.QR_PROFILE_VIEWS)
+        self.min_seconds = settings.QR_PROFILE_MIN_MS / 1000
+        self.api_views = _api_views()
+
+    def _view(self, request):
+        """Nom de la vue visée, résolu avant l'appel (requêtes tirées seulement)"""
+        view = self.api_views.get(request.path_info)
+        if view is not None:
+            return view
+        try:
+            return resolve(request.path_info).view_name
+        except Resolver404:
+            return None
+
+    def _wanted(self, view):
+        # "verify_code" comme "qrgenerator:verify_code"
+        return not self.views or bool(
+            {view, view.rpartition(":")[2]} & self.views
+        )
+
+    def __call__(self, request):
+        if random.random() >= self.rate:
+            return self.get_response(request)
+        view = self._view(request)
+        if view is None or not self._wanted(view):
+            return self.get_response(request)
+        start = time.perf_counter()
+        response, profiler = ProfileService.run(self.get_response, request)
+        elapsed = time.perf_counter() - start
+        if profiler is not None and elapsed >= self.min_seconds:
+            ProfileService.save(profiler, view, elapsed)
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-17 12:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qrgenerator', '0003_alter_code_options_alter_codebatch_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='code',
+            name='key_id',
+            field=models.CharField(default='default', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='code',
+            name='qr_image',
+            field=models.ImageField(blank=True, null=True, upload_to='qr_codes_test/'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-17 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qrgenerator', '0005_generationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codebatch',
+            name='qr_border',
+            field=models.PositiveSmallIntegerField(default=4),
+        ),
+        migrations.AddField(
+            model_name='codebatch',
+            name='qr_error_correction',
+            field=models.CharField(choices=[('L', 'L'), ('M', 'M'), ('Q', 'Q'), ('H', 'H')], default='M', max_length=1),
+        ),
+        migrations.AddField(
+            model_name='codebatch',
+            name='qr_format',
+            field=models.CharField(choices=[('png', 'PNG 1 bit'), ('svg', 'SVG'), ('both', 'PNG + SVG')], default='png', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='codebatch',
+            name='qr_module_size',
+            field=models.PositiveSmallIntegerField(default=10),
+        ),
+    ]
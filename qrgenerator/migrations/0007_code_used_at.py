@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qrgenerator', '0006_codebatch_render_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='code',
+            name='used_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qrgenerator', '0007_code_used_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='code',
+            name='status_changed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.1.3 on 2026-10-17 12:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_counters(apps, schema_editor):
+    """Initialise les compteurs des lots et owners existants"""
+    Code = apps.get_model("qrgenerator", "Code")
+    CodeBatch = apps.get_model("qrgenerator", "CodeBatch")
+    OwnerStats = apps.get_model("qrgenerator", "OwnerStats")
+
+    counts = Code.objects.values("batch").annotate(
+        codes_total=Count("id"),
+        codes_non_utilise=Count("id", filter=Q(status="non_utilise")),
+        codes_utilise=Count("id", filter=Q(status="utilise")),
+        codes_expire=Count("id", filter=Q(status="expire")),
+    )
+    for row in counts:
+        CodeBatch.objects.filter(pk=row.pop("batch")).update(**row)
+
+    totals = (
+        CodeBatch.objects.exclude(created_by=None)
+        .values("created_by")
+        .annotate(
+            batches=Count("id"),
+            codes_total=Sum("codes_total"),
+            codes_non_utilise=Sum("codes_non_utilise"),
+            codes_utilise=Sum("codes_utilise"),
+            codes_expire=Sum("codes_expire"),
+        )
+    )
+    OwnerStats.objects.bulk_create(
+        OwnerStats(owner_id=row.pop("created_by"), **row) for row in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qrgenerator', '0008_code_status_changed_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codebatch',
+            name='codes_expire',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='codebatch',
+            name='codes_non_utilise',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='codebatch',
+            name='codes_total',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='codebatch',
+            name='codes_utilise',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='OwnerStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batches', models.IntegerField(default=0)),
+                ('codes_total', models.IntegerField(default=0)),
+                ('codes_non_utilise', models.IntegerField(default=0)),
+                ('codes_utilise', models.IntegerField(default=0)),
+                ('codes_expire', models.IntegerField(default=0)),
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='code_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-17 12:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qrgenerator', '0009_status_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='code',
+            index=models.Index(fields=['batch', '-created_at', '-id'], name='code_batch_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='code',
+            index=models.Index(fields=['batch', 'status', '-created_at', '-id'], name='code_batch_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='code',
+            index=models.Index(fields=['batch', 'id'], name='code_batch_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='code',
+            index=models.Index(condition=models.Q(('status', 'non_utilise')), fields=['batch', 'expiration_date'], name='code_batch_redeemable_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='code',
+            index=models.Index(fields=['batch', 'status_changed_at'], name='code_batch_changed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='codebatch',
+            index=models.Index(fields=['created_by', '-created_at', '-id'], name='batch_owner_created_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-17 13:18
+
+import qrgenerator.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qrgenerator', '0012_devicetoken'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='code',
+            name='qr_image',
+            field=models.ImageField(blank=True, null=True, storage=qrgenerator.storage.qr_image_storage, upload_to='qr_codes_test/'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-17 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qrgenerator', '0013_code_qr_image_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='code',
+            name='pack_length',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='code',
+            name='pack_offset',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
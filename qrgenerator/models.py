@@ -1,8 +1,10 @@
 from django.db import models
 from django.conf import settings
-import hashlib
 import json
-from qrgenerator.security import RSAService
+from qrgenerator.generation_service import compute_crypto_fields
+from qrgenerator.security import KeyRing
+from qrgenerator.qrcode_service import ERROR_CORRECTION_LEVELS, RenderProfile
+from qrgenerator.storage import qr_image_storage
 
 
 class CodeBatch(models.Model):
@@ -22,15 +24,54 @@ class CodeBatch(models.Model):
         ],
         default="en_cours",
     )
+    # Profil de rendu des QR du lot
+    qr_format = models.CharField(
+        max_length=10,
+        choices=[
+            ("png", "PNG 1 bit"),
+            ("svg", "SVG"),
+            ("both", "PNG + SVG"),
+        ],
+        default="png",
+    )
+    qr_module_size = models.PositiveSmallIntegerField(default=10)
+    qr_border = models.PositiveSmallIntegerField(default=4)
+    qr_error_correction = models.CharField(
+        max_length=1,
+        choices=[(level, level) for level in ERROR_CORRECTION_LEVELS],
+        default="M",
+    )
+    # Compteurs par statut, tenus à jour par StatsService (reconcile_stats
+    # les répare). IntegerField : une dérive ne doit pas bloquer une validation.
+    codes_total = models.IntegerField(default=0)
+    codes_non_utilise = models.IntegerField(default=0)
+    codes_utilise = models.IntegerField(default=0)
+    codes_expire = models.IntegerField(default=0)
 
     def __str__(self):
         return self.name
 
+    @property
+    def render_profile(self):
+        return RenderProfile(
+            format=self.qr_format,
+            module_size=self.qr_module_size,
+            border=self.qr_border,
+            error_correction=self.qr_error_correction,
+        )
+
     class Meta:
         permissions = [
             ("can_generate_qr", "Can generate QR codes"),
             ("can_verify_qr", "Can verify QR codes"),
         ]
+        # batch_list et dashboard : lots d'un owner, récents d'abord
+        indexes = [
+            models.Index(
+                fields=["created_by", "-created_at", "-id"],
+                name="batch_owner_created_idx",
+            ),
+        ]
 
 
 class Code(models.Model):
@@ -40,7 +81,15 @@ class Code(models.Model):
     secure_index = models.CharField(
         max_length=64, unique=True, default=None
     )  # SHA256(signature)
-    qr_image = models.ImageField(upload_to="qr_codes_test/", null=True, blank=True)
+    key_id = models.CharField(
+        max_length=64, default="default"
+    )  # clé RSA (KeyRing) ayant produit ciphertext et signature
+    qr_image = models.ImageField(
+        upload_to="qr_codes_test/", storage=qr_image_storage, null=True, blank=True
+    )  # rangé par empreinte du contenu (voir ShardedStorage)
+    # Image dans le pack du lot (QR_IMAGE_MODE="pack", voir PackService)
+    pack_offset = models.BigIntegerField(null=True, blank=True)
+    pack_length = models.PositiveIntegerField(null=True, blank=True)
     status = models.CharField(
         max_length=50,
         choices=[
@@ -52,6 +101,10 @@ class Code(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     expiration_date = models.DateTimeField()
+    used_at = models.DateTimeField(null=True, blank=True)
+    status_changed_at = models.DateTimeField(
+        null=True, blank=True, db_index=True
+    )  # dernier changement de statut (deltas des bundles hors ligne)
 
     def __str__(self):
         return f"Code {self.id} ({self.secure_index[:8]}...)"
@@ -60,12 +113,36 @@ class Code(models.Model):
         permissions = [
             ("can_verify_qr", "Can verify QR codes"),
         ]
+        # Chemins d'accès des vues (voir QueryPlanTestCase)
+        indexes = [
+            # batch_detail : codes du lot, filtrés ou non par statut, récents d'abord
+            models.Index(
+                fields=["batch", "-created_at", "-id"], name="code_batch_created_idx"
+            ),
+            models.Index(
+                fields=["batch", "status", "-created_at", "-id"],
+                name="code_batch_status_idx",
+            ),
+            # batch_export : parcours du lot dans l'ordre des id
+            models.Index(fields=["batch", "id"], name="code_batch_id_idx"),
+            # Bundle hors ligne : codes encore validables (index partiel)
+            models.Index(
+                fields=["batch", "expiration_date"],
+                condition=models.Q(status="non_utilise"),
+                name="code_batch_redeemable_idx",
+            ),
+            # Deltas du bundle : changements de statut du lot depuis une version
+            models.Index(
+                fields=["batch", "status_changed_at"], name="code_batch_changed_idx"
+            ),
+        ]
 
     def generate_crypto_fields(self, message: str):
-        """Chiffre, signe et calcule secure_index"""
-        self.ciphertext = RSAService.encrypt(message)
-        self.signature = RSAService.sign(self.ciphertext)
-        self.secure_index = hashlib.sha256(self.signature.encode()).hexdigest()
+        """Chiffre, signe et calcule secure_index avec la clé primaire"""
+        self.key_id = KeyRing.primary_key_id()
+        self.ciphertext, self.signature, self.secure_index = compute_crypto_fields(
+            message, self.key_id
+        )
 
     def get_payload(self):
         """Payload JSON embarqué dans le QR"""
@@ -76,3 +153,73 @@ class Code(models.Model):
             },
             separators=(",", ":"),
         )
+
+
+class OwnerStats(models.Model):
+    """Compteurs agrégés d'un owner (somme de ceux de ses lots)"""
+
+    owner = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="code_stats"
+    )
+    batches = models.IntegerField(default=0)
+    codes_total = models.IntegerField(default=0)
+    codes_non_utilise = models.IntegerField(default=0)
+    codes_utilise = models.IntegerField(default=0)
+    codes_expire = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Statistiques de {self.owner_id}"
+
+
+class DeviceToken(models.Model):
+    """Jeton d'un terminal de scan (API /api/verify) ; seul le hash est stocké"""
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="device_tokens"
+    )
+    name = models.CharField(max_length=100)  # ex. "Porte A"
+    key_hash = models.CharField(max_length=64, unique=True)  # SHA256(jeton)
+    prefix = models.CharField(max_length=8)  # début du jeton, pour l'identifier
+    created_at = models.DateTimeField(auto_now_add=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.prefix}…)"
+
+
+class GenerationJob(models.Model):
+    """Génération d'un lot en arrière-plan (file d'attente en base, sans broker)"""
+
+    batch = models.OneToOneField(CodeBatch, on_delete=models.CASCADE, related_name="job")
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ("en_attente", "En attente"),
+            ("en_cours", "En cours"),
+            ("termine", "Terminé"),
+            ("erreur", "Erreur"),
+        ],
+        default="en_attente",
+        db_index=True,
+    )
+    codes_generated = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job {self.id} ({self.batch_id}, {self.status})"
+
+    def eta_seconds(self, now):
+        """Temps restant estimé d'après le débit observé depuis le démarrage"""
+        if self.status != "en_cours" or not self.started_at or not self.codes_generated:
+            return None
+        elapsed = (now - self.started_at).total_seconds()
+        rate = self.codes_generated / elapsed if elapsed > 0 else 0
+        if not rate:
+            return None
+        return round((self.batch.quantity - self.codes_generated) / rate)
@@ -0,0 +1,126 @@
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files import locks
+
+MAGIC = b"QRPACK1\n"
+
+
+class PackReader:
+    """Lecture séquentielle d'un pack (export).
+
+    Un seul fichier ouvert, sans seek tant que les entrées sont lues dans
+    l'ordre des offsets.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._position = None
+
+    def read(self, offset, length):
+        if self._file is None:
+            self._file = open(self.path, "rb", buffering=settings.QR_PACK_READ_BUFFER)
+            self._position = 0
+        if offset != self._position:
+            self._file.seek(offset)
+        data = self._file.read(length)
+        self._position = offset + len(data)
+        return data
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PackService:
+    """Images PNG d'un lot dans un seul fichier, en ajout seul (QR_IMAGE_MODE="pack").
+
+    Le pack <MEDIA_ROOT>/<QR_PACK_DIR>/<lot>.pack commence par MAGIC puis
+    enchaîne les PNG ; l'index (offset, longueur) est porté par les codes
+    (Code.pack_offset, Code.pack_length), écrit par le même INSERT. Un chunk
+    interrompu avant son INSERT laisse des octets orphelins, jamais lus.
+    Un fichier par lot au lieu d'un par code : pas d'inode ni d'ouverture
+    par image. Les lectures unitaires passent par un mmap du pack, gardé
+    ouvert (QR_PACK_MAX_OPEN packs par processus).
+    """
+
+    _maps = OrderedDict()  # chemin -> (mmap, taille projetée)
+    _lock = threading.Lock()
+
+    @staticmethod
+    def path(batch_id):
+        from .models import Code  # models importe qrcode_service, qui importe ce module
+
+        storage = Code._meta.get_field("qr_image").storage
+        return storage.path(f"{settings.QR_PACK_DIR}/{batch_id}.pack")
+
+    @staticmethod
+    def append(batch_id, images):
+        """Ajoute des images en une écriture -> [(offset, longueur)], même ordre"""
+        path = PackService.path(batch_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as pack:
+            # Verrou exclusif : un worker déclaré perdu peut encore écrire
+            locks.lock(pack, locks.LOCK_EX)
+            try:
+                offset = pack.seek(0, os.SEEK_END)
+                header = MAGIC if offset == 0 else b""
+                offset += len(header)
+                spans = []
+                for image in images:
+                    spans.append((offset, len(image)))
+                    offset += len(image)
+                pack.write(header + b"".join(images))
+                pack.flush()
+            finally:
+                locks.unlock(pack)
+        return spans
+
+    @classmethod
+    def read(cls, batch_id, offset, length):
+        """Octets [offset, offset + length) du pack, via son mmap"""
+        path = cls.path(batch_id)
+        end = offset + length
+        with cls._lock:
+            mapped = cls._maps.get(path)
+            if mapped is None or mapped[1] < end:
+                # Pas encore projeté, ou le pack a grandi depuis
+                if mapped is not None:
+                    del cls._maps[path]
+                    mapped[0].close()
+                with open(path, "rb") as pack:
+                    size = os.fstat(pack.fileno()).st_size
+                    if size < end:
+                        raise ValueError(f"Entrée hors du pack {path}")
+                    mapped = (
+                        mmap.mmap(pack.fileno(), 0, access=mmap.ACCESS_READ),
+                        size,
+                    )
+                cls._maps[path] = mapped
+                while len(cls._maps) > settings.QR_PACK_MAX_OPEN:
+                    cls._maps.popitem(last=False)[1][0].close()
+            cls._maps.move_to_end(path)
+            # Copie faite sous le verrou : aucun mmap n'est fermé pendant
+            return mapped[0][offset:end]
+
+    @classmethod
+    def close_all(cls):
+        with cls._lock:
+            for mapped, _ in cls._maps.values():
+                mapped.close()
+            cls._maps.clear()
+
+    @staticmethod
+    def reader(batch_id):
+        return PackReader(PackService.path(batch_id))
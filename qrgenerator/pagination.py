@@ -0,0 +1,111 @@
+import base64
+from collections.abc import Sequence
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(obj) -> str:
+    """Curseur opaque : position (created_at, id) d'une ligne"""
+    raw = f"{(obj.created_at - _EPOCH) // _MICROSECOND}:{obj.pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        micros, pk = (int(part) for part in raw.split(":"))
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    return _EPOCH + micros * _MICROSECOND, pk
+
+
+class KeysetPage(Sequence):
+    """Page d'un KeysetPaginator (mêmes usages de gabarit qu'une Page Django)"""
+
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.object_list = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Pagination par curseur sur (created_at, id), plus récents d'abord.
+
+    Chaque page est une requête indexée « après / avant telle ligne » : ni
+    COUNT(*) ni OFFSET, une page profonde coûte autant que la première.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    @staticmethod
+    def _before(created_at, pk):
+        # created_at <= x en tête : la condition reste un intervalle d'index
+        return Q(created_at__lte=created_at) & (
+            Q(created_at__lt=created_at) | Q(pk__lt=pk)
+        )
+
+    @staticmethod
+    def _after(created_at, pk):
+        return Q(created_at__gte=created_at) & (
+            Q(created_at__gt=created_at) | Q(pk__gt=pk)
+        )
+
+    def page(self, after=None, before=None):
+        """Page suivant le curseur `after`, ou précédant `before` (sinon la première)"""
+        if before:
+            rows = list(
+                self.queryset.filter(self._after(*decode_cursor(before))).order_by(
+                    "created_at", "id"
+                )[: self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            items = rows[: self.per_page][::-1]
+            has_next = True
+        else:
+            queryset = self.queryset
+            if after:
+                queryset = queryset.filter(self._before(*decode_cursor(after)))
+            rows = list(queryset.order_by("-created_at", "-id")[: self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            items = rows[: self.per_page]
+            has_previous = bool(after)
+
+        if not items:
+            return KeysetPage([])
+        return KeysetPage(
+            items,
+            next_cursor=encode_cursor(items[-1]) if has_next else None,
+            previous_cursor=encode_cursor(items[0]) if has_previous else None,
+        )
+
+    def get_page(self, after=None, before=None):
+        """Comme page(), mais un curseur invalide renvoie la première page"""
+        try:
+            return self.page(after, before)
+        except InvalidCursor:
+            return self.page()
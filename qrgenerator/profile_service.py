@@ -0,0 +1,116 @@
+import cProfile
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timezone as dt_timezone
+from typing import NamedTuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# <horodatage UTC>_<vue>_<durée>ms_<pid>.prof : l'ordre des noms est l'ordre
+# d'enregistrement, ce qui suffit à la rotation
+_NAME = re.compile(r"^(\d{8}T\d{12})_([\w.-]+)_(\d+)ms_\d+\.prof$")
+
+
+class ProfileEntry(NamedTuple):
+    name: str
+    view: str
+    duration_ms: int
+    created_at: datetime
+    size: int
+
+
+class ProfileService:
+    """Profils cProfile de requêtes de production (voir ProfilerMiddleware).
+
+    Un seul profil à la fois par processus : le profileur n'est pas
+    réentrant et, depuis Python 3.12, il observe tout l'interpréteur. Une
+    requête tirée pendant qu'une autre est profilée passe sans profil.
+    """
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def directory():
+        return str(settings.QR_PROFILE_DIR)
+
+    @classmethod
+    def run(cls, func, *args):
+        """func(*args) sous cProfile -> (résultat, profileur ou None)"""
+        if not cls._lock.acquire(blocking=False):
+            return func(*args), None
+        try:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Un autre outil (débogueur, couverture) tient déjà le profilage
+                return func(*args), None
+            try:
+                result = func(*args)
+            finally:
+                profiler.disable()
+            return result, profiler
+        finally:
+            cls._lock.release()
+
+    @staticmethod
+    def save(profiler, view, elapsed):
+        """Écrit le profil (format pstats) puis applique la rotation"""
+        directory = ProfileService.directory()
+        stamp = datetime.now(dt_timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        label = re.sub(r"[^\w.-]", "_", view.replace(":", "."))
+        name = f"{stamp}_{label}_{round(elapsed * 1000)}ms_{os.getpid()}.prof"
+        try:
+            os.makedirs(directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(directory, name))
+        except OSError:
+            logger.exception("Profil %s non enregistré", name)
+            return None
+        ProfileService.rotate()
+        return name
+
+    @staticmethod
+    def _names():
+        try:
+            names = os.listdir(ProfileService.directory())
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if _NAME.match(name))
+
+    @staticmethod
+    def rotate():
+        """Ne garde que les QR_PROFILE_MAX_FILES profils les plus récents"""
+        names = ProfileService._names()
+        for name in names[: max(len(names) - settings.QR_PROFILE_MAX_FILES, 0)]:
+            try:
+                os.remove(os.path.join(ProfileService.directory(), name))
+            except FileNotFoundError:
+                pass  # déjà supprimé par un autre processus
+
+    @staticmethod
+    def entries():
+        """Profils enregistrés, du plus récent au plus ancien"""
+        entries = []
+        for name in reversed(ProfileService._names()):
+            try:
+                size = os.path.getsize(os.path.join(ProfileService.directory(), name))
+            except FileNotFoundError:
+                continue  # supprimé par la rotation entre-temps
+            stamp, view, duration_ms = _NAME.match(name).groups()
+            created_at = datetime.strptime(stamp, "%Y%m%dT%H%M%S%f").replace(
+                tzinfo=dt_timezone.utc
+            )
+            entries.append(ProfileEntry(name, view, int(duration_ms), created_at, size))
+        return entries
+
+    @staticmethod
+    def path(name):
+        """Chemin d'un profil existant ; None pour tout autre nom"""
+        if not _NAME.match(name):
+            return None
+        path = os.path.join(ProfileService.directory(), name)
+        return path if os.path.isfile(path) else None
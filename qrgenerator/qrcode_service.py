@@ -1,24 +1,221 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from itertools import groupby
+from typing import NamedTuple
+
 import qrcode
 from io import BytesIO
+from django.conf import settings
+from PIL import Image
+
+from . import metrics
+from .pack_service import PackService
+
+# Module clair (0) -> blanc (255), module sombre (1) -> noir (0)
+_MODULE_LEVELS = bytes([255, 0]) + bytes(254)
+
+
+class QRRenderCache:
+    """Cache LRU des rendus, borné en octets (un par processus)"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is None:
+                self.misses += 1
+            else:
+                self._items.move_to_end(key)
+                self.hits += 1
+        metrics.inc(
+            "qr_cache_requests_total", ("render", "miss" if data is None else "hit")
+        )
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+class RenderProfile(NamedTuple):
+    """Paramètres de rendu d'un lot (voir CodeBatch.render_profile)"""
+
+    format: str = "png"  # "png", "svg" ou "both"
+    module_size: int = 10  # pixels par module (PNG), taille nominale (SVG)
+    border: int = 4  # zone de silence, en modules
+    error_correction: str = "M"  # L, M, Q ou H
+
+    @property
+    def formats(self):
+        return ("png", "svg") if self.format == "both" else (self.format,)
+
+
+DEFAULT_PROFILE = RenderProfile()
+
+ERROR_CORRECTION_LEVELS = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+CONTENT_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
 
 
 class QRCodeService:
-    @staticmethod
-    def generate_qr_for_code(code_obj):
-        """QR contenant le cipher + sig (JSON compact)"""
-        payload = code_obj.secure_index
+    # À incrémenter si le rendu change : invalide les ETag déjà distribués
+    RENDER_VERSION = 1
 
+    _cache = None
+
+    @staticmethod
+    def build_matrix(payload: str, profile=DEFAULT_PROFILE):
+        """Matrice des modules (bordure incluse) : liste de lignes de booléens"""
         qr = qrcode.QRCode(
             version=None,
-            error_correction=qrcode.constants.ERROR_CORRECT_M,
-            box_size=10,
-            border=4,
+            error_correction=ERROR_CORRECTION_LEVELS[profile.error_correction],
+            border=profile.border,
         )
         qr.add_data(payload)
         qr.make(fit=True)
+        return qr.get_matrix()
+
+    @staticmethod
+    def matrix_to_image(matrix, box_size=10):
+        """Image 1 bit d'une matrice, agrandie en une passe (pas module par module)"""
+        size = len(matrix)
+        pixels = bytes(module for row in matrix for module in row).translate(
+            _MODULE_LEVELS
+        )
+        image = Image.frombytes("L", (size, size), pixels).convert(
+            "1", dither=Image.Dither.NONE
+        )
+        return image.resize((size * box_size, size * box_size), Image.NEAREST)
+
+    @staticmethod
+    def matrix_to_svg(matrix, module_size=10) -> bytes:
+        """SVG vectoriel : un seul chemin, un rectangle par suite de modules sombres"""
+        size = len(matrix)
+        path = []
+        for y, row in enumerate(matrix):
+            x = 0
+            for dark, run in groupby(row):
+                length = len(list(run))
+                if dark:
+                    path.append(f"M{x} {y}h{length}v1h-{length}z")
+                x += length
+        pixels = size * module_size
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" '
+            f'height="{pixels}" viewBox="0 0 {size} {size}" '
+            f'shape-rendering="crispEdges"><rect width="{size}" height="{size}" '
+            f'fill="#fff"/><path d="{"".join(path)}"/></svg>'
+        ).encode()
+
+    @staticmethod
+    def render_png(payload: str, profile=DEFAULT_PROFILE) -> bytes:
+        """Rendu PNG 1 bit d'un payload (sans dépendance au modèle)"""
+        with metrics.timer("qr_matrix"):
+            matrix = QRCodeService.build_matrix(payload, profile)
+        with metrics.timer("png_encode"):
+            image = QRCodeService.matrix_to_image(matrix, profile.module_size)
+            buffer = BytesIO()
+            image.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    @staticmethod
+    def render_svg(payload: str, profile=DEFAULT_PROFILE) -> bytes:
+        """Rendu SVG d'un payload (pas de rastérisation ni de compression)"""
+        with metrics.timer("qr_matrix"):
+            matrix = QRCodeService.build_matrix(payload, profile)
+        with metrics.timer("svg_encode"):
+            return QRCodeService.matrix_to_svg(matrix, profile.module_size)
+
+    @staticmethod
+    def render(payload: str, fmt="png", profile=DEFAULT_PROFILE) -> bytes:
+        if fmt == "svg":
+            return QRCodeService.render_svg(payload, profile)
+        return QRCodeService.render_png(payload, profile)
+
+    @staticmethod
+    def generate_qr_for_code(code_obj):
+        """QR contenant le cipher + sig (JSON compact)"""
+        payload = code_obj.secure_index
+        return BytesIO(QRCodeService.render_png(payload, code_obj.batch.render_profile))
+
+    @staticmethod
+    def stores_images():
+        """False si les images sont rendues à la demande (QR_IMAGE_MODE="lazy")"""
+        return settings.QR_IMAGE_MODE != "lazy"
+
+    @classmethod
+    def cache(cls):
+        if cls._cache is None:
+            cls._cache = QRRenderCache(settings.QR_RENDER_CACHE_BYTES)
+        return cls._cache
+
+    @classmethod
+    def cached_render(cls, secure_index: str, fmt="png", profile=DEFAULT_PROFILE):
+        """Rendu via le cache LRU"""
+        cache = cls.cache()
+        key = (secure_index, fmt, profile)
+        data = cache.get(key)
+        if data is None:
+            data = cls.render(secure_index, fmt, profile)
+            cache.put(key, data)
+        return data
+
+    @classmethod
+    def has_image(cls, code_obj, fmt="png") -> bool:
+        """False seulement pour un PNG attendu en stockage mais jamais écrit"""
+        return (
+            fmt != "png"
+            or not cls.stores_images()
+            or bool(code_obj.qr_image)
+            or code_obj.pack_length is not None
+        )
+
+    @classmethod
+    def image_for_code(cls, code_obj, fmt="png") -> bytes:
+        """Image d'un code : PNG stocké (pack ou fichier) s'il existe, sinon rendu"""
+        if fmt == "png" and cls.stores_images():
+            if code_obj.pack_length is not None:
+                return PackService.read(
+                    code_obj.batch_id, code_obj.pack_offset, code_obj.pack_length
+                )
+            if code_obj.qr_image:
+                with code_obj.qr_image.open("rb") as qr_file:
+                    return qr_file.read()
+        return cls.cached_render(
+            code_obj.secure_index, fmt, code_obj.batch.render_profile
+        )
 
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        buffer.seek(0)
-        return buffer
+    @classmethod
+    def etag(cls, secure_index: str, fmt="png", profile=DEFAULT_PROFILE) -> str:
+        """ETag fort : l'image est une fonction pure de secure_index et du profil"""
+        digest = hashlib.sha256(
+            f"{cls.RENDER_VERSION}:{secure_index}:{fmt}:{tuple(profile)}".encode()
+        ).hexdigest()
+        return f'"{digest[:32]}"'
@@ -0,0 +1,310 @@
+from collections import Counter
+from datetime import timezone as dt_timezone
+from typing import NamedTuple
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Q, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import metrics
+from .models import Code, CodeBatch
+from .stats_service import StatsService
+
+
+class RedemptionResult(NamedTuple):
+    status: str  # VALID, ALREADY_USED, EXPIRED ou NOT_FOUND
+    code_id: int = None
+    batch_name: str = None
+    created_at: object = None
+
+    @property
+    def success(self):
+        return self.status == RedemptionService.VALID
+
+
+class ScanVerdict(NamedTuple):
+    """Verdict d'un scan hors ligne synchronisé"""
+
+    secure_index: str
+    verdict: str
+    code_id: int = None
+
+
+class RedemptionService:
+    VALID = "valide"
+    ALREADY_USED = "utilise"
+    EXPIRED = "expire"
+    NOT_FOUND = "introuvable"
+    # Scans hors ligne uniquement
+    DUPLICATE = "doublon"  # même code scanné plus tard dans la même synchro
+    INVALID = "invalide"  # scan mal formé
+
+    @staticmethod
+    def owner_id_for(user):
+        """Owner dont un utilisateur peut valider les codes (lui-même pour un owner)"""
+        return user.owner_id or user.pk
+
+    @staticmethod
+    def owner_codes(owner_id):
+        """Codes d'un owner, filtrés par sous-requête sur le lot (UPDATE sans jointure)"""
+        return Code.objects.filter(
+            batch__in=CodeBatch.objects.filter(created_by_id=owner_id).values("id")
+        )
+
+    @staticmethod
+    def redeem(secure_index, owner_id, now=None):
+        """Valide un code en un seul UPDATE conditionnel.
+
+        Le passage à "utilise" n'a lieu que si le code est "non_utilise" et non
+        expiré : sur deux scans simultanés, la base n'en laisse passer qu'un,
+        y compris sur SQLite où select_for_update() est sans effet. Les
+        compteurs du lot sont mis à jour dans la même transaction.
+        """
+        result = RedemptionService._redeem(secure_index, owner_id, now)
+        metrics.record_outcome(result.status)
+        return result
+
+    @staticmethod
+    def _redeem(secure_index, owner_id, now):
+        now = now or timezone.now()
+        codes = RedemptionService.owner_codes(owner_id).filter(
+            secure_index=secure_index
+        )
+
+        with transaction.atomic():
+            updated = codes.filter(
+                status="non_utilise", expiration_date__gte=now
+            ).update(status="utilise", used_at=now, status_changed_at=now)
+            if updated:
+                row = codes.values("id", "batch_id", "created_at", "batch__name").get()
+                StatsService.transition(row["batch_id"], "non_utilise", "utilise")
+                return RedemptionResult(
+                    RedemptionService.VALID,
+                    row["id"],
+                    row["batch__name"],
+                    row["created_at"],
+                )
+
+            # Échec : une lecture pour en donner la raison
+            row = codes.values("id", "batch_id", "status", "expiration_date").first()
+            if row is None:
+                return RedemptionResult(RedemptionService.NOT_FOUND)
+            if now > row["expiration_date"]:
+                expired = codes.filter(status="non_utilise").update(
+                    status="expire", status_changed_at=now
+                )
+                StatsService.transition(row["batch_id"], "non_utilise", "expire", expired)
+                return RedemptionResult(RedemptionService.EXPIRED, row["id"])
+            return RedemptionResult(RedemptionService.ALREADY_USED, row["id"])
+
+    @staticmethod
+    async def aredeem(secure_index, owner_id, now=None):
+        """Variante async de redeem.
+
+        L'ORM async n'a pas de transactions : la validation et ses compteurs
+        passent d'un bloc dans le thread de l'ORM (un seul saut de thread).
+        """
+        return await sync_to_async(RedemptionService.redeem)(
+            secure_index, owner_id, now
+        )
+
+    @staticmethod
+    def status_query(secure_index, owner_id):
+        """Statut d'un code pour un terminal (lecture seule)"""
+        return (
+            RedemptionService.owner_codes(owner_id)
+            .filter(secure_index=secure_index)
+            .values("id", "status", "expiration_date", "used_at")
+        )
+
+    @staticmethod
+    def _parse_scan(scan, now):
+        """(secure_index, scanned_at) ou None si le scan est mal formé"""
+        if not isinstance(scan, dict):
+            return None
+        secure_index = scan.get("secure_index")
+        scanned_at = scan.get("scanned_at")
+        if not isinstance(secure_index, str) or not isinstance(scanned_at, str):
+            return None
+        try:
+            scanned_at = parse_datetime(scanned_at)
+        except ValueError:
+            return None
+        if scanned_at is None:
+            return None
+        if timezone.is_naive(scanned_at):
+            scanned_at = timezone.make_aware(scanned_at, dt_timezone.utc)
+        # Horloge du terminal en avance : on ne date pas un scan dans le futur
+        return secure_index.strip(), min(scanned_at, now)
+
+    @staticmethod
+    def _timestamps(rows):
+        """CASE pk -> used_at, pour poser des horodatages différents en un UPDATE"""
+        return Case(
+            *[When(pk=pk, then=Value(scanned_at)) for pk, scanned_at in rows.items()],
+            output_field=DateTimeField(),
+        )
+
+    @staticmethod
+    def redeem_offline(scans, owner_id, now=None):
+        """Valide en lot des scans horodatés remontés par des terminaux hors ligne.
+
+        Le premier scan gagne : entre scans d'une même synchro comme face à une
+        validation déjà enregistrée avec un used_at plus tardif (autre
+        terminal synchronisé avant). Une lecture et au plus trois UPDATE de
+        codes (plus ceux des compteurs, par lot), quel que soit le nombre de
+        scans. Renvoie un ScanVerdict par scan, dans l'ordre reçu.
+        """
+        now = now or timezone.now()
+        parsed = [RedemptionService._parse_scan(scan, now) for scan in scans]
+        results = RedemptionService._redeem_parsed(parsed, owner_id, now)
+        for position, scan in enumerate(scans):
+            if results[position] is None:
+                raw = scan.get("secure_index") if isinstance(scan, dict) else None
+                results[position] = ScanVerdict(
+                    str(raw or ""), RedemptionService.INVALID
+                )
+        return results
+
+    @staticmethod
+    def redeem_many(secure_indexes, owner_id, now=None):
+        """Valide d'un coup un groupe de codes scannés maintenant (billets de groupe).
+
+        Mêmes garanties que redeem_offline : un code présent deux fois reçoit
+        "doublon" pour la seconde occurrence.
+        """
+        now = now or timezone.now()
+        return RedemptionService._redeem_parsed(
+            [(secure_index.strip(), now) for secure_index in secure_indexes],
+            owner_id,
+            now,
+        )
+
+    @staticmethod
+    def _redeem_parsed(parsed, owner_id, now):
+        """[(secure_index, scanned_at) ou None] -> ScanVerdict (ou None), même ordre"""
+        # Premier scan de chaque code (le plus ancien ; à égalité, le premier reçu)
+        winners = {}
+        for position, scan in enumerate(parsed):
+            if scan is None:
+                continue
+            best = winners.get(scan[0])
+            if best is None or scan[1] < parsed[best][1]:
+                winners[scan[0]] = position
+
+        verdicts = {}
+        to_redeem = {}  # pk -> scanned_at
+        to_backdate = {}  # pk -> (used_at lu, scanned_at)
+        to_expire = []
+
+        with transaction.atomic():
+            codes = {
+                row["secure_index"]: row
+                for row in RedemptionService.owner_codes(owner_id)
+                .filter(secure_index__in=list(winners))
+                .values(
+                    "id",
+                    "batch_id",
+                    "secure_index",
+                    "status",
+                    "expiration_date",
+                    "used_at",
+                )
+            }
+            rows = {row["id"]: row for row in codes.values()}
+
+            for secure_index, position in winners.items():
+                scanned_at = parsed[position][1]
+                row = codes.get(secure_index)
+                if row is None:
+                    verdicts[position] = (RedemptionService.NOT_FOUND, None)
+                elif scanned_at > row["expiration_date"]:
+                    verdicts[position] = (RedemptionService.EXPIRED, row["id"])
+                    if row["status"] == "non_utilise":
+                        to_expire.append(row["id"])
+                elif row["status"] in ("non_utilise", "expire"):
+                    # "expire" posé par balayage après un scan antérieur à l'échéance
+                    to_redeem[row["id"]] = scanned_at
+                    verdicts[position] = (RedemptionService.VALID, row["id"])
+                elif (
+                    row["status"] == "utilise"
+                    and row["used_at"]
+                    and scanned_at < row["used_at"]
+                ):
+                    # Ce terminal est passé en premier : il récupère la validation
+                    to_backdate[row["id"]] = (row["used_at"], scanned_at)
+                    verdicts[position] = (RedemptionService.VALID, row["id"])
+                else:
+                    verdicts[position] = (row["status"], row["id"])
+
+            lost = set()
+            if to_redeem:
+                updated = Code.objects.filter(
+                    pk__in=list(to_redeem), status__in=("non_utilise", "expire")
+                ).update(
+                    status="utilise",
+                    used_at=RedemptionService._timestamps(to_redeem),
+                    status_changed_at=now,
+                )
+                if updated != len(to_redeem):
+                    # Validation concurrente entre la lecture et l'UPDATE
+                    lost |= {
+                        pk
+                        for pk, used_at in Code.objects.filter(
+                            pk__in=list(to_redeem)
+                        ).values_list("id", "used_at")
+                        if used_at != to_redeem[pk]
+                    }
+            if to_backdate:
+                unchanged = Q()
+                for pk, (used_at, _) in to_backdate.items():
+                    unchanged |= Q(pk=pk, used_at=used_at)
+                updated = Code.objects.filter(unchanged, status="utilise").update(
+                    used_at=RedemptionService._timestamps(
+                        {pk: scanned_at for pk, (_, scanned_at) in to_backdate.items()}
+                    ),
+                    status_changed_at=now,
+                )
+                if updated != len(to_backdate):
+                    lost |= {
+                        pk
+                        for pk, used_at in Code.objects.filter(
+                            pk__in=list(to_backdate)
+                        ).values_list("id", "used_at")
+                        if used_at != to_backdate[pk][1]
+                    }
+            if to_expire:
+                expired = Code.objects.filter(
+                    pk__in=to_expire, status="non_utilise"
+                ).update(status="expire", status_changed_at=now)
+                if expired != len(to_expire):
+                    to_expire = Code.objects.filter(
+                        pk__in=to_expire, status="expire", status_changed_at=now
+                    ).values_list("id", flat=True)
+
+            transitions = Counter(
+                (rows[pk]["batch_id"], rows[pk]["status"], "utilise")
+                for pk in to_redeem
+                if pk not in lost
+            )
+            transitions.update(
+                (rows[pk]["batch_id"], "non_utilise", "expire") for pk in to_expire
+            )
+            StatsService.apply(transitions)
+
+        results = []
+        for position, scan in enumerate(parsed):
+            if scan is None:
+                results.append(None)
+                continue
+            if position not in verdicts:
+                code_id = codes.get(scan[0], {}).get("id")
+                results.append(ScanVerdict(scan[0], RedemptionService.DUPLICATE, code_id))
+                continue
+            verdict, code_id = verdicts[position]
+            if verdict == RedemptionService.VALID and code_id in lost:
+                verdict = RedemptionService.ALREADY_USED
+            results.append(ScanVerdict(scan[0], verdict, code_id))
+        return results
@@ -1,23 +1,155 @@
 import base64
+import hashlib
+import json
+import os
+import threading
+import time
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class KeyRing:
+    """Clés RSA parsées une fois par processus et servies par key id.
+
+    Les clés viennent de settings.RSA_KEYS, complétées par le fichier JSON
+    settings.RSA_KEYS_FILE s'il existe. Ce fichier est relu quand il change
+    (vérifié au plus toutes les RSA_KEYS_RELOAD_INTERVAL secondes) : on peut
+    ajouter une clé, changer la clé primaire ou retirer une clé sans redémarrer.
+    Une clé "retired" ne signe plus de nouveaux codes mais reste utilisable
+    pour vérifier et déchiffrer les anciens.
+    """
+
+    ACTIVE = "active"
+    RETIRED = "retired"
+
+    _lock = threading.Lock()
+    _parsed = {}  # (type, sha256 du PEM) -> objet clé
+    _entries = None
+    _primary = None
+    _file_mtime = None
+    _checked_at = 0.0
+
+    @classmethod
+    def reset(cls):
+        """Oublie la configuration (les clés parsées restent en cache)"""
+        with cls._lock:
+            cls._entries = None
+            cls._primary = None
+            cls._file_mtime = None
+            cls._checked_at = 0.0
+
+    @classmethod
+    def _read_file(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return data.get("keys", {}), data.get("primary")
+
+    @classmethod
+    def _load_config(cls):
+        """Recharge la configuration si nécessaire (appelé sous verrou)"""
+        path = getattr(settings, "RSA_KEYS_FILE", None)
+        now = time.monotonic()
+        if cls._entries is not None and (
+            not path or now - cls._checked_at < settings.RSA_KEYS_RELOAD_INTERVAL
+        ):
+            return
+        cls._checked_at = now
+
+        mtime = os.stat(path).st_mtime if path and os.path.exists(path) else None
+        if cls._entries is not None and mtime == cls._file_mtime:
+            return
+
+        entries = {kid: dict(entry) for kid, entry in settings.RSA_KEYS.items()}
+        primary = settings.RSA_PRIMARY_KEY_ID
+        if mtime is not None:
+            file_entries, file_primary = cls._read_file(path)
+            entries.update(file_entries)
+            primary = file_primary or primary
+
+        if primary not in entries or entries[primary].get("status") == cls.RETIRED:
+            active = [
+                kid for kid, e in entries.items() if e.get("status") != cls.RETIRED
+            ]
+            if not active:
+                raise ImproperlyConfigured("Aucune clé RSA active")
+            primary = active[0]
+
+        cls._entries, cls._primary, cls._file_mtime = entries, primary, mtime
+
+    @classmethod
+    def _entry(cls, key_id):
+        with cls._lock:
+            cls._load_config()
+            try:
+                return cls._entries[key_id or cls._primary]
+            except KeyError:
+                raise KeyError(f"Clé RSA inconnue : {key_id}") from None
+
+    @classmethod
+    def _parse(cls, kind, material, loader):
+        cache_key = (kind, hashlib.sha256(material.encode()).hexdigest())
+        key = cls._parsed.get(cache_key)
+        if key is None:
+            key = loader(base64.b64decode(material))
+            cls._parsed[cache_key] = key
+        return key
+
+    @classmethod
+    def primary_key_id(cls) -> str:
+        """Key id utilisé pour les nouveaux codes"""
+        with cls._lock:
+            cls._load_config()
+            return cls._primary
+
+    @classmethod
+    def key_ids(cls, status=None):
+        with cls._lock:
+            cls._load_config()
+            return [
+                kid
+                for kid, e in cls._entries.items()
+                if status is None or e.get("status", cls.ACTIVE) == status
+            ]
+
+    @classmethod
+    def public_key(cls, key_id=None):
+        return cls._parse(
+            "public",
+            cls._entry(key_id)["public_key"],
+            serialization.load_pem_public_key,
+        )
+
+    @classmethod
+    def private_key(cls, key_id=None):
+        return cls._parse(
+            "private",
+            cls._entry(key_id)["private_key"],
+            lambda data: serialization.load_pem_private_key(data, password=None),
+        )
+
+
+@receiver(setting_changed)
+def _reset_keyring(setting, **kwargs):
+    if setting.startswith("RSA_") or setting in ("PRIVATE_KEY", "PUBLIC_KEY"):
+        KeyRing.reset()
 
 
 class RSAService:
     @staticmethod
-    def _load_private_key():
-        key_data = base64.b64decode(settings.PRIVATE_KEY)
-        return serialization.load_pem_private_key(key_data, password=None)
+    def _load_private_key(key_id=None):
+        return KeyRing.private_key(key_id)
 
     @staticmethod
-    def _load_public_key():
-        key_data = base64.b64decode(settings.PUBLIC_KEY)
-        return serialization.load_pem_public_key(key_data)
+    def _load_public_key(key_id=None):
+        return KeyRing.public_key(key_id)
 
     @staticmethod
-    def encrypt(message: str) -> str:
-        public_key = RSAService._load_public_key()
+    def encrypt(message: str, key_id=None) -> str:
+        public_key = RSAService._load_public_key(key_id)
         ciphertext = public_key.encrypt(
             message.encode(),
             padding.OAEP(
@@ -29,8 +161,8 @@ class RSAService:
         return base64.b64encode(ciphertext).decode()
 
     @staticmethod
-    def decrypt(ciphertext_b64: str) -> str:
-        private_key = RSAService._load_private_key()
+    def decrypt(ciphertext_b64: str, key_id=None) -> str:
+        private_key = RSAService._load_private_key(key_id)
         ciphertext = base64.b64decode(ciphertext_b64)
         plaintext = private_key.decrypt(
             ciphertext,
@@ -43,8 +175,8 @@ class RSAService:
         return plaintext.decode()
 
     @staticmethod
-    def sign(message: str) -> str:
-        private_key = RSAService._load_private_key()
+    def sign(message: str, key_id=None) -> str:
+        private_key = RSAService._load_private_key(key_id)
         signature = private_key.sign(
             message.encode(),
             padding.PSS(
@@ -56,9 +188,9 @@ class RSAService:
         return base64.b64encode(signature).decode()
 
     @staticmethod
-    def verify(message: str, signature_b64: str) -> bool:
-        public_key = RSAService._load_public_key()
+    def verify(message: str, signature_b64: str, key_id=None) -> bool:
         try:
+            public_key = RSAService._load_public_key(key_id)
             public_key.verify(
                 base64.b64decode(signature_b64),
                 message.encode(),
@@ -0,0 +1,143 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import Code, CodeBatch, OwnerStats
+
+# Statut d'un code -> compteur correspondant (CodeBatch et OwnerStats)
+STATUS_FIELDS = {
+    "non_utilise": "codes_non_utilise",
+    "utilise": "codes_utilise",
+    "expire": "codes_expire",
+}
+COUNTER_FIELDS = ("codes_total", *STATUS_FIELDS.values())
+
+
+class StatsService:
+    """Compteurs de codes dénormalisés, par lot et par owner.
+
+    Chaque changement de statut appelle apply() dans sa propre transaction :
+    les compteurs bougent avec les codes ou pas du tout.
+    """
+
+    @staticmethod
+    def apply(transitions):
+        """Applique {(batch_id, ancien statut, nouveau statut): nombre}.
+
+        Un ancien statut None signifie un code créé. Deux UPDATE par lot
+        touché (lot et owner), quel que soit le nombre de codes.
+        """
+        per_batch = defaultdict(Counter)
+        for (batch_id, old, new), count in transitions.items():
+            if old is None:
+                per_batch[batch_id]["codes_total"] += count
+            else:
+                per_batch[batch_id][STATUS_FIELDS[old]] -= count
+            per_batch[batch_id][STATUS_FIELDS[new]] += count
+
+        for batch_id, deltas in per_batch.items():
+            changes = {
+                field: F(field) + delta for field, delta in deltas.items() if delta
+            }
+            if not changes:
+                continue
+            CodeBatch.objects.filter(pk=batch_id).update(**changes)
+            OwnerStats.objects.filter(
+                owner__in=CodeBatch.objects.filter(pk=batch_id).values("created_by")
+            ).update(**changes)
+
+    @staticmethod
+    def transition(batch_id, old, new, count=1):
+        if count:
+            StatsService.apply({(batch_id, old, new): count})
+
+    @staticmethod
+    def batch_created(batch):
+        """Compte un nouveau lot pour son owner (crée ses compteurs au besoin)"""
+        stats, _ = OwnerStats.objects.get_or_create(owner_id=batch.created_by_id)
+        OwnerStats.objects.filter(pk=stats.pk).update(batches=F("batches") + 1)
+
+    @staticmethod
+    def for_owner(owner):
+        """Compteurs d'un owner (zéros s'il n'a encore rien créé)"""
+        return OwnerStats.objects.filter(owner=owner).first() or OwnerStats(owner=owner)
+
+    @staticmethod
+    def pending_expirations(owner_ids, now=None):
+        """(owner_id, nombre) des codes échus que le sweeper n'a pas encore passés
+        à "expire" : encore comptés dans codes_non_utilise.
+
+        Index partiel code_batch_redeemable_idx : seuls les codes échus sont lus.
+        """
+        return (
+            Code.objects.filter(
+                batch__created_by_id__in=owner_ids,
+                status="non_utilise",
+                expiration_date__lte=now or timezone.now(),
+            )
+            .order_by()
+            .values_list("batch__created_by_id")
+            .annotate(count=Count("id"))
+        )
+
+    @staticmethod
+    def _batch_counts(batch_id):
+        return Code.objects.filter(batch_id=batch_id).aggregate(
+            codes_total=Count("id"),
+            **{
+                field: Count("id", filter=Q(status=status))
+                for status, field in STATUS_FIELDS.items()
+            },
+        )
+
+    @staticmethod
+    def reconcile():
+        """Recalcule les compteurs et corrige ceux qui ont dérivé.
+
+        Chaque ligne est recalculée sous verrou (select_for_update) : une
+        validation concurrente attend la correction au lieu d'être écrasée.
+        Renvoie (lots corrigés, owners corrigés).
+        """
+        repaired_batches = 0
+        for batch_id in list(CodeBatch.objects.values_list("id", flat=True)):
+            with transaction.atomic():
+                batch = (
+                    CodeBatch.objects.select_for_update()
+                    .only(*COUNTER_FIELDS)
+                    .filter(pk=batch_id)
+                    .first()
+                )
+                if batch is None:
+                    continue
+                counts = StatsService._batch_counts(batch_id)
+                if any(getattr(batch, f) != counts[f] for f in COUNTER_FIELDS):
+                    CodeBatch.objects.filter(pk=batch_id).update(**counts)
+                    repaired_batches += 1
+
+        repaired_owners = 0
+        owner_ids = set(
+            CodeBatch.objects.exclude(created_by=None).values_list(
+                "created_by", flat=True
+            )
+        ) | set(OwnerStats.objects.values_list("owner", flat=True))
+        for owner_id in owner_ids:
+            with transaction.atomic():
+                stats = (
+                    OwnerStats.objects.select_for_update()
+                    .filter(owner_id=owner_id)
+                    .first()
+                )
+                totals = CodeBatch.objects.filter(created_by_id=owner_id).aggregate(
+                    batches=Count("id"), **{f: Sum(f) for f in COUNTER_FIELDS}
+                )
+                totals = {field: value or 0 for field, value in totals.items()}
+                if stats is None:
+                    OwnerStats.objects.create(owner_id=owner_id, **totals)
+                    repaired_owners += 1
+                elif any(getattr(stats, f) != v for f, v in totals.items()):
+                    OwnerStats.objects.filter(pk=stats.pk).update(**totals)
+                    repaired_owners += 1
+
+        return repaired_batches, repaired_owners
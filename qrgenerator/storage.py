@@ -0,0 +1,121 @@
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage, storages
+from django.core.files.storage.handler import InvalidStorageError
+
+# <répertoire>/ab/cd/<sha256 du contenu>.<ext>
+_SHARDED = re.compile(r"(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$")
+
+
+def qr_image_storage():
+    """Stockage de Code.qr_image : alias "qr_images" de STORAGES, sinon le défaut"""
+    try:
+        return storages["qr_images"]
+    except InvalidStorageError:
+        return default_storage
+
+
+class ShardedStorage(FileSystemStorage):
+    """Fichiers adressés par contenu, répartis sur deux niveaux de répertoires.
+
+    Le nom d'un fichier est l'empreinte SHA-256 de son contenu, rangée sous
+    <upload_to>/ab/cd/ : 65 536 répertoires feuilles, quelques dizaines de
+    fichiers chacun pour des millions d'images, au lieu d'un seul répertoire
+    géant. Un contenu déjà présent n'est pas réécrit (une image rendue deux
+    fois, par exemple par un job repris, ne prend qu'une place) ; un fichier
+    pouvant ainsi servir à plusieurs codes, ne pas le supprimer avec l'un
+    d'eux.
+    """
+
+    @staticmethod
+    def is_sharded(name):
+        return bool(_SHARDED.search(name))
+
+    @staticmethod
+    def shard_name(directory, digest, ext):
+        return posixpath.join(directory, digest[:2], digest[2:4], digest + ext)
+
+    def get_available_name(self, name, max_length=None):
+        # Le nom définitif dépend du contenu : il est choisi par _save()
+        return name
+
+    def _makedirs(self, directory):
+        if self.directory_permissions_mode is None:
+            os.makedirs(directory, exist_ok=True)
+            return
+        # makedirs() n'applique pas `mode` aux répertoires intermédiaires
+        old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+        try:
+            os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+        finally:
+            os.umask(old_umask)
+
+    def _save(self, name, content):
+        directory = posixpath.dirname(name)
+        ext = posixpath.splitext(name)[1].lower()
+        base = self.path(directory)
+
+        # Empreinte calculée pendant l'écriture d'un fichier temporaire, puis
+        # renommage atomique : deux écritures concurrentes du même contenu
+        # aboutissent au même fichier, complet. Les répertoires ne sont créés
+        # qu'en cas d'échec (un stat de moins par image dans le cas courant).
+        temporary = os.path.join(base, f".tmp-{uuid.uuid4().hex}")
+        digest = hashlib.sha256()
+        try:
+            try:
+                output = open(temporary, "xb")
+            except FileNotFoundError:
+                self._makedirs(base)
+                output = open(temporary, "xb")
+            with output:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    output.write(chunk)
+            name = self.shard_name(directory, digest.hexdigest(), ext)
+            full_path = self.path(name)
+            if not os.path.exists(full_path):
+                if self.file_permissions_mode is not None:
+                    os.chmod(temporary, self.file_permissions_mode)
+                try:
+                    os.replace(temporary, full_path)
+                except FileNotFoundError:
+                    self._makedirs(os.path.dirname(full_path))
+                    os.replace(temporary, full_path)
+        finally:
+            try:
+                os.remove(temporary)
+            except FileNotFoundError:
+                pass
+        return name
+
+    def adopt(self, name, directory=None):
+        """Range un fichier existant à son adresse -> (nouveau nom, déjà présent).
+
+        L'ancien fichier reste en place (lien dur, copie entre systèmes de
+        fichiers) : à l'appelant de le supprimer une fois le nom enregistré.
+        """
+        digest = hashlib.sha256()
+        with open(self.path(name), "rb") as source:
+            for chunk in File(source).chunks():
+                digest.update(chunk)
+        if directory is None:
+            directory = posixpath.dirname(name)
+        ext = posixpath.splitext(name)[1].lower()
+        new_name = self.shard_name(directory, digest.hexdigest(), ext)
+        full_path = self.path(new_name)
+        if os.path.exists(full_path):
+            return new_name, True
+        self._makedirs(os.path.dirname(full_path))
+        try:
+            os.link(self.path(name), full_path)
+        except FileExistsError:
+            return new_name, True
+        except OSError:
+            with open(self.path(name), "rb") as source:
+                self._save(posixpath.join(directory, "image" + ext), File(source))
+        return new_name, False
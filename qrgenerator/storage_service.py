@@ -0,0 +1,86 @@
+import os
+import posixpath
+import time
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Code
+
+
+class StorageMigrationService:
+    """Passage des images QR existantes (noms à plat) au rangement de ShardedStorage"""
+
+    @staticmethod
+    def storage():
+        return Code._meta.get_field("qr_image").storage
+
+    @staticmethod
+    def directory():
+        """Répertoire de upload_to, où sont regroupées les images migrées"""
+        field = Code._meta.get_field("qr_image")
+        return posixpath.dirname(field.generate_filename(None, "qr.png"))
+
+    @staticmethod
+    def migrate_chunk(low, high):
+        """Migre les images des codes d'id dans [low, high).
+
+        Chaque fichier est d'abord lié à sa nouvelle adresse, puis les noms
+        sont enregistrés en une transaction, et les anciens fichiers ne sont
+        supprimés qu'ensuite : une interruption à n'importe quel moment
+        laisse chaque code avec un fichier lisible. Renvoie un Counter
+        (moved, deduplicated, missing).
+        """
+        storage = StorageMigrationService.storage()
+        directory = StorageMigrationService.directory()
+        counts = Counter()
+        moved = {}  # pk -> (ancien nom, nouveau nom)
+        for pk, name in (
+            Code.objects.filter(pk__gte=low, pk__lt=high)
+            .exclude(qr_image="")
+            .exclude(qr_image=None)
+            .values_list("id", "qr_image")
+        ):
+            if storage.is_sharded(name):
+                continue
+            try:
+                new_name, existed = storage.adopt(name, directory)
+            except FileNotFoundError:
+                counts["missing"] += 1
+                continue
+            counts["deduplicated" if existed else "moved"] += 1
+            moved[pk] = (name, new_name)
+
+        if moved:
+            with transaction.atomic():
+                Code.objects.bulk_update(
+                    [Code(pk=pk, qr_image=new) for pk, (_, new) in moved.items()],
+                    ["qr_image"],
+                )
+            for old, _ in moved.values():
+                try:
+                    os.remove(storage.path(old))
+                except FileNotFoundError:
+                    pass
+        return counts
+
+    @staticmethod
+    def migrate(chunk_size=1000, start_pk=0, pause=0.0, on_chunk=None):
+        """Migre tous les codes par tranches d'id, de start_pk jusqu'au dernier.
+
+        Reprise : relancer avec start_pk = dernier `high` signalé (les codes
+        déjà migrés sont de toute façon ignorés). Renvoie (Counter, id suivant).
+        """
+        last_pk = Code.objects.aggregate(last=Max("id"))["last"] or 0
+        totals = Counter()
+        low = start_pk
+        while low <= last_pk:
+            high = low + chunk_size
+            totals += StorageMigrationService.migrate_chunk(low, high)
+            if on_chunk:
+                on_chunk(high, totals)
+            low = high
+            if pause:
+                time.sleep(pause)
+        return totals, low
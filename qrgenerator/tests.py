@@ -1,10 +1,48 @@
+import base64
+import hashlib
 import json
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+import zipfile
+from io import BytesIO, StringIO
+from unittest import skipUnless
 from datetime import timedelta
-from django.test import TestCase
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils import timezone
-from qrgenerator.security import RSAService
-from qrgenerator.qrcode_service import QRCodeService
-from qrgenerator.models import CodeBatch, Code
+from PIL import Image
+from qrgenerator.security import KeyRing, RSAService
+from qrgenerator.qrcode_service import QRCodeService, QRRenderCache
+from qrgenerator.models import CodeBatch, Code, GenerationJob, OwnerStats
+from qrgenerator.generation_service import BatchGenerationService
+from qrgenerator.job_service import GenerationJobService
+from qrgenerator.redemption_service import RedemptionService
+from qrgenerator.bundle_service import BundleService, OfflineBundle
+from qrgenerator.stats_service import StatsService
+from qrgenerator.expiry_service import ExpiryService
+from qrgenerator.pagination import KeysetPaginator, encode_cursor
+from qrgenerator.decode_service import QRDecodeService
+from qrgenerator.token_service import DeviceTokenService
+from qrgenerator.live_service import LiveFeed
+from qrgenerator.profile_service import ProfileService
+from qrgenerator.storage import ShardedStorage
+from qrgenerator.pack_service import MAGIC, PackService
+from qrgenerator.benchmarks import compare_results
+from qrgenerator import loadtest, metrics
 
 
 class CodeCryptoTestCase(TestCase):
@@ -46,3 +84,1389 @@ class CodeCryptoTestCase(TestCase):
         self.assertIn("sig", payload)
 
         print("\n✅ Test complet réussi ! secure_index:", code.secure_index[:16])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BatchGenerationServiceTestCase(TestCase):
+    def setUp(self):
+        self.batch = CodeBatch.objects.create(name="BatchGen", quantity=5)
+        self.expiration_date = timezone.now() + timedelta(days=30)
+
+    def _check_codes(self, expected):
+        codes = list(self.batch.codes.all())
+        self.assertEqual(len(codes), expected)
+        for code in codes:
+            self.assertTrue(RSAService.verify(code.ciphertext, code.signature))
+            # Adressé par contenu : <upload_to>/ab/cd/<sha256>.png
+            with code.qr_image.open("rb") as qr_file:
+                digest = hashlib.sha256(qr_file.read()).hexdigest()
+            self.assertEqual(
+                code.qr_image.name,
+                f"qr_codes_test/{digest[:2]}/{digest[2:4]}/{digest}.png",
+            )
+
+    def test_generate_inline(self):
+        """Sans pool : un seul processus, même résultat"""
+        created = BatchGenerationService.generate(
+            self.batch, 5, self.expiration_date, workers=1, chunk_size=2
+        )
+        self.assertEqual(created, 5)
+        self._check_codes(5)
+
+    def test_generate_process_pool(self):
+        """Chunks répartis sur un pool de processus"""
+        created = BatchGenerationService.generate(
+            self.batch, 5, self.expiration_date, workers=2, chunk_size=2
+        )
+        self.assertEqual(created, 5)
+        self._check_codes(5)
+
+
+def make_key_entry(status="active"):
+    """Nouvelle paire RSA au format de settings.RSA_KEYS"""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    return {
+        "public_key": base64.b64encode(public_pem).decode(),
+        "private_key": base64.b64encode(private_pem).decode(),
+        "status": status,
+    }
+
+
+class KeyRingTestCase(TestCase):
+    def setUp(self):
+        self.batch = CodeBatch.objects.create(name="BatchKeys", quantity=1)
+        self.keys = {"default": settings.RSA_KEYS["default"], "k2": make_key_entry()}
+
+    def test_keys_are_parsed_once(self):
+        """Deux appels renvoient le même objet clé"""
+        self.assertIs(KeyRing.private_key(), KeyRing.private_key())
+        self.assertIs(KeyRing.public_key("default"), KeyRing.public_key("default"))
+
+    def test_rotation_records_key_id(self):
+        """Les nouveaux codes utilisent la clé primaire, les anciens restent vérifiables"""
+        old = Code(batch=self.batch, expiration_date=timezone.now())
+        old.generate_crypto_fields("OLD")
+        self.assertEqual(old.key_id, "default")
+
+        self.keys["default"] = dict(self.keys["default"], status="retired")
+        with override_settings(RSA_KEYS=self.keys, RSA_PRIMARY_KEY_ID="k2"):
+            new = Code(batch=self.batch, expiration_date=timezone.now())
+            new.generate_crypto_fields("NEW")
+            self.assertEqual(new.key_id, "k2")
+            self.assertTrue(RSAService.verify(new.ciphertext, new.signature, "k2"))
+            self.assertEqual(RSAService.decrypt(new.ciphertext, "k2"), "NEW")
+            self.assertFalse(
+                RSAService.verify(new.ciphertext, new.signature, "default")
+            )
+
+            # Clé retirée : plus de signature, mais vérification et déchiffrement
+            self.assertEqual(KeyRing.key_ids("retired"), ["default"])
+            self.assertTrue(RSAService.verify(old.ciphertext, old.signature, "default"))
+            self.assertEqual(RSAService.decrypt(old.ciphertext, "default"), "OLD")
+
+    def test_keys_file_reloaded_without_restart(self):
+        """Le fichier de clés est relu quand il change"""
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        with override_settings(RSA_KEYS_FILE=path, RSA_KEYS_RELOAD_INTERVAL=0):
+            with open(path, "w") as f:
+                json.dump({"keys": {}}, f)
+            self.assertEqual(KeyRing.primary_key_id(), "default")
+
+            with open(path, "w") as f:
+                json.dump({"primary": "k2", "keys": {"k2": self.keys["k2"]}}, f)
+            os.utime(path, (0, 1))
+            self.assertEqual(KeyRing.primary_key_id(), "k2")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), QR_GENERATION_WORKERS=1)
+class GenerationJobTestCase(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(
+            username="owner", email="owner@example.com", password="x", role="owner"
+        )
+        self.client.force_login(self.owner)
+
+    def _create_batch(self, quantity=3):
+        response = self.client.post(
+            reverse("qrgenerator:batch_create"),
+            {"name": "Concert", "quantity": quantity, "validity_days": 10},
+        )
+        batch = CodeBatch.objects.get(name="Concert")
+        self.assertRedirects(
+            response,
+            reverse("qrgenerator:batch_detail", args=[batch.pk]),
+            fetch_redirect_response=False,
+        )
+        return batch
+
+    def test_batch_create_enqueues(self):
+        """batch_create rend la main sans générer de code"""
+        batch = self._create_batch()
+        self.assertEqual(batch.status, "en_cours")
+        self.assertEqual(batch.codes.count(), 0)
+        self.assertEqual(batch.job.status, "en_attente")
+
+    def test_worker_generates_and_reports_progress(self):
+        batch = self._create_batch()
+        call_command("generation_worker", "--once", stdout=open(os.devnull, "w"))
+
+        batch.refresh_from_db()
+        self.assertEqual(batch.status, "termine")
+        self.assertEqual(batch.codes.count(), 3)
+
+        progress = self.client.get(
+            reverse("qrgenerator:batch_progress", args=[batch.pk])
+        ).json()
+        self.assertEqual(progress["job_status"], "termine")
+        self.assertEqual(progress["generated"], 3)
+        self.assertEqual(progress["quantity"], 3)
+
+    def test_stale_job_is_resumed(self):
+        """Un job abandonné est repris et ne génère que les codes manquants"""
+        batch = self._create_batch(quantity=3)
+        BatchGenerationService.generate(
+            batch, 2, timezone.now() + timedelta(days=10), workers=1
+        )
+        GenerationJob.objects.filter(batch=batch).update(
+            status="en_cours",
+            worker="dead:1",
+            heartbeat_at=timezone.now() - timedelta(hours=1),
+        )
+
+        job = GenerationJobService.claim("alive:2")
+        self.assertEqual(job.batch_id, batch.pk)
+        self.assertTrue(GenerationJobService.run(job, "alive:2"))
+        self.assertEqual(batch.codes.count(), 3)
+        self.assertIsNone(GenerationJobService.claim("alive:3"))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BatchExportTestCase(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(
+            username="owner", email="owner@example.com", password="x", role="owner"
+        )
+        self.client.force_login(self.owner)
+        self.batch = CodeBatch.objects.create(
+            name="Export", quantity=3, created_by=self.owner
+        )
+        BatchGenerationService.generate(
+            self.batch, 3, timezone.now() + timedelta(days=1), workers=1
+        )
+
+    def test_streamed_zip_stores_entries(self):
+        response = self.client.get(reverse("qrgenerator:batch_export", args=[self.batch.pk]))
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+
+        infos = archive.infolist()
+        self.assertEqual(len(infos), 3)
+        for info, code in zip(infos, self.batch.codes.order_by("id")):
+            self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(info.filename, f"qr_{code.id}_{code.secure_index[:16]}.png")
+            with code.qr_image.open("rb") as qr_file:
+                self.assertEqual(archive.read(info), qr_file.read())
+
+
+class QRRendererTestCase(TestCase):
+    def test_matrix_renderer_matches_qrcode_pil_factory(self):
+        """Le rendu par matrice produit exactement l'image de qrcode"""
+        import qrcode
+
+        payload = "f" * 64
+        qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M)
+        qr.add_data(payload)
+        qr.make(fit=True)
+        expected = BytesIO()
+        qr.make_image(fill_color="black", back_color="white").save(expected, format="PNG")
+
+        self.assertEqual(QRCodeService.render_png(payload), expected.getvalue())
+
+
+class QRRenderCacheTestCase(TestCase):
+    def test_lru_bounded_by_bytes(self):
+        cache = QRRenderCache(max_bytes=10)
+        cache.put("a", b"1234")
+        cache.put("b", b"1234")
+        self.assertEqual(cache.get("a"), b"1234")  # "a" devient le plus récent
+        cache.put("c", b"1234")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"1234")
+        self.assertLessEqual(cache.size, 10)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), QR_IMAGE_MODE="lazy")
+class LazyQRImageTestCase(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(
+            username="owner", email="owner@example.com", password="x", role="owner"
+        )
+        self.client.force_login(self.owner)
+        self.batch = CodeBatch.objects.create(
+            name="Lazy", quantity=2, created_by=self.owner
+        )
+        BatchGenerationService.generate(
+            self.batch, 2, timezone.now() + timedelta(days=1), workers=1
+        )
+        self.code = self.batch.codes.first()
+
+    def test_generation_writes_no_file(self):
+        self.assertFalse(self.batch.codes.exclude(qr_image="").exists())
+
+    def test_download_renders_with_etag(self):
+        url = reverse("qrgenerator:code_download_qr", args=[self.code.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, QRCodeService.render_png(self.code.secure_index))
+        self.assertEqual(response["ETag"], QRCodeService.etag(self.code.secure_index))
+        self.assertIn("immutable", response["Cache-Control"])
+
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+    @override_settings(QR_IMAGE_MODE="stored")
+    def test_missing_image_not_revalidated(self):
+        # PNG attendu en stockage mais jamais écrit : redirection, même avec
+        # un ETag connu du client, et rien de mis en cache
+        url = reverse("qrgenerator:code_download_qr", args=[self.code.pk])
+        etag = QRCodeService.etag(self.code.secure_index)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertRedirects(
+            response, reverse("qrgenerator:code_detail", args=[self.code.pk]),
+            fetch_redirect_response=False,
+        )
+        self.assertNotIn("ETag", response)
+        self.assertNotIn("immutable", response.get("Cache-Control", ""))
+
+    def test_export_renders_on_demand(self):
+        response = self.client.get(reverse("qrgenerator:batch_export", args=[self.batch.pk]))
+        archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(len(archive.namelist()), 2)
+
+
+# Pages d'erreur rendues sans manifeste de fichiers statiques
+PLAIN_STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), STORAGES=PLAIN_STORAGES)
+class RenderProfileTestCase(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(
+            username="owner", email="owner@example.com", password="x", role="owner"
+        )
+        self.client.force_login(self.owner)
+        self.batch = CodeBatch.objects.create(
+            name="Profil",
+            quantity=2,
+            created_by=self.owner,
+            qr_format="both",
+            qr_module_size=4,
+            qr_border=2,
+            qr_error_correction="H",
+        )
+        BatchGenerationService.generate(
+            self.batch, 2, timezone.now() + timedelta(days=1), workers=1
+        )
+        self.code = self.batch.codes.first()
+
+    def test_stored_png_follows_profile(self):
+        from PIL import Image
+
+        with self.code.qr_image.open("rb") as qr_file:
+            image = Image.open(BytesIO(qr_file.read()))
+        matrix = QRCodeService.build_matrix(self.code.secure_index, self.batch.render_profile)
+        self.assertEqual(image.mode, "1")
+        self.assertEqual(image.size, (len(matrix) * 4, len(matrix) * 4))
+
+    def test_download_svg(self):
+        url = reverse("qrgenerator:code_download_qr", args=[self.code.pk])
+        response = self.client.get(url, {"format": "svg"})
+        self.assertEqual(response["Content-Type"], "image/svg+xml")
+        self.assertTrue(response.content.startswith(b"<svg"))
+
+        self.batch.qr_format = "png"
+        self.batch.save()
+        self.assertEqual(self.client.get(url, {"format": "svg"}).status_code, 404)
+
+    def test_export_contains_each_format(self):
+        response = self.client.get(reverse("qrgenerator:batch_export", args=[self.batch.pk]))
+        archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        names = archive.namelist()
+        self.assertEqual(len([n for n in names if n.endswith(".png")]), 2)
+        self.assertEqual(len([n for n in names if n.endswith(".svg")]), 2)
+
+
+def make_code(batch, secure_index, days=1, **kwargs):
+    """Code sans crypto (secure_index arbitraire) pour les tests de validation"""
+    return Code.objects.create(
+        batch=batch,
+        ciphertext="-",
+        signature="-",
+        secure_index=secure_index,
+        expiration_date=timezone.now() + timedelta(days=days),
+        **kwargs,
+    )
+
+
+class VerifierSetupMixin:
+    """Owner, vérificateur connecté et lot vide"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.owner = User.objects.create_user(
+            username="owner", email="owner@example.com", password="x", role="owner"
+        )
+        self.verifier = User.objects.create_user(
+            username="gate",
+            email="gate@example.com",
+            password="x",
+            role="verifier",
+            owner=self.owner,
+        )
+        self.batch = CodeBatch.objects.create(
+            name="Soirée", quantity=2, created_by=self.owner
+        )
+        self.client.force_login(self.verifier)
+
+
+class VerifyCodeTestCase(VerifierSetupMixin, TestCase):
+    def _verify(self, secure_index):
+        return self.client.post(
+            reverse("qrgenerator:verify_code"), {"secure_index": secure_index}
+        ).json()
+
+    def test_redeem_once(self):
+        code = make_code(self.batch, "a" * 64)
+        first = self._verify(code.secure_index)
+        self.assertTrue(first["success"])
+        self.assertEqual(first["batch_name"], "Soirée")
+
+        second = self._verify(code.secure_index)
+        self.assertFalse(second["success"])
+        self.assertEqual(second["status"], "utilise")
+
+        code.refresh_from_db()
+        self.assertEqual(code.status, "utilise")
+        self.assertIsNotNone(code.used_at)
+
+    def test_expired_and_unknown(self):
+        code = make_code(self.batch, "b" * 64, days=-1)
+        self.assertEqual(self._verify(code.secure_index)["status"], "expire")
+        code.refresh_from_db()
+        self.assertEqual(code.status, "expire")
+        self.assertFalse(self._verify("c" * 64)["success"])
+
+    def test_other_owner_codes_are_not_found(self):
+        other = get_user_model().objects.create_user(
+            username="other", email="other@example.com", password="x", role="owner"
+        )
+        foreign = CodeBatch.objects.create(name="Autre", quantity=1, created_by=other)
+        make_code(foreign, "d" * 64)
+        self.assertEqual(
+            self._verify("d" * 64)["message"], "Code introuvable ou non autorisé"
+        )
+
+
+class OfflineSyncTestCase(VerifierSetupMixin, TestCase):
+    def _sync(self, scans):
+        return self.client.post(
+            reverse("qrgenerator:verify_sync"),
+            json.dumps({"scans": scans}),
+            content_type="application/json",
+        ).json()["results"]
+
+    def test_first_scan_wins(self):
+        code = make_code(self.batch, "a" * 64)
+        expired = make_code(self.batch, "b" * 64, days=-1)
+        t0 = timezone.now() - timedelta(minutes=10)
+
+        results = self._sync(
+            [
+                {"secure_index": code.secure_index, "scanned_at": (t0 + timedelta(minutes=2)).isoformat()},
+                {"secure_index": code.secure_index, "scanned_at": t0.isoformat()},
+                {"secure_index": expired.secure_index, "scanned_at": t0.isoformat()},
+                {"secure_index": "f" * 64, "scanned_at": t0.isoformat()},
+                {"secure_index": code.secure_index},
+            ]
+        )
+        self.assertEqual(
+            [r["verdict"] for r in results],
+            ["doublon", "valide", "expire", "introuvable", "invalide"],
+        )
+        code.refresh_from_db()
+        self.assertEqual((code.status, code.used_at), ("utilise", t0))
+
+    def test_earlier_device_takes_over(self):
+        """Un terminal synchronisé plus tard mais ayant scanné avant gagne"""
+        code = make_code(self.batch, "a" * 64)
+        t0 = timezone.now() - timedelta(minutes=10)
+        later = {"secure_index": code.secure_index, "scanned_at": (t0 + timedelta(minutes=5)).isoformat()}
+        earlier = {"secure_index": code.secure_index, "scanned_at": t0.isoformat()}
+
+        self.assertEqual(self._sync([later])[0]["verdict"], "valide")
+        self.assertEqual(self._sync([earlier])[0]["verdict"], "valide")
+        self.assertEqual(self._sync([later])[0]["verdict"], "utilise")
+        code.refresh_from_db()
+        self.assertEqual(code.used_at, t0)
+
+    def test_constant_query_count(self):
+        scans = [
+            {"secure_index": make_code(self.batch, f"{i:064x}").secure_index, "scanned_at": timezone.now().isoformat()}
+            for i in range(50)
+        ]
+        # SAVEPOINT, SELECT, UPDATE des codes, UPDATE des compteurs (lot et
+        # owner), RELEASE : indépendant du nombre de scans
+        with self.assertNumQueries(6):
+            verdicts = RedemptionService.redeem_offline(scans, self.owner.pk)
+        self.assertTrue(all(v.verdict == "valide" for v in verdicts))
+
+
+class OfflineBundleTestCase(VerifierSetupMixin, TestCase):
+    def test_bundle_lookup_and_delta(self):
+        valid = [make_code(self.batch, str(i) * 64) for i in (3, 1, 2)]
+        make_code(self.batch, "e" * 64, days=-1)
+        make_code(self.batch, "f" * 64, status="utilise")
+
+        response = self.client.get(
+            reverse("qrgenerator:batch_bundle", args=[self.batch.pk])
+        )
+        bundle = OfflineBundle(response.content)
+        self.assertEqual((bundle.batch_id, bundle.count), (self.batch.pk, 3))
+        for code in valid:
+            self.assertTrue(bundle.is_redeemable(code.secure_index))
+        for secure_index in ("e" * 64, "f" * 64, "0" * 64, "pas-hexa"):
+            self.assertFalse(bundle.is_redeemable(secure_index))
+
+        RedemptionService.redeem(valid[0].secure_index, self.owner.pk)
+        delta = self.client.get(
+            reverse("qrgenerator:batch_bundle_delta", args=[self.batch.pk]),
+            {"since": bundle.version},
+        ).json()
+        self.assertEqual(
+            delta["changes"],
+            [{"secure_index": valid[0].secure_index, "status": "utilise"}],
+        )
+        bundle.apply_delta(delta)
+        self.assertFalse(bundle.is_redeemable(valid[0].secure_index))
+        self.assertTrue(bundle.is_redeemable(valid[1].secure_index))
+
+    def test_delta_requires_version(self):
+        url = reverse("qrgenerator:batch_bundle_delta", args=[self.batch.pk])
+        self.assertEqual(self.client.get(url).status_code, 400)
+        # Entier hors de la plage des dates
+        for since in ("100000000000000000000", "-100000000000000000000", "9" * 400):
+            response = self.client.get(url, {"since": since})
+            self.assertEqual(response.status_code, 400)
+
+    def test_rejects_corrupted_bundle(self):
+        data = BundleService.build(self.batch)
+        with self.assertRaises(ValueError):
+            OfflineBundle(b"XXXX" + data[4:])
+
+
+@override_settings(QR_IMAGE_MODE="lazy")
+class StatusCountersTestCase(VerifierSetupMixin, TestCase):
+    def _counters(self):
+        self.batch.refresh_from_db()
+        stats = OwnerStats.objects.get(owner=self.owner)
+        batch = [
+            self.batch.codes_total,
+            self.batch.codes_non_utilise,
+            self.batch.codes_utilise,
+            self.batch.codes_expire,
+        ]
+        owner = [
+            stats.codes_total,
+            stats.codes_non_utilise,
+            stats.codes_utilise,
+            stats.codes_expire,
+        ]
+        self.assertEqual(batch, owner)
+        return batch
+
+    def test_counters_follow_status_changes(self):
+        StatsService.batch_created(self.batch)
+        BatchGenerationService.generate(
+            self.batch, 3, timezone.now() + timedelta(days=1), workers=1
+        )
+        self.assertEqual(self._counters(), [3, 3, 0, 0])
+
+        first, second, third = self.batch.codes.all()
+        RedemptionService.redeem(first.secure_index, self.owner.pk)
+        RedemptionService.redeem(first.secure_index, self.owner.pk)
+        self.assertEqual(self._counters(), [3, 2, 1, 0])
+
+        Code.objects.filter(pk=second.pk).update(
+            expiration_date=timezone.now() - timedelta(days=1)
+        )
+        RedemptionService.redeem(second.secure_index, self.owner.pk)
+        scan = {"secure_index": third.secure_index, "scanned_at": "2020-01-01T00:00"}
+        RedemptionService.redeem_offline([scan], self.owner.pk)
+        self.assertEqual(self._counters(), [3, 0, 2, 1])
+        self.assertEqual(StatsService.for_owner(self.owner).batches, 1)
+
+    def test_reconcile_repairs_drift(self):
+        make_code(self.batch, "a" * 64)
+        make_code(self.batch, "b" * 64, status="utilise")
+        self.assertEqual(StatsService.reconcile(), (1, 1))
+        self.assertEqual(self._counters(), [2, 1, 1, 0])
+        self.assertEqual(OwnerStats.objects.get(owner=self.owner).batches, 1)
+
+        CodeBatch.objects.filter(pk=self.batch.pk).update(codes_utilise=7)
+        call_command("reconcile_stats", stdout=open(os.devnull, "w"))
+        self.assertEqual(self._counters(), [2, 1, 1, 0])
+        self.assertEqual(StatsService.reconcile(), (0, 0))
+
+    @override_settings(STORAGES=PLAIN_STORAGES)
+    def test_dashboard_excludes_pending_expirations(self):
+        # Échu mais pas encore balayé : non_utilise, mais pas actif
+        make_code(self.batch, "a" * 64)
+        make_code(self.batch, "b" * 64, days=-1)
+        StatsService.reconcile()
+        self.assertEqual(self._counters(), [2, 2, 0, 0])
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("qrgenerator:dashboard"))
+        self.assertEqual(response.context["stats"]["codes_actifs"], 1)
+
+
+class ExpirySweepTestCase(VerifierSetupMixin, TestCase):
+    def test_sweep_in_chunks(self):
+        for i in range(5):
+            make_code(self.batch, f"{i}" * 64, days=-1 if i % 2 else 1)
+        make_code(self.batch, "9" * 64, days=-1, status="utilise")
+        StatsService.reconcile()
+        first_pk = self.batch.codes.order_by("id").first().pk
+
+        expired, next_pk = ExpiryService.sweep(chunk_size=2, start_pk=first_pk)
+        self.assertEqual(expired, 2)
+        self.assertEqual(next_pk, first_pk + 6)
+        self.assertEqual(
+            sorted(self.batch.codes.values_list("status", flat=True)),
+            ["expire", "expire", "non_utilise", "non_utilise", "non_utilise", "utilise"],
+        )
+        self.batch.refresh_from_db()
+        self.assertEqual((self.batch.codes_non_utilise, self.batch.codes_expire), (3, 2))
+
+        # Reprise : rien de plus à faire
+        self.assertEqual(ExpiryService.sweep(start_pk=first_pk)[0], 0)
+
+    def test_command_reports_rate(self):
+        make_code(self.batch, "a" * 64, days=-1)
+        out = StringIO()
+        call_command("expire_codes", "--chunk-size", "10", stdout=out)
+        self.assertIn("1 code(s) expiré(s)", out.getvalue())
+        self.assertIn("lignes/s", out.getvalue())
+
+
+class KeysetPaginationTestCase(VerifierSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(45):
+            status = "utilise" if i % 3 else "non_utilise"
+            make_code(self.batch, f"{i:064x}", status=status)
+        # Horodatages en double : l'id départage
+        Code.objects.filter(pk__in=self.batch.codes.values("pk")[:10]).update(
+            created_at=timezone.now()
+        )
+        self.expected = list(
+            self.batch.codes.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+
+    def test_walk_forward_and_back(self):
+        paginator = KeysetPaginator(self.batch.codes.all(), 10)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(after=pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [10, 10, 10, 10, 5])
+        self.assertEqual([c.id for page in pages for c in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        back = paginator.page(before=pages[2].previous_cursor)
+        self.assertEqual([c.id for c in back], [c.id for c in pages[1]])
+        first = paginator.page(before=back.previous_cursor)
+        self.assertEqual([c.id for c in first], [c.id for c in pages[0]])
+        self.assertFalse(first.has_previous())
+
+    def test_batch_detail_with_status_filter(self):
+        self.client.force_login(self.owner)
+        url = reverse("qrgenerator:batch_detail", args=[self.batch.pk])
+        with self.settings(STORAGES=PLAIN_STORAGES):
+            page = self.client.get(url, {"status": "utilise"}).context["page_obj"]
+            following = self.client.get(
+                url, {"status": "utilise", "after": page.next_cursor}
+            ).context["page_obj"]
+            invalid = self.client.get(url, {"after": "%%%"}).context["page_obj"]
+        self.assertEqual((len(page), len(following)), (20, 10))
+        self.assertTrue(all(c.status == "utilise" for c in [*page, *following]))
+        self.assertEqual([c.id for c in invalid], self.expected[:20])
+
+
+def zbar_available():
+    try:
+        import pyzbar.pyzbar  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def image_upload(size=(64, 64), fmt="PNG", name="photo.png"):
+    buffer = BytesIO()
+    Image.new("L", size, 255).save(buffer, format=fmt)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class QRDecodeTestCase(VerifierSetupMixin, TestCase):
+    def _upload(self, qr_image):
+        return self.client.post(
+            reverse("qrgenerator:verify_code"), {"qr_image": qr_image}
+        ).json()
+
+    @override_settings(QR_UPLOAD_MAX_BYTES=100)
+    def test_rejects_oversized_file(self):
+        response = self._upload(image_upload())
+        self.assertEqual(response["message"], "Image trop volumineuse")
+
+    @override_settings(QR_UPLOAD_MAX_PIXELS=1000)
+    def test_rejects_oversized_dimensions(self):
+        response = self._upload(image_upload(size=(100, 100)))
+        self.assertEqual(response["message"], "Image trop grande")
+
+    def test_rejects_non_image(self):
+        response = self._upload(SimpleUploadedFile("photo.png", b"pas une image"))
+        self.assertEqual(response["message"], "Fichier image non reconnu")
+
+    def test_prepare_downscales_to_grayscale(self):
+        data = image_upload(size=(4000, 3000), fmt="JPEG").read()
+        image = QRDecodeService.prepare(data, 1024)
+        self.assertEqual(image.mode, "L")
+        self.assertEqual(max(image.size), 1024)
+
+    @skipUnless(zbar_available(), "bibliothèque zbar absente")
+    def test_decodes_rendered_code(self):
+        code = make_code(self.batch, "a" * 64)
+        png = QRCodeService.render_png(code.secure_index)
+        self.assertEqual(QRDecodeService.decode_image(png), code.secure_index)
+        response = self._upload(SimpleUploadedFile("qr.png", png))
+        self.assertTrue(response["success"])
+
+
+def zip_upload(files):
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return SimpleUploadedFile("groupe.zip", buffer.getvalue())
+
+
+class GroupVerificationTestCase(VerifierSetupMixin, TestCase):
+    def _upload(self, upload):
+        return self.client.post(
+            reverse("qrgenerator:verify_group"), {"qr_image": upload}
+        )
+
+    def test_redeem_many_is_set_based(self):
+        codes = [make_code(self.batch, f"{i}" * 64) for i in range(1, 6)]
+        indexes = [code.secure_index for code in codes]
+        RedemptionService.redeem(indexes[0], self.owner.pk)
+        with self.assertNumQueries(6):
+            verdicts = RedemptionService.redeem_many(
+                indexes + [indexes[1], "f" * 64], self.owner.pk
+            )
+        self.assertEqual(
+            [v.verdict for v in verdicts],
+            ["utilise", "valide", "valide", "valide", "valide", "doublon", "introuvable"],
+        )
+
+    @override_settings(QR_ARCHIVE_MAX_FILES=2)
+    def test_rejects_archive_with_too_many_files(self):
+        response = self._upload(zip_upload({f"{i}.png": b"x" for i in range(3)}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["message"], "Trop de fichiers dans l'archive")
+
+    @override_settings(QR_ARCHIVE_MAX_BYTES=1000)
+    def test_rejects_archive_expanding_too_much(self):
+        response = self._upload(zip_upload({"a.png": b"\0" * 5000}))
+        self.assertEqual(
+            response.json()["message"], "Archive trop volumineuse une fois décompressée"
+        )
+
+    def test_reports_unreadable_archive_entries(self):
+        response = self._upload(zip_upload({"notes.txt": b"pas une image"})).json()
+        self.assertEqual(
+            response["errors"],
+            [{"source": "notes.txt", "message": "Fichier image non reconnu"}],
+        )
+        self.assertFalse(response["success"])
+
+    @skipUnless(zbar_available(), "bibliothèque zbar absente")
+    def test_sheet_of_tickets(self):
+        codes = [make_code(self.batch, f"{i}" * 64) for i in range(1, 4)]
+        sheet = Image.new("L", (1200, 450), 255)
+        for position, code in enumerate(codes):
+            png = QRCodeService.render_png(code.secure_index)
+            sheet.paste(Image.open(BytesIO(png)), (position * 400, 0))
+        buffer = BytesIO()
+        sheet.save(buffer, format="PNG")
+
+        response = self._upload(zip_upload({"planche.png": buffer.getvalue()})).json()
+        self.assertEqual(response["valid"], 3)
+
+
+class ScannerAPITestCase(VerifierSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.logout()
+        DeviceTokenService.clear_cache()
+        self.token, raw_token = DeviceTokenService.issue(self.owner, "Porte A")
+        self.auth = {"authorization": f"Bearer {raw_token}"}
+
+    def _verify(self, secure_index, **headers):
+        return self.client.post(
+            "/api/verify",
+            json.dumps({"secure_index": secure_index}),
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def test_redeem_with_cached_token(self):
+        code = make_code(self.batch, "a" * 64)
+        self.assertEqual(
+            self._verify(code.secure_index, **self.auth).json(),
+            {"ok": True, "status": "valide", "code_id": code.pk},
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self._verify(code.secure_index, **self.auth)
+        self.assertEqual(response.json()["status"], "utilise")
+        # Ni jeton, ni session, ni utilisateur : le cache et le court-circuit suffisent
+        tables = " ".join(query["sql"] for query in queries.captured_queries)
+        for table in ("devicetoken", "django_session", "accounts_customuser"):
+            self.assertNotIn(table, tables)
+        self.assertNotIn("csrftoken", response.cookies)
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self._verify("a" * 64).status_code, 401)
+        self.assertEqual(
+            self._verify("a" * 64, authorization="Bearer inconnu").status_code, 401
+        )
+        self.assertEqual(self.client.get("/api/verify").status_code, 405)
+        response = self.client.post(
+            "/api/verify", "{", content_type="application/json", headers=self.auth
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_revoked_token(self):
+        self.assertEqual(self._verify("a" * 64, **self.auth).status_code, 200)
+        DeviceTokenService.revoke(self.token)
+        self.assertEqual(self._verify("a" * 64, **self.auth).status_code, 401)
+
+    def test_status_does_not_redeem(self):
+        code = make_code(self.batch, "a" * 64)
+        response = self.client.get(
+            "/api/status", {"secure_index": code.secure_index}, headers=self.auth
+        )
+        self.assertEqual(response.json()["status"], "non_utilise")
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        code.refresh_from_db()
+        self.assertEqual(code.status, "non_utilise")
+        response = self.client.get(
+            "/api/status", {"secure_index": "b" * 64}, headers=self.auth
+        )
+        self.assertEqual(response.json()["status"], RedemptionService.NOT_FOUND)
+
+
+class AsyncScannerAPITestCase(VerifierSetupMixin, TestCase):
+    """Même API servie par la pile ASGI (vues async, ORM async)"""
+
+    def setUp(self):
+        super().setUp()
+        DeviceTokenService.clear_cache()
+        self.token, raw_token = DeviceTokenService.issue(self.owner, "Porte A")
+        self.auth = {"authorization": f"Bearer {raw_token}"}
+
+    async def test_verify_then_status(self):
+        code = await Code.objects.acreate(
+            batch=self.batch,
+            secure_index="a" * 64,
+            expiration_date=timezone.now() + timedelta(days=1),
+        )
+        response = await self.async_client.post(
+            "/api/verify",
+            json.dumps({"secure_index": code.secure_index}),
+            content_type="application/json",
+            headers=self.auth,
+        )
+        self.assertEqual(
+            response.json(), {"ok": True, "status": "valide", "code_id": code.pk}
+        )
+        response = await self.async_client.get(
+            "/api/status", {"secure_index": code.secure_index}, headers=self.auth
+        )
+        self.assertEqual(response.json()["status"], "utilise")
+        self.assertIsNotNone(response.json()["used_at"])
+        batch = await CodeBatch.objects.aget(pk=self.batch.pk)
+        self.assertEqual(batch.codes_utilise, 1)
+
+    async def test_rejects_bad_requests(self):
+        response = await self.async_client.post(
+            "/api/verify", "{}", content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.post(
+            "/api/verify", "{", content_type="application/json", headers=self.auth
+        )
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.post("/api/verify_image", headers=self.auth)
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(QR_LIVE_POLL_INTERVAL=3600)
+class LiveFeedTestCase(VerifierSetupMixin, TestCase):
+    """Le sondage est déclenché à la main ; le thread de fond dort"""
+
+    def setUp(self):
+        super().setUp()
+        LiveFeed._counters, LiveFeed._seen, LiveFeed._since = {}, {}, None
+        self.subscription = LiveFeed.subscribe(self.owner.pk)
+
+    def tearDown(self):
+        LiveFeed.unsubscribe(self.subscription)
+
+    def _drain(self):
+        events = []
+        while not self.subscription.queue.empty():
+            events.append(self.subscription.queue.get_nowait())
+        return events
+
+    def test_poll_pushes_changes_only(self):
+        code = make_code(self.batch, "a" * 64)
+        LiveFeed.poll()
+        self._drain()
+        # Rien n'a bougé : une requête, aucun événement
+        with self.assertNumQueries(1):
+            LiveFeed.poll()
+        self.assertEqual(self._drain(), [])
+
+        make_code(self.batch, "c" * 64, days=-1)  # échu, pas encore balayé
+        StatsService.reconcile()
+        RedemptionService.redeem(code.secure_index, self.owner.pk)
+        # Compteurs, codes échus de l'owner, détail des validations
+        with self.assertNumQueries(3):
+            LiveFeed.poll()
+        events = {event["event"]: event["data"] for event in self._drain()}
+        self.assertEqual(events["counters"]["batch_id"], self.batch.pk)
+        self.assertEqual(events["counters"]["codes_utilise"], 1)
+        self.assertEqual(events["totals"]["codes_utilise"], 1)
+        self.assertEqual(events["totals"]["codes_non_utilise"], 1)
+        self.assertEqual(events["totals"]["codes_actifs"], 0)
+        self.assertEqual(events["redemption"]["code_id"], code.pk)
+        # Déjà diffusée : la fenêtre de rattrapage ne la renvoie pas
+        LiveFeed.poll()
+        self.assertEqual(self._drain(), [])
+
+    def test_other_owner_not_notified(self):
+        other = get_user_model().objects.create_user(
+            username="other", password="x", role="owner"
+        )
+        other_batch = CodeBatch.objects.create(
+            name="Autre", quantity=1, created_by=other
+        )
+        code = make_code(other_batch, "b" * 64)
+        LiveFeed.poll()
+        self._drain()
+        RedemptionService.redeem(code.secure_index, other.pk)
+        LiveFeed.poll()
+        self.assertEqual(self._drain(), [])
+
+    def test_wsgi_refuses_stream(self):
+        # Un flux tiendrait le worker synchrone : 204, le navigateur abandonne
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("qrgenerator:live_feed"))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(len(LiveFeed._subscribers[self.owner.pk]), 1)
+
+    @override_settings(STORAGES=PLAIN_STORAGES)
+    def test_pages_subscribe_only_with_live_url(self):
+        self.client.force_login(self.owner)
+        pages = [
+            reverse("qrgenerator:dashboard"),
+            reverse("qrgenerator:batch_detail", args=[self.batch.pk]),
+        ]
+        live_url = reverse("qrgenerator:live_feed")
+        for url in pages:
+            self.assertNotContains(self.client.get(url), live_url)
+        with override_settings(QR_LIVE_URL=live_url):
+            for url in pages:
+                self.assertContains(self.client.get(url), f'data-url="{live_url}"')
+
+    async def test_async_stream(self):
+        await self.async_client.aforce_login(self.owner)
+        response = await self.async_client.get(reverse("qrgenerator:live_feed"))
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b"retry:"))
+        self.assertTrue((await anext(chunks)).startswith(b"event: counters"))
+        await chunks.aclose()
+
+
+class BenchCompareTestCase(TestCase):
+    def test_regressions_follow_metric_direction(self):
+        baseline = {"verify": {"c1_p99_ms": 10, "c1_req_per_sec": 100, "quantity": 200}}
+        current = {"verify": {"c1_p99_ms": 10.5, "c1_req_per_sec": 80, "quantity": 999}}
+        rows = {row[1]: row[-1] for row in compare_results(baseline, current, 0.10)}
+        # +5 % de latence sous le seuil ; -20 % de débit signalé ; quantity ignorée
+        self.assertEqual(rows, {"c1_p99_ms": False, "c1_req_per_sec": True})
+
+
+class GateLoadTestCase(TestCase):
+    def test_seed_plan_and_cleanup(self):
+        mix = loadtest.parse_mix("valid=6,duplicate=2,expired=1,unknown=1")
+        seed = loadtest.seed(loadtest.fresh_needed(40, mix), 10, verifiers=2)
+        verifiers = get_user_model().objects.filter(owner=seed.owner)
+        self.assertEqual(
+            sorted(verifiers.values_list("role", flat=True)), ["verifier"] * 2
+        )
+        scans = loadtest.plan_scans(seed, 40, mix, random.Random(0))
+        fresh = [scan.secure_index for scan in scans if scan.kind == "valid"]
+        self.assertEqual(len(fresh), len(set(fresh)))
+        # Un doublon répète toujours un code déjà scanné avant lui
+        for position, scan in enumerate(scans):
+            if scan.kind == "duplicate":
+                self.assertIn(
+                    scan.secure_index,
+                    [earlier.secure_index for earlier in scans[:position]],
+                )
+        loadtest.cleanup(seed)
+        self.assertFalse(get_user_model().objects.filter(pk=seed.owner.pk).exists())
+        self.assertFalse(Code.objects.filter(secure_index__in=fresh).exists())
+
+    def test_parse_mix_rejects_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix("valid=1,teleport=2")
+
+
+@override_settings(QR_SERVER_TIMING=True)
+class ServerTimingTestCase(VerifierSetupMixin, TestCase):
+    def test_lock_wait_header(self):
+        code = make_code(self.batch, "a" * 64)
+        response = self.client.post(
+            reverse("qrgenerator:verify_code"), {"secure_index": code.secure_index}
+        )
+        timings = dict(
+            part.strip().split(";dur=") for part in response["Server-Timing"].split(",")
+        )
+        self.assertEqual(set(timings), {"db", "lock", "total"})
+        self.assertGreater(float(timings["lock"]), 0)
+
+    @override_settings(QR_SERVER_TIMING=False)
+    def test_disabled_by_default(self):
+        response = self.client.post(
+            reverse("qrgenerator:verify_code"), {"secure_index": "a" * 64}
+        )
+        self.assertNotIn("Server-Timing", response)
+
+
+class MetricsTestCase(VerifierSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def test_verify_code_metrics(self):
+        code = make_code(self.batch, "a" * 64)
+        for _ in range(2):
+            self.client.post(
+                reverse("qrgenerator:verify_code"), {"secure_index": code.secure_index}
+            )
+        totals = metrics.collect()
+        view = "qrgenerator:verify_code"
+        self.assertEqual(totals[("qr_redemptions_total", (view, "valide"))], 1)
+        self.assertEqual(totals[("qr_redemptions_total", (view, "utilise"))], 1)
+        self.assertEqual(
+            totals[("qr_http_requests_total", (view, "POST", "200"))], 2
+        )
+        self.assertGreater(totals[("qr_db_queries_total", (view,))], 2)
+        self.assertEqual(
+            sum(totals[("qr_http_request_duration_seconds", (view,))][:-1]), 2
+        )
+
+    def test_api_view_label_and_token_cache(self):
+        _, raw_token = DeviceTokenService.issue(self.owner, "Porte A")
+        for _ in range(2):
+            self.client.post(
+                reverse("api_verify"),
+                {"secure_index": "b" * 64},
+                content_type="application/json",
+                HTTP_AUTHORIZATION=f"Bearer {raw_token}",
+            )
+        totals = metrics.collect()
+        key = ("qr_redemptions_total", ("api_verify", "introuvable"))
+        self.assertEqual(totals[key], 2)
+        self.assertEqual(
+            totals[("qr_cache_requests_total", ("device_token", "hit"))], 1
+        )
+
+    def test_threads_are_summed(self):
+        metrics.observe("qr_stage_duration_seconds", 0.003, ("test",))
+        thread = threading.Thread(
+            target=metrics.observe, args=("qr_stage_duration_seconds", 20, ("test",))
+        )
+        thread.start()
+        thread.join()
+        text = metrics.render()
+        tags = f'stage="test",pid="{os.getpid()}"'
+        self.assertIn(f'qr_stage_duration_seconds_bucket{{{tags},le="0.005"}} 1', text)
+        self.assertIn(f'qr_stage_duration_seconds_bucket{{{tags},le="+Inf"}} 2', text)
+        self.assertIn(f"qr_stage_duration_seconds_count{{{tags}}} 2", text)
+
+    def test_finished_threads_are_folded(self):
+        # Un thread par requête : les dictionnaires des threads terminés ne
+        # s'accumulent pas, leurs valeurs restent comptées
+        stores = len(metrics._stores)
+        for _ in range(50):
+            thread = threading.Thread(
+                target=metrics.inc, args=("qr_generated_codes_total",)
+            )
+            thread.start()
+            thread.join()
+        self.assertLessEqual(len(metrics._stores), stores + 1)
+        self.assertEqual(metrics.collect()[("qr_generated_codes_total", ())], 50)
+
+    def test_render_stages(self):
+        QRCodeService.render_png("c" * 64)
+        totals = metrics.collect()
+        for stage in ("qr_matrix", "png_encode"):
+            self.assertEqual(
+                sum(totals[("qr_stage_duration_seconds", (stage,))][:-1]), 1
+            )
+
+    @override_settings(QR_METRICS_TOKEN="scrape-secret", STORAGES=PLAIN_STORAGES)
+    def test_endpoint_access(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+        response = self.client.get(
+            reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape-secret"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        self.assertIn(
+            "# TYPE qr_http_request_duration_seconds histogram",
+            response.content.decode(),
+        )
+
+
+class ProfilerTestCase(VerifierSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.profile_dir = tempfile.mkdtemp()
+        settings_override = override_settings(
+            QR_PROFILE=True,
+            QR_PROFILE_SAMPLE_RATE=1,
+            QR_PROFILE_VIEWS=["verify_code"],
+            QR_PROFILE_DIR=self.profile_dir,
+            QR_PROFILE_MAX_FILES=2,
+            STORAGES=PLAIN_STORAGES,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _scan(self):
+        return self.client.post(
+            reverse("qrgenerator:verify_code"), {"secure_index": "a" * 64}
+        )
+
+    def test_sampled_view_is_profiled_with_rotation(self):
+        for _ in range(3):
+            self._scan()
+        _, raw_token = DeviceTokenService.issue(self.owner, "Porte A")
+        self.client.get(
+            reverse("api_status"),
+            {"secure_index": "a" * 64},
+            HTTP_AUTHORIZATION=f"Bearer {raw_token}",
+        )
+        entries = ProfileService.entries()
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(
+            {entry.view for entry in entries}, {"qrgenerator.verify_code"}
+        )
+        stats = pstats.Stats(ProfileService.path(entries[0].name))
+        self.assertTrue(
+            any(func[2] == "redeem" for func in stats.stats),
+            "RedemptionService.redeem absent du profil",
+        )
+
+    def test_latency_threshold(self):
+        with override_settings(QR_PROFILE_MIN_MS=60_000):
+            self._scan()
+        self.assertEqual(ProfileService.entries(), [])
+
+    def test_admin_only_listing_and_download(self):
+        self._scan()
+        name = ProfileService.entries()[0].name
+        url = reverse("qrgenerator:profile_download", args=[name])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        User = get_user_model()
+        User.objects.create_user(
+            username="admin", email="admin@example.com", password="x", role="admin"
+        )
+        self.client.login(username="admin", password="x")
+        response = self.client.get(reverse("qrgenerator:profile_list"))
+        self.assertContains(response, name)
+        response = self.client.get(url)
+        with open(ProfileService.path(name), "rb") as profile:
+            self.assertEqual(b"".join(response.streaming_content), profile.read())
+        missing = reverse("qrgenerator:profile_download", args=["db.sqlite3"])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ShardedStorageTestCase(TestCase):
+    def setUp(self):
+        self.batch = CodeBatch.objects.create(name="Stockage", quantity=4)
+        self.storage = Code._meta.get_field("qr_image").storage
+
+    def test_content_addressed_and_deduplicated(self):
+        first = self.storage.save("qr_codes_test/qr_a.png", ContentFile(b"png-1"))
+        again = self.storage.save("qr_codes_test/qr_b.png", ContentFile(b"png-1"))
+        other = self.storage.save("qr_codes_test/qr_c.png", ContentFile(b"png-2"))
+        self.assertEqual(first, again)
+        self.assertNotEqual(first, other)
+        self.assertTrue(ShardedStorage.is_sharded(first))
+        shard = os.path.dirname(self.storage.path(first))
+        self.assertEqual(os.listdir(shard), [os.path.basename(first)])
+
+    def test_migration_command(self):
+        flat = FileSystemStorage()
+        contents = [b"png-1", b"png-1", b"png-2", None]
+        codes = []
+        for i, content in enumerate(contents):
+            code = make_code(self.batch, f"{i:064x}")
+            code.qr_image.name = f"qr_codes/qr_{i:016x}.png"
+            if content is not None:
+                flat.save(code.qr_image.name, ContentFile(content))
+            code.save(update_fields=["qr_image"])
+            codes.append(code)
+
+        call_command("migrate_qr_storage", chunk_size=2, stdout=StringIO())
+        for code, content in zip(codes, contents):
+            code.refresh_from_db()
+            if content is None:
+                self.assertEqual(
+                    code.qr_image.name, "qr_codes/qr_0000000000000003.png"
+                )
+                continue
+            self.assertTrue(code.qr_image.name.startswith("qr_codes_test/"))
+            self.assertTrue(ShardedStorage.is_sharded(code.qr_image.name))
+            with code.qr_image.open("rb") as qr_file:
+                self.assertEqual(qr_file.read(), content)
+        self.assertEqual(codes[0].qr_image.name, codes[1].qr_image.name)
+        self.assertEqual(os.listdir(flat.path("qr_codes")), [])
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), QR_IMAGE_MODE="pack", QR_RENDER_CACHE_BYTES=0
+)
+class PackStorageTestCase(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(
+            username="owner", email="owner@example.com", password="x", role="owner"
+        )
+        self.client.force_login(self.owner)
+        self.batch = CodeBatch.objects.create(
+            name="Pack", quantity=5, created_by=self.owner
+        )
+        BatchGenerationService.generate(
+            self.batch, 5, timezone.now() + timedelta(days=1), workers=1, chunk_size=2
+        )
+        # L'id du lot est réutilisé après l'annulation de la transaction du test
+        self.addCleanup(os.remove, PackService.path(self.batch.pk))
+        self.addCleanup(PackService.close_all)
+
+    def test_one_append_only_file_per_batch(self):
+        codes = list(self.batch.codes.order_by("id"))
+        self.assertFalse(any(code.qr_image for code in codes))
+        self.assertEqual(codes[0].pack_offset, len(MAGIC))
+        for previous, code in zip(codes, codes[1:]):
+            self.assertEqual(
+                code.pack_offset, previous.pack_offset + previous.pack_length
+            )
+        with open(PackService.path(self.batch.pk), "rb") as pack:
+            data = pack.read()
+        self.assertTrue(data.startswith(MAGIC))
+        self.assertEqual(len(data), codes[-1].pack_offset + codes[-1].pack_length)
+        for code in codes:
+            self.assertEqual(
+                PackService.read(self.batch.pk, code.pack_offset, code.pack_length),
+                QRCodeService.render_png(code.secure_index),
+            )
+
+    def test_download_and_export_read_the_pack(self):
+        code = self.batch.codes.order_by("id").last()
+        expected = QRCodeService.render_png(code.secure_index)
+        response = self.client.get(
+            reverse("qrgenerator:code_download_qr", args=[code.pk])
+        )
+        self.assertEqual(response.content, expected)
+
+        response = self.client.get(
+            reverse("qrgenerator:batch_export", args=[self.batch.pk])
+        )
+        archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(len(archive.infolist()), 5)
+        self.assertEqual(
+            archive.read(f"qr_{code.id}_{code.secure_index[:16]}.png"), expected
+        )
+
+    def test_mapping_follows_a_growing_pack(self):
+        PackService.read(self.batch.pk, len(MAGIC), 1)
+        [(offset, length)] = PackService.append(self.batch.pk, [b"appended"])
+        self.assertEqual(PackService.read(self.batch.pk, offset, length), b"appended")
+
+
+def query_plan(sql):
+    """Plan d'exécution d'une requête SQL déjà interpolée"""
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            # Tables de test presque vides : forcer l'usage des index
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}")
+        return "\n".join(" ".join(map(str, row)) for row in cursor.fetchall())
+
+
+def plan_problems(plan):
+    """Parcours séquentiel ou tri de la table des codes dans un plan"""
+    problems = []
+    for line in plan.splitlines():
+        if connection.vendor == "sqlite":
+            if "SCAN qrgenerator_code" in line and "USING" not in line:
+                problems.append(line)
+            if "TEMP B-TREE" in line:
+                problems.append(line)
+        elif "Seq Scan on qrgenerator_code " in line or "Sort" in line:
+            problems.append(line)
+    return problems
+
+
+@override_settings(QR_IMAGE_MODE="lazy", STORAGES=PLAIN_STORAGES)
+class QueryPlanTestCase(VerifierSetupMixin, TestCase):
+    """EXPLAIN de chaque requête des vues sur qrgenerator_code"""
+
+    def _assert_indexed(self, method, name, args=(), data=None, **kwargs):
+        url = reverse(f"qrgenerator:{name}", args=args)
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, **kwargs)
+            b"".join(getattr(response, "streaming_content", []))
+        self.assertLess(response.status_code, 400, url)
+
+        checked = 0
+        for query in queries.captured_queries:
+            sql = query["sql"]
+            if '"qrgenerator_code"' not in sql or not sql.startswith("SELECT"):
+                continue
+            plan = query_plan(sql)
+            self.assertEqual(plan_problems(plan), [], f"{url}\n{sql}\n{plan}")
+            checked += 1
+        return checked
+
+    def test_owner_views(self):
+        code = make_code(self.batch, "a" * 64)
+        self.client.force_login(self.owner)
+        self.assertTrue(self._assert_indexed("get", "batch_detail", [self.batch.pk]))
+        self.assertTrue(
+            self._assert_indexed(
+                "get", "batch_detail", [self.batch.pk], {"status": "utilise"}
+            )
+        )
+        cursor = encode_cursor(code)
+        for params in (
+            {"after": cursor},
+            {"before": cursor},
+            {"after": cursor, "status": "utilise"},
+        ):
+            self._assert_indexed("get", "batch_detail", [self.batch.pk], params)
+        self.assertTrue(self._assert_indexed("get", "batch_export", [self.batch.pk]))
+        self.assertTrue(self._assert_indexed("get", "code_detail", [code.pk]))
+        self.assertTrue(self._assert_indexed("get", "code_qr_image", [code.pk]))
+        self.assertTrue(self._assert_indexed("get", "dashboard"))
+
+    def test_expiry_sweep_uses_primary_key_range(self):
+        with CaptureQueriesContext(connection) as queries:
+            ExpiryService.sweep_chunk(0, 5000, timezone.now())
+        plan = query_plan(queries.captured_queries[1]["sql"])
+        self.assertEqual(plan_problems(plan), [], plan)
+
+    def test_verifier_views(self):
+        make_code(self.batch, "a" * 64)
+        self.assertTrue(
+            self._assert_indexed("post", "verify_code", data={"secure_index": "a" * 64})
+        )
+        scans = {"scans": [{"secure_index": "b" * 64, "scanned_at": "2024-01-01"}]}
+        self.assertTrue(
+            self._assert_indexed(
+                "post",
+                "verify_sync",
+                data=json.dumps(scans),
+                content_type="application/json",
+            )
+        )
+        self.assertTrue(self._assert_indexed("get", "batch_bundle", [self.batch.pk]))
+        self.assertTrue(
+            self._assert_indexed(
+                "get", "batch_bundle_delta", [self.batch.pk], {"since": 0}
+            )
+        )
+
+
+class ConcurrentRedemptionTestCase(TransactionTestCase):
+    def test_single_winner(self):
+        """Sur N scans simultanés du même code, un seul réussit"""
+        owner = get_user_model().objects.create_user(
+            username="owner", email="owner@example.com", password="x", role="owner"
+        )
+        batch = CodeBatch.objects.create(name="Porte", quantity=1, created_by=owner)
+        code = make_code(batch, "e" * 64)
+
+        scans = 8
+        barrier = threading.Barrier(scans)
+        results = []
+
+        def scan():
+            try:
+                barrier.wait()
+                # La base de test SQLite en mémoire (cache partagé) peut
+                # refuser une écriture concurrente : le terminal re-scanne.
+                for _ in range(100):
+                    try:
+                        result = RedemptionService.redeem(code.secure_index, owner.pk)
+                    except OperationalError:
+                        time.sleep(0.01)
+                        continue
+                    results.append(result)
+                    break
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=scan) for _ in range(scans)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), scans)
+        self.assertEqual(sum(result.success for result in results), 1)
+        self.assertEqual(
+            {result.status for result in results if not result.success},
+            {RedemptionService.ALREADY_USED},
+        )
@@ -0,0 +1,107 @@
+import hashlib
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import metrics
+from .models import DeviceToken
+
+
+class DeviceTokenService:
+    """Jetons des terminaux de scan, résolus en owner via un cache en mémoire.
+
+    Le cache (par processus) évite toute requête d'authentification sur le
+    chemin chaud ; une révocation est vue par les autres processus au plus
+    tard après QR_DEVICE_TOKEN_CACHE_TTL secondes.
+    """
+
+    _cache = {}  # hash -> (owner_id, échéance monotonic)
+    _lock = threading.Lock()
+
+    @staticmethod
+    def hash(raw_token: str) -> str:
+        return hashlib.sha256(raw_token.encode()).hexdigest()
+
+    @classmethod
+    def clear_cache(cls):
+        with cls._lock:
+            cls._cache.clear()
+
+    @staticmethod
+    def issue(owner, name):
+        """Crée un jeton ; renvoie (DeviceToken, jeton en clair, affiché une fois)"""
+        raw_token = secrets.token_urlsafe(32)
+        token = DeviceToken.objects.create(
+            owner=owner,
+            name=name,
+            key_hash=DeviceTokenService.hash(raw_token),
+            prefix=raw_token[:8],
+        )
+        return token, raw_token
+
+    @classmethod
+    def revoke(cls, token):
+        DeviceToken.objects.filter(pk=token.pk, revoked_at=None).update(
+            revoked_at=timezone.now()
+        )
+        with cls._lock:
+            cls._cache.pop(token.key_hash, None)
+
+    @classmethod
+    def _cached(cls, key_hash):
+        with cls._lock:
+            cached = cls._cache.get(key_hash)
+        if cached is not None and cached[1] > time.monotonic():
+            metrics.inc("qr_cache_requests_total", ("device_token", "hit"))
+            return cached[0]
+        metrics.inc("qr_cache_requests_total", ("device_token", "miss"))
+        return None
+
+    @classmethod
+    def _remember(cls, key_hash, owner_id):
+        if owner_id is None:
+            return
+        with cls._lock:
+            if len(cls._cache) >= settings.QR_DEVICE_TOKEN_CACHE_SIZE:
+                cls._cache.clear()
+            cls._cache[key_hash] = (
+                owner_id,
+                time.monotonic() + settings.QR_DEVICE_TOKEN_CACHE_TTL,
+            )
+
+    @staticmethod
+    def _owner_ids(key_hash):
+        return DeviceToken.objects.filter(
+            key_hash=key_hash, revoked_at=None
+        ).values_list("owner_id", flat=True)
+
+    @classmethod
+    def owner_id(cls, raw_token: str):
+        """Owner d'un jeton valide, ou None"""
+        key_hash = cls.hash(raw_token)
+        owner_id = cls._cached(key_hash)
+        if owner_id is None:
+            owner_id = cls._owner_ids(key_hash).first()
+            cls._remember(key_hash, owner_id)
+        return owner_id
+
+    @classmethod
+    async def aowner_id(cls, raw_token: str):
+        """Variante async (ORM async) de owner_id"""
+        key_hash = cls.hash(raw_token)
+        owner_id = cls._cached(key_hash)
+        if owner_id is None:
+            owner_id = await cls._owner_ids(key_hash).afirst()
+            cls._remember(key_hash, owner_id)
+        return owner_id
+
+
+@receiver(setting_changed)
+def _reset_token_cache(setting, **kwargs):
+    if setting.startswith("QR_DEVICE_TOKEN_"):
+        DeviceTokenService.clear_cache()
@@ -5,6 +5,7 @@ app_name = "qrgenerator"
 
 urlpatterns = [
     path("", views.dashboard, name="dashboard"),  # Tableau de bord
+    path("live/", views.live_feed, name="live_feed"),  # Flux en direct (SSE)
     path("batches/", views.batch_list, name="batch_list"),  # Liste des lots
     path(
         "batches/create/", views.batch_create, name="batch_create"
@@ -12,14 +13,38 @@ urlpatterns = [
     path(
         "batches/<int:pk>/", views.batch_detail, name="batch_detail"
     ),  # Détails d'un lot
+    path(
+        "batches/<int:pk>/progress/", views.batch_progress, name="batch_progress"
+    ),  # Avancement de la génération
     path(
         "batches/<int:pk>/export/", views.batch_export, name="batch_export"
     ),  # Exportation des QR codes
+    path(
+        "batches/<int:pk>/bundle/", views.batch_bundle, name="batch_bundle"
+    ),  # Bundle de vérification hors ligne
+    path(
+        "batches/<int:pk>/bundle/delta/",
+        views.batch_bundle_delta,
+        name="batch_bundle_delta",
+    ),  # Changements depuis une version du bundle
     path("codes/<int:pk>/", views.code_detail, name="code_detail"),  # Détails d'un code
+    path(
+        "codes/<int:pk>/qr.png", views.code_qr_image, name="code_qr_image"
+    ),  # Image QR (affichage)
     path(
         "codes/<int:pk>/download_qr/", views.code_download_qr, name="code_download_qr"
     ),  # Télécharger l'image QR
     path(
         "verify_code/", views.verify_code, name="verify_code"
     ),  # Vérification d'un code
+    path(
+        "verify_code/group/", views.verify_group, name="verify_group"
+    ),  # Vérification d'un groupe de billets (photo ou archive)
+    path(
+        "verify_code/sync/", views.verify_sync, name="verify_sync"
+    ),  # Synchronisation des scans hors ligne
+    path("profiles/", views.profile_list, name="profile_list"),  # Profils (admins)
+    path(
+        "profiles/<str:name>", views.profile_download, name="profile_download"
+    ),  # Télécharger un profil
 ]
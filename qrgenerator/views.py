@@ -1,29 +1,49 @@
+import hmac
 import json
+import logging
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
-from django.core.paginator import Paginator
+from django.http import (
+    FileResponse,
+    Http404,
+    JsonResponse,
+    HttpResponse,
+    StreamingHttpResponse,
+)
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_POST
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction
-from datetime import timedelta
-from django.core.files.base import ContentFile
-from .models import CodeBatch, Code
-from .qrcode_service import QRCodeService
-import uuid
-from accounts.decorators import owner_required, verifier_allowed
+from . import metrics
+from .models import CodeBatch, Code, GenerationJob
+from .job_service import GenerationJobService
+from .export_service import ExportService
+from .redemption_service import RedemptionService
+from .bundle_service import BundleService, moment_of
+from .stats_service import StatsService
+from .live_service import LiveFeed
+from .profile_service import ProfileService
+from .pagination import KeysetPaginator
+from .decode_service import DecodeError, QRDecodeService
+from .qrcode_service import CONTENT_TYPES, ERROR_CORRECTION_LEVELS, QRCodeService
+from accounts.decorators import admin_required, owner_required, verifier_allowed
+
+logger = logging.getLogger(__name__)
 
 
 @login_required
 @owner_required
 def batch_list(request):
     """Liste des lots de codes"""
-    batches = CodeBatch.objects.filter(created_by=request.user).order_by("-created_at")
+    batches = CodeBatch.objects.filter(created_by=request.user)
 
-    # Pagination
-    paginator = Paginator(batches, 10)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # Pagination par curseur (created_at, id)
+    page_obj = KeysetPaginator(batches, 10).get_page(
+        request.GET.get("after"), request.GET.get("before")
+    )
 
     context = {"page_obj": page_obj, "title": "Gestion des lots de codes"}
     return render(request, "qrgenerator/batch_list.html", context)
@@ -37,6 +57,10 @@ def batch_create(request):
         name = request.POST.get("name")
         quantity = int(request.POST.get("quantity", 0))
         validity_days = int(request.POST.get("validity_days", 30))
+        qr_format = request.POST.get("qr_format", "png")
+        qr_module_size = int(request.POST.get("qr_module_size", 10))
+        qr_border = int(request.POST.get("qr_border", 4))
+        qr_error_correction = request.POST.get("qr_error_correction", "M")
 
         if not name or quantity <= 0 or quantity > 10000:
             messages.error(
@@ -44,53 +68,35 @@ def batch_create(request):
             )
             return redirect("qrgenerator:batch_create")
 
-        try:
-            with transaction.atomic():
-                # Créer le lot
-                batch = CodeBatch.objects.create(
-                    name=name,
-                    quantity=quantity,
-                    validity_days=validity_days,
-                    created_by=request.user,
-                    status="en_cours",
-                )
-
-                # Générer les codes
-                expiration_date = timezone.now() + timedelta(days=validity_days)
-
-                for _ in range(quantity):
-                    # Message unique pour chaque code
-                    message = f"{batch.id}:{uuid.uuid4()}:{timezone.now().isoformat()}"
-
-                    code = Code(batch=batch, expiration_date=expiration_date)
-
-                    # Génération crypto
-                    code.generate_crypto_fields(message)
-                    code.save()
-
-                    # Générer le QR code
-                    qr_buffer = QRCodeService.generate_qr_for_code(code)
-                    code.qr_image.save(
-                        f"qr_{code.secure_index[:16]}.png",
-                        ContentFile(qr_buffer.read()),
-                        save=True,
-                    )
-
-                # Marquer comme terminé
-                batch.status = "termine"
-                batch.save()
+        if (
+            qr_format not in ("png", "svg", "both")
+            or not 1 <= qr_module_size <= 40
+            or not 0 <= qr_border <= 10
+            or qr_error_correction not in ERROR_CORRECTION_LEVELS
+        ):
+            messages.error(request, "Profil de rendu QR invalide.")
+            return redirect("qrgenerator:batch_create")
 
-                messages.success(
-                    request, f'Lot "{name}" créé avec succès ({quantity} codes).'
-                )
-                return redirect("qrgenerator:batch_detail", pk=batch.pk)
+        with transaction.atomic():
+            # Créer le lot ; la génération est faite par `generation_worker`
+            batch = CodeBatch.objects.create(
+                name=name,
+                quantity=quantity,
+                validity_days=validity_days,
+                created_by=request.user,
+                status="en_cours",
+                qr_format=qr_format,
+                qr_module_size=qr_module_size,
+                qr_border=qr_border,
+                qr_error_correction=qr_error_correction,
+            )
+            GenerationJobService.enqueue(batch)
+            StatsService.batch_created(batch)
 
-        except Exception as e:
-            messages.error(request, f"Erreur lors de la création du lot: {str(e)}")
-            if "batch" in locals():
-                batch.status = "erreur"
-                batch.save()
-            return redirect("qrgenerator:batch_create")
+        messages.success(
+            request, f'Lot "{name}" en cours de génération ({quantity} codes).'
+        )
+        return redirect("qrgenerator:batch_detail", pk=batch.pk)
 
     context = {"title": "Créer un nouveau lot"}
     return render(request, "qrgenerator/batch_create.html", context)
@@ -109,19 +115,17 @@ def batch_detail(request, pk):
     if status_filter:
         codes = codes.filter(status=status_filter)
 
-    codes = codes.order_by("-created_at")
-
-    # Pagination
-    paginator = Paginator(codes, 20)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # Pagination par curseur : une page profonde coûte autant que la première
+    page_obj = KeysetPaginator(codes, 20).get_page(
+        request.GET.get("after"), request.GET.get("before")
+    )
 
-    # Statistiques
+    # Statistiques (compteurs dénormalisés, voir StatsService)
     stats = {
-        "total": batch.codes.count(),
-        "non_utilise": batch.codes.filter(status="non_utilise").count(),
-        "utilise": batch.codes.filter(status="utilise").count(),
-        "expire": batch.codes.filter(status="expire").count(),
+        "total": batch.codes_total,
+        "non_utilise": batch.codes_non_utilise,
+        "utilise": batch.codes_utilise,
+        "expire": batch.codes_expire,
     }
 
     context = {
@@ -129,66 +133,183 @@ def batch_detail(request, pk):
         "page_obj": page_obj,
         "stats": stats,
         "status_filter": status_filter,
+        "live_url": settings.QR_LIVE_URL,
         "title": f"Lot: {batch.name}",
     }
     return render(request, "qrgenerator/batch_detail.html", context)
 
 
+@login_required
+@owner_required
+def batch_progress(request, pk):
+    """Avancement de la génération d'un lot (JSON, interrogé par batch_detail)"""
+    job = get_object_or_404(
+        GenerationJob.objects.select_related("batch"),
+        batch_id=pk,
+        batch__created_by=request.user,
+    )
+    return JsonResponse(
+        {
+            "status": job.batch.status,
+            "job_status": job.status,
+            "generated": job.codes_generated,
+            "quantity": job.batch.quantity,
+            "eta_seconds": job.eta_seconds(timezone.now()),
+        }
+    )
+
+
 @login_required
 @owner_required
 def code_detail(request, pk):
     """Détails d'un code spécifique"""
-    code = get_object_or_404(Code, pk=pk, batch__created_by=request.user)
+    code = get_object_or_404(
+        Code.objects.select_related("batch"), pk=pk, batch__created_by=request.user
+    )
+    formats = code.batch.render_profile.formats
 
-    context = {"code": code, "title": f"Code #{code.id}"}
+    context = {
+        "code": code,
+        "qr_available": QRCodeService.has_image(code, formats[0]),
+        "qr_formats": formats,
+        "title": f"Code #{code.id}",
+    }
     return render(request, "qrgenerator/code_detail.html", context)
 
 
-@login_required
-@owner_required
-def code_download_qr(request, pk):
-    """Télécharger l'image QR d'un code"""
-    code = get_object_or_404(Code, pk=pk, batch__created_by=request.user)
-
-    if not code.qr_image:
+def _qr_image_response(request, pk, attachment):
+    """Image QR d'un code, avec ETag fort et cache long (contenu immuable)"""
+    code = get_object_or_404(
+        Code.objects.select_related("batch").only(
+            "id",
+            "secure_index",
+            "qr_image",
+            "pack_offset",
+            "pack_length",
+            "batch__qr_format",
+            "batch__qr_module_size",
+            "batch__qr_border",
+            "batch__qr_error_correction",
+        ),
+        pk=pk,
+        batch__created_by=request.user,
+    )
+    profile = code.batch.render_profile
+    fmt = request.GET.get("format") or profile.formats[0]
+    if fmt not in profile.formats:
+        raise Http404("Format non prévu par le profil du lot")
+    # Avant la requête conditionnelle : un ETag déjà connu ne doit pas faire
+    # passer pour « inchangée » une image qui n'existe pas
+    if not QRCodeService.has_image(code, fmt):
         messages.error(request, "Aucune image QR disponible pour ce code.")
         return redirect("qrgenerator:code_detail", pk=pk)
 
-    response = HttpResponse(code.qr_image.read(), content_type="image/png")
-    response["Content-Disposition"] = (
-        f'attachment; filename="qr_code_{code.secure_index[:16]}.png"'
+    etag = QRCodeService.etag(code.secure_index, fmt, profile)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(
+            QRCodeService.image_for_code(code, fmt), content_type=CONTENT_TYPES[fmt]
+        )
+        if attachment:
+            response["Content-Disposition"] = (
+                f'attachment; filename="qr_code_{code.secure_index[:16]}.{fmt}"'
+            )
+
+    # Image (200) ou sa revalidation (304) : seules réponses mises en cache
+    response["ETag"] = etag
+    patch_cache_control(
+        response, private=True, max_age=settings.QR_IMAGE_MAX_AGE, immutable=True
     )
     return response
 
 
 @login_required
 @owner_required
-def batch_export(request, pk):
-    """Exporter tous les QR codes d'un lot (ZIP)"""
-    import zipfile
-    from io import BytesIO
+def code_qr_image(request, pk):
+    """Image QR d'un code (affichage)"""
+    return _qr_image_response(request, pk, attachment=False)
 
-    batch = get_object_or_404(CodeBatch, pk=pk, created_by=request.user)
 
-    # Créer un fichier ZIP en mémoire
-    zip_buffer = BytesIO()
+@login_required
+@owner_required
+def code_download_qr(request, pk):
+    """Télécharger l'image QR d'un code"""
+    return _qr_image_response(request, pk, attachment=True)
 
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for code in batch.codes.all():
-            if code.qr_image:
-                zip_file.writestr(
-                    f"qr_{code.id}_{code.secure_index[:16]}.png", code.qr_image.read()
-                )
 
-    zip_buffer.seek(0)
+@login_required
+@owner_required
+def batch_export(request, pk):
+    """Exporter tous les QR codes d'un lot (ZIP envoyé au fil de l'eau)"""
+    batch = get_object_or_404(CodeBatch, pk=pk, created_by=request.user)
 
-    response = HttpResponse(zip_buffer.read(), content_type="application/zip")
+    response = StreamingHttpResponse(
+        ExportService.stream_zip(ExportService.batch_entries(batch)),
+        content_type="application/zip",
+    )
     response["Content-Disposition"] = (
         f'attachment; filename="batch_{batch.id}_{batch.name}_qrcodes.zip"'
     )
     return response
 
 
+def _verifier_batch(request, pk):
+    """Lot de l'owner dont l'utilisateur valide les codes"""
+    return get_object_or_404(
+        CodeBatch, pk=pk, created_by_id=RedemptionService.owner_id_for(request.user)
+    )
+
+
+@login_required
+@verifier_allowed
+def batch_bundle(request, pk):
+    """Bundle hors ligne du lot : codes validables, format binaire trié"""
+    batch = _verifier_batch(request, pk)
+    response = HttpResponse(
+        BundleService.build(batch), content_type="application/octet-stream"
+    )
+    response["Content-Disposition"] = f'attachment; filename="batch_{batch.id}.qrob"'
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+@verifier_allowed
+def batch_bundle_delta(request, pk):
+    """Codes validés ou expirés depuis une version du bundle (JSON)"""
+    batch = _verifier_batch(request, pk)
+    try:
+        since = int(request.GET["since"])
+        moment_of(since)  # hors de la plage des dates : 400 plutôt que 500
+    except (KeyError, ValueError, OverflowError, OSError):
+        return JsonResponse(
+            {"success": False, "message": "Paramètre since invalide"}, status=400
+        )
+    return JsonResponse(BundleService.delta(batch, since))
+
+
+def _verification_payload(result):
+    """Réponse JSON de verify_code pour un RedemptionResult"""
+    if result.status == RedemptionService.VALID:
+        return {
+            "success": True,
+            "message": "Code valide et activé",
+            "code_id": result.code_id,
+            "batch_name": result.batch_name,
+            "created_at": result.created_at.isoformat(),
+        }
+    if result.status == RedemptionService.NOT_FOUND:
+        return {"success": False, "message": "Code introuvable ou non autorisé"}
+    return {
+        "success": False,
+        "message": "Code expiré"
+        if result.status == RedemptionService.EXPIRED
+        else "Code déjà utilisé",
+        "code_id": result.code_id,
+        "status": result.status,
+    }
+
+
 @login_required
 @verifier_allowed
 def verify_code(request):
@@ -198,32 +319,22 @@ def verify_code(request):
 
         # Gérer l'upload d'image QR code
         if not secure_index and request.FILES.get("qr_image"):
-            qr_image = request.FILES["qr_image"]
             try:
-                # Décoder le QR code depuis l'image
-                from pyzbar.pyzbar import decode
-                from PIL import Image
-                import io
-
-                # Lire et décoder l'image
-                image = Image.open(io.BytesIO(qr_image.read()))
-                decoded_objects = decode(image)
-
-                if decoded_objects:
-                    secure_index = decoded_objects[0].data.decode("utf-8")
-                else:
-                    return JsonResponse(
-                        {
-                            "success": False,
-                            "message": "Aucun QR code détecté dans l'image",
-                        }
-                    )
-
+                secure_index = QRDecodeService.decode_upload(request.FILES["qr_image"])
+            except DecodeError as e:
+                return JsonResponse({"success": False, "message": str(e)})
             except Exception as e:
                 print(f"Erreur décodage QR: {e}")
                 return JsonResponse(
                     {"success": False, "message": "Erreur lors du décodage du QR code"}
                 )
+            if not secure_index:
+                return JsonResponse(
+                    {
+                        "success": False,
+                        "message": "Aucun QR code détecté dans l'image",
+                    }
+                )
 
         if not secure_index:
             return JsonResponse(
@@ -231,84 +342,118 @@ def verify_code(request):
             )
 
         try:
-            # Utilisation de select_for_update() pour éviter les race conditions
-            with transaction.atomic():
-                code = Code.objects.select_for_update().get(
-                    secure_index=secure_index, batch__created_by=request.user.owner
-                )
-
-                now = timezone.now()
-
-                # Vérifier l'expiration
-                if now > code.expiration_date:
-                    code.status = "expire"
-                    code.save()
-                    return JsonResponse(
-                        {
-                            "success": False,
-                            "message": "Code expiré",
-                            "code_id": code.id,
-                            "status": "expire",
-                        }
-                    )
-
-                # Vérifier si déjà utilisé
-                if code.status == "utilise":
-                    return JsonResponse(
-                        {
-                            "success": False,
-                            "message": "Code déjà utilisé",
-                            "code_id": code.id,
-                            "status": "utilise",
-                        }
-                    )
-
-                # Marquer comme utilisé
-                code.status = "utilise"
-                code.used_at = now
-                code.save()
-
-                return JsonResponse(
-                    {
-                        "success": True,
-                        "message": "Code valide et activé",
-                        "code_id": code.id,
-                        "batch_name": code.batch.name,
-                        "created_at": code.created_at.isoformat(),
-                    }
-                )
-
-        except Code.DoesNotExist:
-            return JsonResponse(
-                {"success": False, "message": "Code introuvable ou non autorisé"}
+            # Un seul UPDATE conditionnel : pas de verrou ni de double validation
+            result = RedemptionService.redeem(
+                secure_index, RedemptionService.owner_id_for(request.user)
             )
         except Exception as e:
             print(f"Erreur lors de la vérification: {e}")
             return JsonResponse(
                 {"success": False, "message": "Erreur interne du serveur"}
             )
+        return JsonResponse(_verification_payload(result))
 
     context = {"title": "Vérifier un code"}
     return render(request, "qrgenerator/verify_code.html", context)
 
 
+@login_required
+@verifier_allowed
+@require_POST
+def verify_group(request):
+    """Vérification de groupe : tous les QR d'une photo ou d'une archive ZIP"""
+    upload = request.FILES.get("qr_image")
+    if upload is None:
+        return JsonResponse(
+            {"success": False, "message": "Image ou archive manquante"}, status=400
+        )
+    try:
+        decoded = QRDecodeService.decode_group_upload(upload)
+    except DecodeError as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
+    except Exception:
+        logger.exception("Décodage de groupe impossible")
+        return JsonResponse(
+            {"success": False, "message": "Erreur lors du décodage du QR code"}
+        )
+
+    sources = []  # (fichier, secure_index) dans l'ordre de décodage
+    errors = []
+    for name, payloads in decoded:
+        if isinstance(payloads, str):
+            errors.append({"source": name, "message": payloads})
+        elif not payloads:
+            errors.append({"source": name, "message": "Aucun QR code détecté"})
+        else:
+            sources.extend((name, payload) for payload in payloads)
+    if len(sources) > settings.QR_SYNC_MAX_SCANS:
+        return JsonResponse(
+            {"success": False, "message": "Trop de billets dans l'envoi"}, status=400
+        )
+
+    # Un seul passage ensembliste pour tout le groupe
+    verdicts = RedemptionService.redeem_many(
+        [payload for _, payload in sources],
+        RedemptionService.owner_id_for(request.user),
+    )
+    results = [
+        {"source": name, **verdict._asdict()}
+        for (name, _), verdict in zip(sources, verdicts)
+    ]
+    return JsonResponse(
+        {
+            "success": bool(results),
+            "valid": sum(r["verdict"] == RedemptionService.VALID for r in results),
+            "results": results,
+            "errors": errors,
+        }
+    )
+
+
+@login_required
+@verifier_allowed
+@require_POST
+def verify_sync(request):
+    """Synchronisation des scans hors ligne d'un terminal (JSON, en lot)"""
+    try:
+        scans = json.loads(request.body)["scans"]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse(
+            {"success": False, "message": "Corps JSON invalide"}, status=400
+        )
+    if not isinstance(scans, list) or len(scans) > settings.QR_SYNC_MAX_SCANS:
+        return JsonResponse(
+            {
+                "success": False,
+                "message": f"Entre 0 et {settings.QR_SYNC_MAX_SCANS} scans par requête",
+            },
+            status=400,
+        )
+
+    verdicts = RedemptionService.redeem_offline(
+        scans, RedemptionService.owner_id_for(request.user)
+    )
+    return JsonResponse(
+        {"success": True, "results": [verdict._asdict() for verdict in verdicts]}
+    )
+
+
 @login_required
 @owner_required
 def dashboard(request):
     """Tableau de bord avec statistiques"""
     user_batches = CodeBatch.objects.filter(created_by=request.user)
 
+    # Compteurs dénormalisés : temps constant quel que soit le nombre de codes.
+    # Les codes échus pas encore balayés ne sont pas actifs.
+    owner_stats = StatsService.for_owner(request.user)
+    pending = dict(StatsService.pending_expirations([request.user.pk]))
     stats = {
-        "total_batches": user_batches.count(),
-        "total_codes": Code.objects.filter(batch__created_by=request.user).count(),
-        "codes_actifs": Code.objects.filter(
-            batch__created_by=request.user,
-            status="non_utilise",
-            expiration_date__gt=timezone.now(),
-        ).count(),
-        "codes_utilises": Code.objects.filter(
-            batch__created_by=request.user, status="utilise"
-        ).count(),
+        "total_batches": owner_stats.batches,
+        "total_codes": owner_stats.codes_total,
+        "codes_actifs": owner_stats.codes_non_utilise
+        - pending.get(request.user.pk, 0),
+        "codes_utilises": owner_stats.codes_utilise,
     }
 
     recent_batches = user_batches.order_by("-created_at")[:5]
@@ -316,6 +461,71 @@ def dashboard(request):
     context = {
         "stats": stats,
         "recent_batches": recent_batches,
+        "live_url": settings.QR_LIVE_URL,
         "title": "Tableau de bord",
     }
     return render(request, "qrgenerator/dashboard.html", context)
+
+
+@login_required
+@owner_required
+def live_feed(request):
+    """Flux SSE des validations et compteurs de l'owner (dashboard, batch_detail).
+
+    Servi seulement sous ASGI : un flux bloquerait un worker WSGI synchrone
+    pour tout le monde. Sous WSGI, 204 dit au navigateur de ne pas se
+    reconnecter.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(
+        LiveFeed.astream(request.user.pk), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def metrics_export(request):
+    """Métriques du processus au format Prometheus.
+
+    Réservé aux superutilisateurs, ou au collecteur qui présente
+    "Authorization: Bearer <QR_METRICS_TOKEN>".
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    expected = settings.QR_METRICS_TOKEN
+    authorized = request.user.is_superuser or (
+        expected
+        and scheme.lower() == "bearer"
+        and hmac.compare_digest(token.strip().encode(), expected.encode())
+    )
+    if not settings.QR_METRICS or not authorized:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@login_required
+@admin_required
+def profile_list(request):
+    """Profils de requêtes enregistrés par ProfilerMiddleware"""
+    context = {
+        "title": "Profils de requêtes",
+        "profiles": ProfileService.entries(),
+        "enabled": settings.QR_PROFILE,
+    }
+    return render(request, "qrgenerator/profile_list.html", context)
+
+
+@login_required
+@admin_required
+def profile_download(request, name):
+    """Télécharger un profil (format pstats : snakeviz, python -m pstats)"""
+    path = ProfileService.path(name)
+    if path is None:
+        raise Http404("Profil introuvable")
+    return FileResponse(
+        open(path, "rb"),
+        as_attachment=True,
+        filename=name,
+        content_type="application/octet-stream",
+    )